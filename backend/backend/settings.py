@@ -61,17 +61,48 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Пишущие транзакции сразу берут блокировку и ждут друг друга,
+            # а не падают с "database is locked" при одновременных заказах
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
-CACHES = {
-    "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": "redis://127.0.0.1:6379/1",
-        "OPTIONS": {
-            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+# Кэш выбирается явно: REDIS_URL задан - Redis (общий для всех процессов),
+# не задан - локальный кэш процесса (разработка, тесты). Сеть при импорте
+# не трогаем; если Redis задан, но недоступен, запросы к кэшу упадут с ошибкой,
+# а не разъедутся молча по локальным кэшам воркеров.
+REDIS_URL = os.environ.get('REDIS_URL', '')
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": REDIS_URL,
+            "OPTIONS": {
+                "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            }
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "haesoul",
         }
     }
-}
+
+# Корзины анонимов: 'cache' - в кэше по токену (cart/storage.py), 'db' - строки Cart по сессии.
+# 'cache' - только с общим кэшем (Redis): локальный кэш у каждого процесса свой
+CART_ANONYMOUS_STORAGE = 'cache' if REDIS_URL else 'db'
+CART_ANONYMOUS_TTL = 60 * 60 * 24 * 14
+# Сколько держится бронь товара после последнего изменения позиции в корзине (cart/reservations.py)
+CART_RESERVATION_TTL = 60 * 15
+# Токены партнеров для выгрузки каталога (заголовок X-Export-Token), через запятую
+STORE_EXPORT_TOKENS = [token for token in os.environ.get('STORE_EXPORT_TOKENS', '').split(',') if token]
+# Сколько хранить ключи Idempotency-Key оформления заказа (orders/idempotency.py)
+ORDER_IDEMPOTENCY_TTL = 60 * 60 * 24
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -102,6 +133,18 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Медиа хранятся по хэшу содержимого (store/storage.py): дубликаты - один файл, URL неизменяемые
+STORAGES = {
+    "default": {
+        "BACKEND": "store.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+# Сколько секунд не удалять блоб без ссылок (команда gc_media_blobs)
+MEDIA_GC_GRACE = 60 * 60 * 24
+
 AUTH_USER_MODEL = 'user.CustomUser'
 
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from cart.reservations import release_expired, reconcile_counters
+
+
+class Command(BaseCommand):
+    help = "Снимает истекшие брони товаров пачками (запускать по крону раз в минуту)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Сколько броней снимать за раз")
+        parser.add_argument(
+            '--reconcile', action='store_true',
+            help="После снятия пересчитать счетчики броней в кэше по БД",
+        )
+
+    def handle(self, *args, **options):
+        released = release_expired(batch_size=options['batch_size'])
+        self.stdout.write(f"Снято броней: {released}")
+
+        if options['reconcile']:
+            reserved = reconcile_counters(batch_size=options['batch_size'])
+            self.stdout.write(f"Счетчики пересчитаны, товаров с бронями: {len(reserved)}")
+
+        self.stdout.write(self.style.SUCCESS("Готово."))
@@ -1,12 +1,27 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
 from django.conf import settings
-from store.models import Product
+from store.models import Product, current_price_expression
 
 class Cart(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
     session_key = models.CharField(max_length=40, null=True, blank=True) # Для анонимов
     created_at = models.DateTimeField(auto_now_add=True)
 
+    def get_totals(self):
+        """Сумма (по current_price) и количество товаров одним агрегатным запросом"""
+        return self.items.aggregate(
+            total_price=Coalesce(
+                Sum(current_price_expression('product__') * F('quantity')),
+                Decimal('0.00'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+            total_items=Coalesce(Sum('quantity'), 0),
+        )
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -22,4 +37,18 @@ class Wishlist(models.Model):
     added_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        unique_together = [['user', 'product']]
\ No newline at end of file
+        unique_together = [['user', 'product']]
+
+class StockReservation(models.Model):
+    """
+    Временная бронь товара под корзину (см. cart/reservations.py).
+    owner - "cart:<id>" для корзины в БД или "anon:<токен>" для анонимной в кэше.
+    quantity - сколько штук держит корзина целиком, а не прирост.
+    """
+    owner = models.CharField(max_length=64)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = [['owner', 'product']]
@@ -0,0 +1,261 @@
+"""
+Временные брони товаров под корзины.
+
+Добавление в корзину держит товар CART_RESERVATION_TTL секунд: строка
+StockReservation в БД (источник истины) и счетчик забронированного по товару
+в кэше (reserved:<product_id>), который меняется атомарным incr/decr.
+Доступный остаток = stock - счетчик, поэтому каталогу не нужны агрегаты
+по броням: на страницу товаров один cache.get_many.
+
+Истекшие брони снимает команда release_expired_reservations (по крону),
+она же пересчитывает счетчики из БД (--reconcile). Если кэш потерял
+счетчики (перезапуск Redis), они пересобираются из БД при первом чтении.
+Списание на оформлении заказа по-прежнему проверяет stock в БД,
+брони защищают от "продажи в корзины", а не заменяют эту проверку.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import StockReservation, Product
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_TTL = getattr(settings, 'CART_RESERVATION_TTL', 60 * 15)
+RESERVED_KEY = 'reserved:{}'
+# Метка "счетчики в кэше собраны": без нее отсутствие ключа не значит ноль
+COUNTERS_READY_KEY = 'reserved:ready'
+
+
+def cart_owner(cart_id):
+    return f"cart:{cart_id}"
+
+
+def anonymous_owner(token):
+    return f"anon:{token}"
+
+
+def _reserved_key(product_id):
+    return RESERVED_KEY.format(product_id)
+
+
+def _incr(product_id, delta):
+    key = _reserved_key(product_id)
+    cache.add(key, 0, timeout=None)
+    if delta >= 0:
+        return cache.incr(key, delta)
+    return cache.decr(key, -delta)
+
+
+def _load_counters():
+    """
+    Записывает в кэш счетчики по броням в БД (один GROUP BY). Истекшие,
+    но еще не снятые кроном брони тоже считаются - так же, как при hold().
+    """
+    reserved = dict(
+        StockReservation.objects
+        .values_list('product_id')
+        .annotate(total=Sum('quantity'))
+        .order_by()
+    )
+    cache.set_many({_reserved_key(pk): total for pk, total in reserved.items()}, timeout=None)
+    cache.set(COUNTERS_READY_KEY, True, timeout=None)
+    return reserved
+
+
+def reconcile_counters(batch_size=1000):
+    """
+    Полная сверка счетчиков с БД: пересчет плюс удаление ключей товаров
+    без броней (мог остаться дрейф после упавших запросов). Проходит
+    по всем товарам, поэтому только из команды, не в запросе.
+    """
+    reserved = _load_counters()
+    # Ключи товаров без броней удаляем пачками, чтобы не держать все id в памяти
+    last_pk = 0
+    while True:
+        ids = list(
+            Product.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        cache.delete_many([_reserved_key(pk) for pk in ids if pk not in reserved])
+        last_pk = ids[-1]
+    return reserved
+
+
+def ensure_counters():
+    if not cache.get(COUNTERS_READY_KEY):
+        logger.info("Счетчики броней в кэше не найдены, пересобираем из БД")
+        _load_counters()
+
+
+def get_reserved(product_ids):
+    """{product_id: забронировано} одним запросом к кэшу"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    try:
+        ensure_counters()
+        values = cache.get_many([_reserved_key(pk) for pk in product_ids])
+    except Exception:
+        logger.warning("Кэш недоступен, брони не учтены в остатках", exc_info=True)
+        return {}
+    return {pk: values.get(_reserved_key(pk), 0) for pk in product_ids}
+
+
+def get_available_stock(products):
+    """{product_id: доступно к добавлению в корзину} для уже загруженных товаров"""
+    reserved = get_reserved(product.pk for product in products)
+    return {product.pk: max(product.stock - reserved.get(product.pk, 0), 0) for product in products}
+
+
+def hold(owner, product, quantity, force=False):
+    """
+    Держит за owner quantity штук product (итоговое количество в корзине)
+    и продлевает бронь. Если свободного остатка не хватает - ValidationError,
+    ничего не меняется. force=True пропускает проверку (перенос корзины при входе).
+    """
+    if quantity <= 0:
+        release(owner, product.pk)
+        return
+    insufficient = hold_many(owner, {product: quantity}, force=force)
+    if insufficient:
+        raise ValidationError(
+            f"Недостаточно товара '{product.name}'. Доступно: {insufficient[0]['available']}"
+        )
+
+
+def hold_many(owner, quantities, force=False):
+    """
+    Пакетный hold(): {product: итоговое количество}, 0 - снять бронь.
+    Все или ничего: если хоть одному товару не хватает свободного остатка,
+    приросты счетчиков откатываются, брони не меняются и возвращается список
+    [{'product_id', 'name', 'requested', 'available'}]. Иначе - пустой список.
+    Проверка без гонок: сначала атомарный incr счетчика, потом сравнение
+    с остатком и откат прироста, если не влезли. Приросты откатываются и
+    при исключении внутри транзакции. Если hold_many вызван во внешней
+    транзакции и откатилась уже она, счетчик остается завышенным до
+    release_expired_reservations --reconcile.
+    """
+    ensure_counters()
+    applied = []
+    try:
+        with transaction.atomic():
+            insufficient = _hold_many(owner, quantities, force, applied)
+    except BaseException:
+        # Транзакция откатилась (ошибка БД, таймаут блокировки) -
+        # счетчики уже увеличены, возвращаем их, как при нехватке остатка
+        _revert(applied)
+        raise
+    if insufficient:
+        _revert(applied)
+    return insufficient
+
+
+def _revert(applied):
+    for product_id, delta in applied:
+        try:
+            _incr(product_id, -delta)
+        except Exception:
+            logger.warning("Кэш недоступен, счетчик брони не откатан (поправит --reconcile)", exc_info=True)
+
+
+def _hold_many(owner, quantities, force, applied):
+    """Тело hold_many внутри транзакции; приросты счетчиков пишет в applied"""
+    existing = {
+        reservation.product_id: reservation
+        for reservation in StockReservation.objects.select_for_update().filter(
+            owner=owner, product_id__in=[product.pk for product in quantities]
+        )
+    }
+    insufficient = []
+    for product, quantity in quantities.items():
+        # Истекшая, но еще не снятая бронь тоже сидит в счетчике
+        old = existing[product.pk].quantity if product.pk in existing else 0
+        delta = quantity - old
+        if not delta:
+            continue
+        reserved = _incr(product.pk, delta)
+        applied.append((product.pk, delta))
+        if delta > 0 and not force and reserved > product.stock:
+            insufficient.append({
+                'product_id': product.pk,
+                'name': product.name,
+                'requested': quantity,
+                'available': max(product.stock - (reserved - quantity), 0),
+            })
+    if insufficient:
+        return insufficient
+
+    expires_at = timezone.now() + timedelta(seconds=RESERVATION_TTL)
+    to_update = []
+    to_create = []
+    to_delete = []
+    for product, quantity in quantities.items():
+        reservation = existing.get(product.pk)
+        if quantity <= 0:
+            if reservation:
+                to_delete.append(reservation.pk)
+        elif reservation:
+            reservation.quantity = quantity
+            reservation.expires_at = expires_at
+            to_update.append(reservation)
+        else:
+            to_create.append(StockReservation(
+                owner=owner, product=product, quantity=quantity, expires_at=expires_at
+            ))
+    StockReservation.objects.filter(pk__in=to_delete).delete()
+    StockReservation.objects.bulk_update(to_update, ['quantity', 'expires_at'])
+    StockReservation.objects.bulk_create(to_create)
+    return []
+
+
+def _release(queryset):
+    """
+    Удаляет выбранные брони и уменьшает счетчики после коммита.
+    Строки блокируются, поэтому параллельные снятия одной брони
+    (крон и удаление из корзины) не уменьшат счетчик дважды.
+    """
+    with transaction.atomic():
+        rows = list(queryset.select_for_update().values_list('pk', 'product_id', 'quantity'))
+        if not rows:
+            return 0
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+        released = {}
+        for _, product_id, quantity in rows:
+            released[product_id] = released.get(product_id, 0) + quantity
+
+        def decrement():
+            for product_id, quantity in released.items():
+                _incr(product_id, -quantity)
+        transaction.on_commit(decrement)
+    return len(rows)
+
+
+def release(owner, product_id):
+    _release(StockReservation.objects.filter(owner=owner, product_id=product_id))
+
+
+def release_owner(owner):
+    """Снимает все брони корзины (оформлена, очищена или перенесена)"""
+    _release(StockReservation.objects.filter(owner=owner))
+
+
+def release_expired(batch_size=1000):
+    """Снимает истекшие брони пачками по batch_size. Возвращает количество"""
+    total = 0
+    now = timezone.now()
+    while True:
+        released = _release(
+            StockReservation.objects.filter(expires_at__lte=now).order_by('expires_at')[:batch_size]
+        )
+        if not released:
+            break
+        total += released
+    return total
@@ -1,15 +1,24 @@
 from rest_framework import serializers
 from django.shortcuts import get_object_or_404
 from .models import Cart, CartItem, Wishlist, Product
+from .services import ACTIONS, ADD
 # Импортируем ProductListSerializer из предыдущего файла (предположим, он там же или рядом)
-from store.serializers import ProductListSerializer 
+from store.serializers import CartProductSerializer, prefetch_available_stock
+
+
+class CartItemListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        # Свободные остатки всех товаров корзины одним запросом к кэшу
+        prefetch_available_stock(self.context, [item.product for item in items])
+        return super().to_representation(items)
 
 class CartItemSerializer(serializers.ModelSerializer):
     """
     Сериализатор позиции в корзине.
     Выводит полную инфу о товаре (read_only) и принимает ID товара для добавления (write_only).
     """
-    product = ProductListSerializer(read_only=True)
+    product = CartProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.filter(is_active=True), 
         source='product', 
@@ -20,18 +29,23 @@ class CartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'product_id', 'quantity', 'subtotal']
+        list_serializer_class = CartItemListSerializer
 
     def get_subtotal(self, obj):
         # Считаем сумму позиции: цена товара * количество
         return obj.product.current_price * obj.quantity
 
     def validate(self, data):
-        """Проверка на наличие достаточного количества товара на складе"""
-        quantity = data.get('quantity', 1)
+        """
+        Быстрая проверка по складу. Брони других корзин учитывает
+        cart.reservations.hold() во вьюхе, уже при записи.
+        """
+        quantity = data.get('quantity', self.instance.quantity if self.instance else 1)
         product = data.get('product') # Получаем из source='product'
-        
-        # Если это обновление (instance существует), нужно учесть разницу, 
-        # но для простоты проверяем просто наличие.
+        if product is None and self.instance is not None:
+            # PATCH только количества
+            product = self.instance.product
+
         if product.stock < quantity:
             raise serializers.ValidationError(
                 f"Недостаточно товара '{product.name}'. Доступно: {product.stock}"
@@ -39,6 +53,27 @@ class CartItemSerializer(serializers.ModelSerializer):
         return data
 
 
+class CartOperationSerializer(serializers.Serializer):
+    """Одна операция пакетного изменения корзины"""
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=0, default=1)
+    action = serializers.ChoiceField(choices=ACTIONS, default=ADD)
+
+
+class CartBulkSerializer(serializers.Serializer):
+    """
+    POST /api/cart/cart-items/bulk/
+    {"operations": [{"product_id": 1, "quantity": 2, "action": "add|set|remove"}, ...]}
+    Операции применяются по порядку, одной транзакцией.
+    """
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+
+
+class WishlistMoveSerializer(serializers.Serializer):
+    """Какие товары перенести из избранного в корзину; без product_ids - все"""
+    product_ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=100)
+
+
 class CartSerializer(serializers.ModelSerializer):
     """
     Сериализатор самой корзины.
@@ -52,19 +87,24 @@ class CartSerializer(serializers.ModelSerializer):
         model = Cart
         fields = ['id', 'items', 'total_price', 'total_items']
 
+    def get_totals(self, obj):
+        # Итоги считаются в БД одним запросом и запоминаются на объекте
+        if not hasattr(obj, '_totals'):
+            obj._totals = obj.get_totals()
+        return obj._totals
+
     def get_total_price(self, obj):
-        # Суммируем (цена * количество) по всем items
-        return sum(item.product.current_price * item.quantity for item in obj.items.all())
+        return self.get_totals(obj)['total_price']
     
     def get_total_items(self, obj):
-        return sum(item.quantity for item in obj.items.all())
+        return self.get_totals(obj)['total_items']
 
 
 class WishlistSerializer(serializers.ModelSerializer):
     """
     Сериализатор избранного.
     """
-    product = ProductListSerializer(read_only=True)
+    product = CartProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(), source='product', write_only=True
     )
@@ -0,0 +1,145 @@
+"""
+Пакетные изменения корзины: много операций {product_id, quantity, action}
+одним запросом (POST /api/cart/cart-items/bulk/) и перенос избранного в корзину.
+
+Товары читаются одним запросом, брони ставятся пакетно (hold_many),
+позиции пишутся bulk-операциями в одной транзакции. Все или ничего:
+если какому-то товару не хватает остатка, корзина не меняется.
+"""
+from django.db import transaction
+
+from .models import CartItem, Product, Wishlist
+from .reservations import hold_many, cart_owner, anonymous_owner
+from .utils import invalidate_product_flags
+
+ADD = 'add'
+SET = 'set'
+REMOVE = 'remove'
+ACTIONS = (ADD, SET, REMOVE)
+
+
+class InsufficientStock(Exception):
+    """Каких-то товаров свободно меньше, чем просят (формат как в orders.services)"""
+
+    def __init__(self, items):
+        super().__init__(items)
+        # [{'product_id', 'name', 'requested', 'available'}]
+        self.items = items
+
+
+class UnknownProducts(Exception):
+    """Товаров нет или они сняты с продажи"""
+
+    def __init__(self, product_ids):
+        super().__init__(product_ids)
+        self.product_ids = product_ids
+
+
+def resolve_quantities(current, operations):
+    """
+    Итоговые количества {product_id: quantity} после операций по порядку.
+    current - что уже лежит в корзине; 0 в результате - удалить позицию.
+    """
+    result = {}
+    for operation in operations:
+        product_id = operation['product_id']
+        quantity = result.get(product_id, current.get(product_id, 0))
+        if operation['action'] == ADD:
+            quantity += operation['quantity']
+        elif operation['action'] == SET:
+            quantity = operation['quantity']
+        else:
+            quantity = 0
+        result[product_id] = quantity
+    return result
+
+
+def load_products(product_ids):
+    """Все товары операций одним запросом"""
+    return Product.objects.filter(pk__in=product_ids).only('pk', 'name', 'stock', 'is_active').in_bulk()
+
+
+def reserve(owner, products, quantities):
+    """Проверяет товары и ставит брони на итоговые количества, иначе исключение"""
+    missing = sorted(
+        product_id for product_id, quantity in quantities.items()
+        if quantity > 0 and (product_id not in products or not products[product_id].is_active)
+    )
+    if missing:
+        raise UnknownProducts(missing)
+
+    insufficient = hold_many(owner, {
+        products[product_id]: quantity
+        for product_id, quantity in quantities.items()
+        if product_id in products
+    })
+    if insufficient:
+        raise InsufficientStock(insufficient)
+
+
+def apply_to_cart(cart, operations):
+    """Применяет операции к корзине в БД, возвращает итоговые количества"""
+    product_ids = {operation['product_id'] for operation in operations}
+    products = load_products(product_ids)
+
+    with transaction.atomic():
+        existing = {
+            item.product_id: item
+            for item in CartItem.objects.select_for_update().filter(cart=cart, product_id__in=product_ids)
+        }
+        quantities = resolve_quantities(
+            {product_id: item.quantity for product_id, item in existing.items()}, operations
+        )
+        reserve(cart_owner(cart.pk), products, quantities)
+
+        to_create = []
+        to_update = []
+        to_delete = []
+        for product_id, quantity in quantities.items():
+            item = existing.get(product_id)
+            if quantity <= 0:
+                if item:
+                    to_delete.append(item.pk)
+            elif item:
+                if item.quantity != quantity:
+                    item.quantity = quantity
+                    to_update.append(item)
+            else:
+                to_create.append(CartItem(cart=cart, product_id=product_id, quantity=quantity))
+
+        CartItem.objects.filter(pk__in=to_delete).delete()
+        CartItem.objects.bulk_update(to_update, ['quantity'])
+        CartItem.objects.bulk_create(to_create)
+    # bulk-операции не шлют сигналы, сбрасываем флаги вручную
+    invalidate_product_flags(cart.user_id)
+    return quantities
+
+
+def apply_to_anonymous_cart(anonymous_cart, operations):
+    """То же для корзины анонима в кэше"""
+    products = load_products({operation['product_id'] for operation in operations})
+    quantities = resolve_quantities(anonymous_cart.items, operations)
+    reserve(anonymous_owner(anonymous_cart.token), products, quantities)
+    anonymous_cart.update(quantities)
+    return quantities
+
+
+def move_wishlist_to_cart(user, cart, product_ids=None):
+    """
+    Кладет товары из избранного в корзину (по одной штуке сверху того,
+    что уже лежит) и убирает их из избранного. product_ids=None - все.
+    Снятые с продажи товары остаются в избранном. Возвращает id перенесенных.
+    """
+    wishlist = Wishlist.objects.filter(user=user, product__is_active=True)
+    if product_ids is not None:
+        wishlist = wishlist.filter(product_id__in=product_ids)
+
+    with transaction.atomic():
+        moved = list(wishlist.values_list('product_id', flat=True))
+        if not moved:
+            return []
+        apply_to_cart(cart, [
+            {'product_id': product_id, 'quantity': 1, 'action': ADD} for product_id in moved
+        ])
+        Wishlist.objects.filter(user=user, product_id__in=moved).delete()
+    return moved
@@ -0,0 +1,195 @@
+"""
+Корзина анонимного пользователя в кэше (Redis, в тестах - locmem).
+Включается CART_ANONYMOUS_STORAGE='cache' и только при общем для всех
+процессов кэше: с локальным кэшем каждого воркера корзина "пропадала" бы
+между запросами. По умолчанию ('db') анонимы работают со строками Cart по сессии.
+
+Аноним получает токен корзины (заголовок X-Cart-Token / cookie cart_token),
+позиции лежат в кэше словарем {product_id: quantity} с TTL. Строки Cart и
+CartItem в БД создаются только когда корзина нужна всерьез - при входе
+пользователя или при первом обращении уже авторизованного клиента
+с этим токеном (в том числе на оформлении заказа).
+"""
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Cart, CartItem, Product
+from .utils import invalidate_product_flags
+from .reservations import hold_many, release_owner, cart_owner, anonymous_owner
+
+CART_TOKEN_HEADER = 'HTTP_X_CART_TOKEN'
+CART_TOKEN_RESPONSE_HEADER = 'X-Cart-Token'
+CART_TOKEN_COOKIE = 'cart_token'
+CART_TTL = getattr(settings, 'CART_ANONYMOUS_TTL', 60 * 60 * 24 * 14)
+# Сколько держится метка "корзину уже переносят" (упавший перенос не блокирует навсегда)
+MERGE_CLAIM_TIMEOUT = 60
+
+
+def anonymous_carts_enabled():
+    return getattr(settings, 'CART_ANONYMOUS_STORAGE', 'db') == 'cache'
+
+
+def get_cart_token(request):
+    token = request.META.get(CART_TOKEN_HEADER) or request.COOKIES.get(CART_TOKEN_COOKIE)
+    if token:
+        try:
+            return uuid.UUID(token).hex
+        except ValueError:
+            return None
+    return None
+
+
+class AnonymousCart:
+    """Позиции корзины анонима в кэше: {product_id: quantity}"""
+
+    def __init__(self, token=None):
+        self.is_new = token is None
+        self.is_saved = False
+        self.token = token or uuid.uuid4().hex
+        self._items = None
+
+    @property
+    def cache_key(self):
+        return f"anon_cart:{self.token}"
+
+    @property
+    def items(self):
+        if self._items is None:
+            self._items = {} if self.is_new else (cache.get(self.cache_key) or {})
+        return self._items
+
+    def save(self):
+        # Каждая запись продлевает жизнь корзины
+        cache.set(self.cache_key, self.items, CART_TTL)
+        self.is_saved = True
+
+    def add(self, product_id, quantity):
+        self.items[product_id] = self.items.get(product_id, 0) + quantity
+        self.save()
+
+    def set_quantity(self, product_id, quantity):
+        self.items[product_id] = quantity
+        self.save()
+
+    def update(self, quantities):
+        """Пакетно: {product_id: quantity}, 0 - удалить позицию"""
+        for product_id, quantity in quantities.items():
+            if quantity > 0:
+                self.items[product_id] = quantity
+            else:
+                self.items.pop(product_id, None)
+        self.save()
+
+    def remove(self, product_id):
+        self.items.pop(product_id, None)
+        self.save()
+
+    def clear(self):
+        self._items = {}
+        cache.delete(self.cache_key)
+
+    def get_cart_items(self):
+        """
+        Несохраненные CartItem для сериализаторов (id позиции = id товара).
+        Все товары одним запросом; снятые с продажи пропускаются.
+        """
+        if not self.items:
+            return []
+        products = Product.objects.filter(pk__in=self.items.keys(), is_active=True).select_related(
+            'category', 'brand', 'main_image'
+        ).in_bulk()
+        return [
+            CartItem(id=product_id, product=products[product_id], quantity=quantity)
+            for product_id, quantity in sorted(self.items.items())
+            if product_id in products
+        ]
+
+    def to_representation(self, context):
+        from .serializers import CartItemSerializer
+
+        items = self.get_cart_items()
+        return {
+            'id': None,
+            'items': CartItemSerializer(items, many=True, context=context).data,
+            'total_price': sum((item.product.current_price * item.quantity for item in items), Decimal('0')),
+            'total_items': sum(item.quantity for item in items),
+        }
+
+    def merge_into(self, cart):
+        """
+        Переносит позиции в корзину в БД (количества складываются, но не
+        больше остатка) и очищает кэш. Перенос одной корзины захватывается
+        атомарным cache.add: два одновременных входа с одним токеном
+        не удвоят количества - второй просто ничего не перенесет.
+        """
+        claim_key = f"{self.cache_key}:merging"
+        if not cache.add(claim_key, 1, MERGE_CLAIM_TIMEOUT):
+            return
+        try:
+            # Перечитываем под захватом: первый вход мог уже все перенести
+            self._items = None
+            self._merge_items(cart)
+        finally:
+            cache.delete(claim_key)
+
+    def _merge_items(self, cart):
+        items = {
+            product_id: quantity for product_id, quantity in self.items.items()
+            if quantity > 0
+        }
+        if not items:
+            self.clear()
+            return
+
+        products = Product.objects.filter(pk__in=items.keys(), is_active=True).only('pk', 'name', 'stock').in_bulk()
+        with transaction.atomic():
+            existing = {
+                item.product_id: item
+                for item in CartItem.objects.select_for_update().filter(cart=cart, product_id__in=products.keys())
+            }
+            to_update = []
+            to_create = []
+            for product_id, product in products.items():
+                item = existing.get(product_id)
+                current = item.quantity if item else 0
+                quantity = min(current + items[product_id], product.stock)
+                if quantity <= current:
+                    continue
+                if item:
+                    item.quantity = quantity
+                    to_update.append(item)
+                else:
+                    to_create.append(CartItem(cart=cart, product_id=product_id, quantity=quantity))
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+            CartItem.objects.bulk_create(to_create)
+
+            # Брони переезжают на корзину в БД. Товар уже лежал у покупателя,
+            # поэтому без проверки броней других корзин - решит оформление заказа.
+            release_owner(anonymous_owner(self.token))
+            hold_many(
+                cart_owner(cart.pk),
+                {products[item.product_id]: item.quantity for item in to_update + to_create},
+                force=True,
+            )
+        # bulk-операции не шлют сигналы, сбрасываем флаги вручную
+        invalidate_product_flags(cart.user_id)
+        self.clear()
+
+
+def merge_anonymous_cart(request, user, cart=None):
+    """Материализует корзину анонима (по токену из запроса) в корзину пользователя"""
+    if not anonymous_carts_enabled():
+        return
+    token = get_cart_token(request)
+    if token is None:
+        return
+    anonymous_cart = AnonymousCart(token)
+    if not anonymous_cart.items:
+        return
+    if cart is None:
+        cart, _ = Cart.objects.get_or_create(user=user)
+    anonymous_cart.merge_into(cart)
@@ -1,3 +1,237 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from store.models import Category, Product, ProductImage
+from .models import Cart, CartItem, StockReservation, Wishlist
+from .storage import AnonymousCart
+from .reservations import cart_owner, get_reserved, hold_many, release_expired
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CART_ANONYMOUS_STORAGE='cache',
+)
+class CartReadTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Электроника', slug='electronics')
+
+    def add_item(self, n, price, discount_price=None, quantity=1):
+        product = Product.objects.create(
+            category=self.category, name=f'Товар {n}', slug=f'product-{n}',
+            price=price, discount_price=discount_price, stock=100,
+        )
+        ProductImage.objects.create(product=product, image=f'products/{n}.jpg')
+        CartItem.objects.create(cart=self.cart, product=product, quantity=quantity)
+
+    def test_totals_respect_discount_price(self):
+        self.add_item(1, price=100, discount_price=80, quantity=2)
+        self.add_item(2, price=50, discount_price=0, quantity=1)
+        self.add_item(3, price=10, quantity=3)
+
+        response = self.client.get('/api/cart/cart/')
+        self.assertEqual(Decimal(response.data['total_price']), Decimal('240.00'))
+        self.assertEqual(response.data['total_items'], 6)
+
+    def test_cart_queries_do_not_grow_with_items(self):
+        self.add_item(1, price=100)
+        self.client.get('/api/cart/cart/')  # прогреваем кэш флагов пользователя
+        # корзина + позиции с товарами + итоги
+        with self.assertNumQueries(3):
+            self.client.get('/api/cart/cart/')
+
+        for n in range(2, 52):
+            self.add_item(n, price=100)
+        self.client.get('/api/cart/cart/')
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/cart/cart/')
+        self.assertEqual(len(response.data['items']), 51)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CART_ANONYMOUS_STORAGE='cache',
+)
+class AnonymousCartTest(TestCase):
+    """Корзина анонима живет в кэше и попадает в БД только при входе"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        category = Category.objects.create(name='Электроника', slug='electronics')
+        self.phone = Product.objects.create(category=category, name='Смартфон', slug='phone', price=100, stock=5)
+        self.case = Product.objects.create(category=category, name='Чехол', slug='case', price=10, stock=5)
+
+    def test_anonymous_cart_lives_in_cache(self):
+        response = self.client.post('/api/cart/cart-items/', {'product_id': self.phone.pk, 'quantity': 2})
+        self.assertEqual(response.status_code, 201)
+        token = response['X-Cart-Token']
+
+        self.client.credentials(HTTP_X_CART_TOKEN=token)
+        self.client.post('/api/cart/cart-items/', {'product_id': self.phone.pk, 'quantity': 1})
+        self.client.post('/api/cart/cart-items/', {'product_id': self.case.pk})
+        response = self.client.patch(f'/api/cart/cart-items/{self.case.pk}/', {'quantity': 4})
+        self.assertEqual(response.data['quantity'], 4)
+        self.assertEqual(self.client.patch(f'/api/cart/cart-items/{self.case.pk}/', {'quantity': 9}).status_code, 400)
+
+        response = self.client.get('/api/cart/cart/')
+        self.assertEqual(response.data['total_items'], 7)
+        self.assertEqual(Decimal(response.data['total_price']), Decimal('340.00'))
+
+        self.client.delete(f'/api/cart/cart-items/{self.case.pk}/')
+        self.assertEqual(self.client.get('/api/cart/cart/').data['total_items'], 3)
+
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_login_materializes_cart(self):
+        user = get_user_model().objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass', is_verified=True
+        )
+        CartItem.objects.create(cart=Cart.objects.create(user=user), product=self.phone, quantity=1)
+
+        token = self.client.post('/api/cart/cart-items/', {'product_id': self.phone.pk, 'quantity': 2})['X-Cart-Token']
+        self.client.post('/api/cart/cart-items/', {'product_id': self.case.pk}, HTTP_X_CART_TOKEN=token)
+
+        response = self.client.post(
+            '/api/auth/login/', {'email': 'buyer@example.com', 'password': 'pass'}, HTTP_X_CART_TOKEN=token
+        )
+        self.assertEqual(response.status_code, 200)
+        quantities = dict(CartItem.objects.filter(cart__user=user).values_list('product__slug', 'quantity'))
+        self.assertEqual(quantities, {'phone': 3, 'case': 1})
+
+        # Повторный вход с тем же токеном ничего не дублирует
+        self.client.post('/api/auth/login/', {'email': 'buyer@example.com', 'password': 'pass'}, HTTP_X_CART_TOKEN=token)
+        self.assertEqual(CartItem.objects.get(cart__user=user, product=self.phone).quantity, 3)
+
+    def test_merge_clamps_to_stock_and_runs_once(self):
+        user = get_user_model().objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.phone, quantity=4)
+        anonymous_cart = AnonymousCart()
+        anonymous_cart.update({self.phone.pk: 3, self.case.pk: 2})
+
+        # Параллельный вход уже переносит эту корзину - второй ничего не делает
+        cache.add(f"{anonymous_cart.cache_key}:merging", 1)
+        AnonymousCart(anonymous_cart.token).merge_into(cart)
+        self.assertEqual(CartItem.objects.filter(cart=cart).count(), 1)
+        cache.delete(f"{anonymous_cart.cache_key}:merging")
+
+        AnonymousCart(anonymous_cart.token).merge_into(cart)
+        quantities = dict(CartItem.objects.filter(cart=cart).values_list('product__slug', 'quantity'))
+        self.assertEqual(quantities, {'phone': 5, 'case': 2})
+        self.assertEqual(AnonymousCart(anonymous_cart.token).items, {})
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CART_ANONYMOUS_STORAGE='cache',
+)
+class StockReservationTest(TestCase):
+    """Товар в чужой корзине недоступен, пока бронь не истечет"""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Электроника', slug='electronics')
+        self.phone = Product.objects.create(category=category, name='Смартфон', slug='phone', price=100, stock=3)
+        self.first = APIClient()
+        self.second = APIClient()
+
+    def add(self, client, quantity):
+        return client.post('/api/cart/cart-items/', {'product_id': self.phone.pk, 'quantity': quantity})
+
+    def test_holds_limit_other_carts(self):
+        token = self.add(self.first, 2)['X-Cart-Token']
+        availability = self.second.get('/api/store/products/availability/', {'ids': str(self.phone.pk)})
+        self.assertEqual(availability.data, {str(self.phone.pk): 1})
+        self.assertIn('no-store', availability['Cache-Control'])
+        self.assertNotIn('available', self.second.get('/api/store/products/phone/').data)
+        self.assertEqual(self.add(self.second, 2).status_code, 400)
+
+        # Удаление позиции снимает бронь (счетчик уменьшается после коммита)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.delete(f'/api/cart/cart-items/{self.phone.pk}/', HTTP_X_CART_TOKEN=token)
+        self.assertEqual(self.add(self.second, 2).status_code, 201)
+        self.assertEqual(self.add(self.first, 2).status_code, 400)
+
+    def test_counters_revert_when_transaction_fails(self):
+        with mock.patch.object(StockReservation.objects, 'bulk_create', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                hold_many(cart_owner(1), {self.phone: 2})
+        self.assertEqual(get_reserved([self.phone.pk]), {self.phone.pk: 0})
+
+    def test_expired_holds_are_released(self):
+        self.add(self.first, 3)
+        self.assertEqual(self.add(self.second, 1).status_code, 400)
+
+        StockReservation.objects.update(expires_at=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(release_expired(batch_size=1), 1)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(self.add(self.second, 1).status_code, 201)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CART_ANONYMOUS_STORAGE='cache',
+)
+class BulkCartTest(TestCase):
+    """Пакетные операции с корзиной: все или ничего"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Электроника', slug='electronics')
+        self.products = [
+            Product.objects.create(category=category, name=f'Товар {n}', slug=f'product-{n}', price=10, stock=5)
+            for n in range(3)
+        ]
+
+    def bulk(self, *operations, client=None):
+        return (client or self.client).post('/api/cart/cart-items/bulk/', {'operations': [
+            {'product_id': product.pk, 'quantity': quantity, 'action': action}
+            for product, quantity, action in operations
+        ]}, format='json')
+
+    def test_operations_apply_in_one_go(self):
+        first, second, third = self.products
+        response = self.bulk((first, 2, 'add'), (second, 1, 'add'), (first, 1, 'add'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_items'], 4)
+
+        response = self.bulk((first, 1, 'set'), (second, 0, 'remove'), (third, 5, 'add'))
+        quantities = {item['product']['id']: item['quantity'] for item in response.data['items']}
+        self.assertEqual(quantities, {first.pk: 1, third.pk: 5})
+
+        # Не хватает одного товара - не меняется ничего
+        response = self.bulk((first, 2, 'add'), (third, 1, 'add'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['insufficient'][0]['product_id'], third.pk)
+        self.assertEqual(CartItem.objects.get(product=first).quantity, 1)
+
+    def test_anonymous_bulk_and_wishlist_move(self):
+        anonymous = APIClient()
+        response = self.bulk((self.products[0], 2, 'add'), client=anonymous)
+        self.assertEqual(response.data['total_items'], 2)
+        self.assertFalse(CartItem.objects.exists())
+
+        Wishlist.objects.create(user=self.user, product=self.products[1])
+        Wishlist.objects.create(user=self.user, product=self.products[2])
+        response = self.client.post('/api/cart/wishlist/move-to-cart/', {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_items'], 2)
+        self.assertFalse(Wishlist.objects.exists())
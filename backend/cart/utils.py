@@ -0,0 +1,35 @@
+from django.core.cache import cache
+
+from .models import CartItem, Wishlist
+
+# Сколько держать в кэше флаги "в корзине / в избранном" пользователя.
+# Кэш сбрасывается сигналами при любом изменении корзины или избранного.
+PRODUCT_FLAGS_TIMEOUT = 60 * 10
+
+
+def product_flags_cache_key(user_id):
+    return f"product_flags_{user_id}"
+
+
+def get_user_product_flags(user):
+    """
+    Множества id товаров в корзине и в избранном пользователя.
+    Два маленьких запроса (или ноль при попадании в кэш) на весь ответ,
+    вместо подзапросов EXISTS на каждую строку каталога.
+    """
+    if not user or not user.is_authenticated:
+        return frozenset(), frozenset()
+
+    key = product_flags_cache_key(user.pk)
+    flags = cache.get(key)
+    if flags is None:
+        cart_ids = frozenset(CartItem.objects.filter(cart__user=user).values_list('product_id', flat=True))
+        wishlist_ids = frozenset(Wishlist.objects.filter(user=user).values_list('product_id', flat=True))
+        flags = (cart_ids, wishlist_ids)
+        cache.set(key, flags, PRODUCT_FLAGS_TIMEOUT)
+    return flags
+
+
+def invalidate_product_flags(user_id):
+    if user_id is not None:
+        cache.delete(product_flags_cache_key(user_id))
@@ -2,15 +2,31 @@ from rest_framework import viewsets, status, mixins
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.decorators import action
 from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from rest_framework.exceptions import NotFound, ValidationError
 from .models import Cart, CartItem, Wishlist, Product
-from .serializers import CartSerializer, CartItemSerializer, WishlistSerializer
+from .serializers import (
+    CartSerializer, CartItemSerializer, WishlistSerializer, CartBulkSerializer, WishlistMoveSerializer,
+)
+from .services import (
+    apply_to_cart, apply_to_anonymous_cart, move_wishlist_to_cart, InsufficientStock, UnknownProducts,
+)
+from .storage import (
+    AnonymousCart, anonymous_carts_enabled, get_cart_token, merge_anonymous_cart,
+    CART_TOKEN_COOKIE, CART_TOKEN_RESPONSE_HEADER, CART_TTL,
+)
+from .reservations import hold, release, cart_owner, anonymous_owner
 
 class CartMixin:
     """Утилита для получения текущей корзины пользователя или анонима"""
     def get_cart(self, request):
         if request.user.is_authenticated:
             cart, created = Cart.objects.get_or_create(user=request.user)
+            # Клиент пришел с токеном анонимной корзины - переносим ее в БД
+            merge_anonymous_cart(request, request.user, cart=cart)
         else:
             # Для анонимов используем session_key
             if not request.session.session_key:
@@ -21,6 +37,52 @@ class CartMixin:
             )
         return cart
 
+    def get_anonymous_cart(self, request):
+        """
+        Корзина анонима в кэше (см. cart/storage.py) или None, если пользователь
+        авторизован или включено хранение анонимных корзин в БД.
+        """
+        if request.user.is_authenticated or not anonymous_carts_enabled():
+            return None
+        if not hasattr(self, '_anonymous_cart'):
+            self._anonymous_cart = AnonymousCart(get_cart_token(request))
+        return self._anonymous_cart
+
+    def get_cart_response(self, request):
+        """Вся корзина целиком (GET /api/cart/cart/ и ответы пакетных операций)"""
+        anonymous_cart = self.get_anonymous_cart(request)
+        if anonymous_cart is not None:
+            return Response(anonymous_cart.to_representation({'request': request}))
+
+        cart = self.get_cart(request)
+        # Все позиции с товарами и главными фото одним запросом,
+        # независимо от количества строк в корзине
+        prefetch_related_objects([cart], Prefetch(
+            'items',
+            queryset=CartItem.objects.select_related(
+                'product__category', 'product__brand', 'product__main_image'
+            ).order_by('id'),
+        ))
+        serializer = CartSerializer(cart, context={'request': request})
+        return Response(serializer.data)
+
+    def insufficient_stock_response(self, error):
+        # Не через ValidationError: он превратил бы числа в строки
+        return Response({
+            "detail": "Недостаточно товара на складе.",
+            "insufficient": error.items,
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        anonymous_cart = getattr(self, '_anonymous_cart', None)
+        if anonymous_cart is not None and (anonymous_cart.is_saved or not anonymous_cart.is_new):
+            # Токен отдаем и заголовком (мобильное приложение), и cookie (браузер)
+            response[CART_TOKEN_RESPONSE_HEADER] = anonymous_cart.token
+            if anonymous_cart.is_saved:
+                response.set_cookie(CART_TOKEN_COOKIE, anonymous_cart.token, max_age=CART_TTL, httponly=True, samesite='Lax')
+        return response
+
 class CartViewSet(CartMixin, viewsets.ViewSet):
     """
     ViewSet для получения всей корзины целиком (GET /api/cart/)
@@ -28,9 +90,7 @@ class CartViewSet(CartMixin, viewsets.ViewSet):
     permission_classes = [AllowAny]
 
     def list(self, request):
-        cart = self.get_cart(request)
-        serializer = CartSerializer(cart, context={'request': request})
-        return Response(serializer.data)
+        return self.get_cart_response(request)
 
 class CartItemViewSet(CartMixin, viewsets.ModelViewSet):
     """
@@ -45,7 +105,9 @@ class CartItemViewSet(CartMixin, viewsets.ModelViewSet):
     def get_queryset(self):
         # Возвращаем только items текущей корзины
         cart = self.get_cart(self.request)
-        return CartItem.objects.filter(cart=cart)
+        return CartItem.objects.filter(cart=cart).select_related(
+            'product__category', 'product__brand', 'product__main_image'
+        )
 
     def perform_create(self, serializer):
         cart = self.get_cart(self.request)
@@ -66,31 +128,141 @@ class CartItemViewSet(CartMixin, viewsets.ModelViewSet):
 
     def create(self, request, *args, **kwargs):
         # Кастомный create для обработки логики "Добавить или Увеличить"
-        cart = self.get_cart(request)
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
         product = serializer.validated_data['product']
         quantity = serializer.validated_data.get('quantity', 1)
 
-        # Пытаемся найти и обновить, или создать
-        item, created = CartItem.objects.get_or_create(
-            cart=cart, 
-            product=product,
-            defaults={'quantity': quantity}
-        )
+        anonymous_cart = self.get_anonymous_cart(request)
+        if anonymous_cart is not None:
+            # Бронь на итоговое количество; не хватает свободного остатка - 400
+            hold(anonymous_owner(anonymous_cart.token), product, anonymous_cart.items.get(product.pk, 0) + quantity)
+            anonymous_cart.add(product.pk, quantity)
+            item = CartItem(id=product.pk, product=product, quantity=anonymous_cart.items[product.pk])
+            read_serializer = CartItemSerializer(item, context={'request': request})
+            return Response(read_serializer.data, status=status.HTTP_201_CREATED)
 
-        if not created:
-            # Если уже было - плюсуем количество
-            item.quantity += quantity
-            item.save()
+        cart = self.get_cart(request)
+
+        with transaction.atomic():
+            # Пытаемся найти и обновить, или создать
+            item, created = CartItem.objects.get_or_create(
+                cart=cart, 
+                product=product,
+                defaults={'quantity': quantity}
+            )
+
+            if not created:
+                # Если уже было - плюсуем количество
+                item.quantity += quantity
+
+            # Бронь на итоговое количество; если не влезли, созданная строка откатится
+            hold(cart_owner(cart.pk), product, item.quantity)
+
+            if not created:
+                item.save()
 
         # Возвращаем актуальное состояние этого айтема
         read_serializer = CartItemSerializer(item, context={'request': request})
         return Response(read_serializer.data, status=status.HTTP_201_CREATED)
 
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        owner = cart_owner(instance.cart_id)
+        product = serializer.validated_data.get('product', instance.product)
+        quantity = serializer.validated_data.get('quantity', instance.quantity)
+        with transaction.atomic():
+            if product.pk != instance.product_id:
+                release(owner, instance.product_id)
+            hold(owner, product, quantity)
+            serializer.save()
+
+    def perform_destroy(self, instance):
+        release(cart_owner(instance.cart_id), instance.product_id)
+        instance.delete()
+
+    @action(detail=False, methods=['post'], serializer_class=CartBulkSerializer)
+    def bulk(self, request):
+        """
+        Много операций одним запросом (повторить заказ, собрать корзину):
+        {"operations": [{"product_id": 1, "quantity": 2, "action": "add"}, ...]}
+        add - прибавить, set - установить количество, remove - удалить.
+        Все или ничего; в ответе корзина целиком.
+        """
+        serializer = CartBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data['operations']
+
+        try:
+            anonymous_cart = self.get_anonymous_cart(request)
+            if anonymous_cart is not None:
+                apply_to_anonymous_cart(anonymous_cart, operations)
+            else:
+                apply_to_cart(self.get_cart(request), operations)
+        except UnknownProducts as e:
+            raise ValidationError({'operations': f"Товары не найдены или сняты с продажи: {e.product_ids}"})
+        except InsufficientStock as e:
+            return self.insufficient_stock_response(e)
+
+        return self.get_cart_response(request)
+
+    # --- Анонимная корзина в кэше: те же URL, позиция адресуется id товара ---
+
+    def get_anonymous_item(self, anonymous_cart):
+        try:
+            product_id = int(self.kwargs['pk'])
+        except ValueError:
+            raise NotFound()
+        items = [item for item in anonymous_cart.get_cart_items() if item.pk == product_id]
+        if not items:
+            raise NotFound()
+        return items[0]
+
+    def list(self, request, *args, **kwargs):
+        anonymous_cart = self.get_anonymous_cart(request)
+        if anonymous_cart is None:
+            return super().list(request, *args, **kwargs)
+        items = anonymous_cart.get_cart_items()
+        page = self.paginate_queryset(items)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(items, many=True).data)
 
-class WishlistViewSet(viewsets.ModelViewSet):
+    def retrieve(self, request, *args, **kwargs):
+        anonymous_cart = self.get_anonymous_cart(request)
+        if anonymous_cart is None:
+            return super().retrieve(request, *args, **kwargs)
+        return Response(self.get_serializer(self.get_anonymous_item(anonymous_cart)).data)
+
+    def update(self, request, *args, **kwargs):
+        anonymous_cart = self.get_anonymous_cart(request)
+        if anonymous_cart is None:
+            return super().update(request, *args, **kwargs)
+
+        item = self.get_anonymous_item(anonymous_cart)
+        try:
+            quantity = int(request.data.get('quantity'))
+        except (TypeError, ValueError):
+            raise ValidationError({'quantity': "Укажите количество."})
+        if quantity < 1:
+            raise ValidationError({'quantity': "Количество должно быть больше нуля."})
+        hold(anonymous_owner(anonymous_cart.token), item.product, quantity)
+        anonymous_cart.set_quantity(item.pk, quantity)
+        item.quantity = quantity
+        return Response(self.get_serializer(item).data)
+
+    def destroy(self, request, *args, **kwargs):
+        anonymous_cart = self.get_anonymous_cart(request)
+        if anonymous_cart is None:
+            return super().destroy(request, *args, **kwargs)
+        item = self.get_anonymous_item(anonymous_cart)
+        release(anonymous_owner(anonymous_cart.token), item.pk)
+        anonymous_cart.remove(item.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class WishlistViewSet(CartMixin, viewsets.ModelViewSet):
     """
     Избранное. Доступно только авторизованным.
     """
@@ -98,7 +270,9 @@ class WishlistViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return Wishlist.objects.filter(user=self.request.user)
+        return Wishlist.objects.filter(user=self.request.user).select_related(
+            'product__category', 'product__brand', 'product__main_image'
+        )
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -125,4 +299,20 @@ class WishlistViewSet(viewsets.ModelViewSet):
         
         # Если создали
         serializer = self.get_serializer(wishlist_item)
-        return Response({**serializer.data, "is_in_wishlist": True}, status=201)
\ No newline at end of file
+        return Response({**serializer.data, "is_in_wishlist": True}, status=201)
+
+    @action(detail=False, methods=['post'], url_path='move-to-cart', serializer_class=WishlistMoveSerializer)
+    def move_to_cart(self, request):
+        """
+        Перенос избранного в корзину одним запросом (POST /api/cart/wishlist/move-to-cart/).
+        {"product_ids": [1, 2]} или пустое тело - все избранное. В ответе корзина.
+        """
+        serializer = WishlistMoveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            move_wishlist_to_cart(
+                request.user, self.get_cart(request), serializer.validated_data.get('product_ids')
+            )
+        except InsufficientStock as e:
+            return self.insufficient_stock_response(e)
+        return self.get_cart_response(request)
@@ -1,7 +1,41 @@
 from django.contrib import admin
 
-from .models import Order, OrderItem
+from .models import Order, OrderItem, DailySales, DailyProductSales, DailyCategorySales, DailyOrderStatus
 
 admin.site.register(Order)
 
-admin.site.register(OrderItem)
\ No newline at end of file
+admin.site.register(OrderItem)
+
+
+class RollupAdmin(admin.ModelAdmin):
+    """Сводные таблицы только для просмотра: их ведет orders/rollups.py"""
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailySales)
+class DailySalesAdmin(RollupAdmin):
+    list_display = ['date', 'units', 'revenue']
+
+
+@admin.register(DailyProductSales)
+class DailyProductSalesAdmin(RollupAdmin):
+    list_display = ['date', 'product', 'units', 'revenue']
+    list_select_related = ['product']
+
+
+@admin.register(DailyCategorySales)
+class DailyCategorySalesAdmin(RollupAdmin):
+    list_display = ['date', 'category', 'units', 'revenue']
+    list_select_related = ['category']
+
+
+@admin.register(DailyOrderStatus)
+class DailyOrderStatusAdmin(RollupAdmin):
+    list_display = ['date', 'status', 'orders']
+    list_filter = ['status']
@@ -0,0 +1,119 @@
+"""
+Идемпотентное оформление заказа по заголовку Idempotency-Key.
+
+Клиент генерирует ключ (uuid) на одну попытку оформления и повторяет
+запрос с тем же ключом, если не дождался ответа. Первый запрос занимает
+ключ, и ответ сохраняется в той же транзакции, что и заказ, поэтому
+повтор после коммита получает сохраненный ответ без повторного оформления.
+Ключи старше ORDER_IDEMPOTENCY_TTL удаляет команда expire_idempotency_keys.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+IDEMPOTENCY_TTL = getattr(settings, 'ORDER_IDEMPOTENCY_TTL', 60 * 60 * 24)
+# Ключ без ответа дольше этого считаем брошенным (процесс упал) и отдаем новому запросу
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+
+class KeyInUse(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Запрос с этим ключом идемпотентности еще выполняется."
+    default_code = 'idempotency_key_in_use'
+
+
+class KeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "Ключ идемпотентности уже использован с другими данными."
+    default_code = 'idempotency_key_reused'
+
+
+def get_idempotency_key(request):
+    key = request.headers.get(IDEMPOTENCY_HEADER, '').strip()
+    if not key:
+        return None
+    if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+        raise ValidationError({IDEMPOTENCY_HEADER: "Слишком длинный ключ."})
+    return key
+
+
+def request_fingerprint(request, data):
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def claim(user, key, fingerprint):
+    """
+    Занимает ключ. Возвращает запись: если в ней уже есть status_code,
+    запрос выполнялся и ответ нужно просто повторить (replay).
+    """
+    now = timezone.now()
+    record, created = IdempotencyKey.objects.get_or_create(
+        user=user, key=key, defaults={'fingerprint': fingerprint}
+    )
+    if created:
+        return record
+
+    if record.created_at < now - timedelta(seconds=IDEMPOTENCY_TTL):
+        # Истек, но крон еще не удалил - ключ свободен
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+        return claim(user, key, fingerprint)
+    if record.fingerprint != fingerprint:
+        raise KeyReused()
+    if record.status_code is not None:
+        return record
+    if record.created_at > now - timedelta(seconds=IDEMPOTENCY_LOCK_TIMEOUT):
+        raise KeyInUse()
+
+    # Перехватываем брошенный ключ; условный UPDATE - только один из параллельных
+    taken = IdempotencyKey.objects.filter(
+        pk=record.pk, status_code__isnull=True, created_at=record.created_at
+    ).update(created_at=now)
+    if not taken:
+        raise KeyInUse()
+    record.created_at = now
+    return record
+
+
+def save_response(record, response, order=None):
+    """Вызывать в транзакции оформления - ответ фиксируется вместе с заказом"""
+    record.status_code = response.status_code
+    record.response = response.data
+    record.order = order
+    record.save(update_fields=['status_code', 'response', 'order'])
+
+
+def replay(record):
+    return Response(record.response, status=record.status_code, headers={REPLAYED_HEADER: 'true'})
+
+
+def release(record):
+    """Запрос не выполнен - освобождаем ключ, повтор пройдет заново"""
+    IdempotencyKey.objects.filter(pk=record.pk, status_code__isnull=True).delete()
+
+
+def expire_keys(batch_size=1000):
+    """Удаляет ключи старше TTL пачками по batch_size. Возвращает количество"""
+    cutoff = timezone.now() - timedelta(seconds=IDEMPOTENCY_TTL)
+    total = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(created_at__lt=cutoff)
+            .order_by('created_at').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        # Ни каскадов, ни сигналов: один DELETE на пачку
+        deleted, _ = IdempotencyKey.objects.filter(pk__in=ids).delete()
+        total += deleted
+    return total
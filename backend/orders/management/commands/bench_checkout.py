@@ -0,0 +1,89 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, OperationalError
+
+from cart.models import Cart, CartItem
+from store.models import Category, Product
+from orders.models import Order
+from orders.services import place_order, InsufficientStock
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный тест оформления заказов: много параллельных checkout "
+        "одного \"горячего\" товара. Печатает пропускную способность и перепродажи "
+        "(должно быть 0). Создает временные данные и удаляет их в конце."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=200, help="Сколько покупателей оформляют заказ")
+        parser.add_argument('--stock', type=int, default=50, help="Начальный остаток горячего товара")
+        parser.add_argument('--quantity', type=int, default=1, help="Сколько штук в каждой корзине")
+        parser.add_argument('--threads', type=int, default=16, help="Размер пула потоков")
+        parser.add_argument('--keep', action='store_true', help="Не удалять созданные данные")
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        quantity = options['quantity']
+
+        category = Category.objects.create(name=f"bench {run_id}", slug=f"bench-{run_id}")
+        product = Product.objects.create(
+            category=category, name=f"Горячий товар {run_id}", slug=f"bench-{run_id}",
+            price=100, stock=options['stock'],
+        )
+        User.objects.bulk_create([
+            User(email=f"bench-{run_id}-{n}@example.com", username=f"bench-{run_id}-{n}")
+            for n in range(options['buyers'])
+        ])
+        users = list(User.objects.filter(email__startswith=f"bench-{run_id}-"))
+        Cart.objects.bulk_create([Cart(user=user) for user in users])
+        carts = list(Cart.objects.filter(user__in=users).select_related('user'))
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=quantity) for cart in carts])
+
+        contact = {
+            'first_name': 'Bench', 'last_name': 'Bench', 'phone': '+70000000000',
+            'delivery_address': 'bench',
+        }
+
+        def checkout(cart):
+            try:
+                place_order(cart.user, cart, contact)
+                return 'ok'
+            except InsufficientStock:
+                return 'insufficient'
+            except OperationalError:
+                return 'error'
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            results = list(pool.map(checkout, carts))
+        elapsed = time.perf_counter() - started
+
+        product.refresh_from_db()
+        succeeded = results.count('ok')
+        sold = Order.objects.filter(user__in=users).count() * quantity
+        oversold = max(0, sold - options['stock'])
+
+        self.stdout.write(f"Покупателей:        {len(carts)} (потоков: {options['threads']})")
+        self.stdout.write(f"Успешных заказов:   {succeeded}")
+        self.stdout.write(f"Отказов (нет в наличии): {results.count('insufficient')}")
+        self.stdout.write(f"Ошибок БД:          {results.count('error')}")
+        self.stdout.write(f"Время:              {elapsed:.2f} c")
+        self.stdout.write(f"Пропускная способность: {len(carts) / elapsed:.1f} checkout/c")
+        self.stdout.write(f"Остаток:            {product.stock} (было {options['stock']}, продано {sold})")
+        style = self.style.SUCCESS if oversold == 0 else self.style.ERROR
+        self.stdout.write(style(f"Перепродано:        {oversold}"))
+
+        if not options['keep']:
+            # Заказы удаляются каскадом вместе с пользователями
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+            product.delete()
+            category.delete()
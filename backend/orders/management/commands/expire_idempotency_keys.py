@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from orders.idempotency import expire_keys
+
+
+class Command(BaseCommand):
+    help = "Удаляет просроченные ключи идемпотентности оформления заказа (запускать по крону)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Сколько ключей удалять за раз")
+
+    def handle(self, *args, **options):
+        deleted = expire_keys(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Удалено ключей: {deleted}"))
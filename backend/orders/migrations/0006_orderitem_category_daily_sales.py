@@ -0,0 +1,57 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_categories_and_totals(apps, schema_editor):
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    Product = apps.get_model('store', 'Product')
+    DailySales = apps.get_model('orders', 'DailySales')
+
+    # Снапшот категории для старых строк - из текущего товара (удаленные остаются NULL)
+    OrderItem.objects.filter(product__isnull=False).update(
+        category_id=Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('category_id')[:1])
+    )
+    totals = (
+        OrderItem.objects.exclude(order__status='canceled').order_by()
+        .annotate(day=TruncDate('order__created_at')).values('day')
+        .annotate(units=Sum('quantity'), revenue=Sum(F('price') * F('quantity')))
+    )
+    DailySales.objects.bulk_create(
+        [DailySales(date=row['day'], units=row['units'], revenue=row['revenue']) for row in totals],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_sales_rollups'),
+        ('store', '0009_related_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'verbose_name': 'Продажи за день',
+                'verbose_name_plural': 'Продажи по дням',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='store.category'),
+        ),
+        migrations.RunPython(fill_categories_and_totals, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.conf import settings
-from store.models import Product
+from django.core.serializers.json import DjangoJSONEncoder
+from store.models import Product, Category
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -33,6 +34,12 @@ class Order(models.Model):
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
         ordering = ['-created_at']
+        indexes = [
+            # История заказов пользователя: keyset по (created_at, id)
+            models.Index(fields=['user', '-created_at', '-id'], name='orders_user_created_idx'),
+            # Измененные заказы для инкрементальных пересчетов (store/related.py)
+            models.Index(fields=['updated_at'], name='orders_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Заказ #{self.id} - {self.user}"
@@ -44,6 +51,9 @@ class OrderItem(models.Model):
     product_name = models.CharField(max_length=255) 
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.PositiveIntegerField(default=1)
+    # Категория на момент покупки - для сводных таблиц: после удаления товара
+    # пересчет и отмена заказа кладут продажи в ту же категорию, что и оформление
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
 
     def get_cost(self):
         return self.price * self.quantity
@@ -52,4 +62,96 @@ class OrderItem(models.Model):
         # Автоматическое заполнение имени, если не передано
         if not self.product_name and self.product:
             self.product_name = self.product.name
-        super().save(*args, **kwargs)
\ No newline at end of file
+        if self.category_id is None and self.product:
+            self.category_id = self.product.category_id
+        super().save(*args, **kwargs)
+
+
+class IdempotencyKey(models.Model):
+    """
+    Ключ из заголовка Idempotency-Key при оформлении заказа (orders/idempotency.py).
+    Пока response пустой - запрос с этим ключом еще выполняется.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # sha256 тела запроса: тот же ключ с другими данными - ошибка клиента
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = [['user', 'key']]
+
+
+# --- Сводные таблицы продаж (orders/rollups.py) ---
+# Ведутся инкрементально при оформлении и смене статуса заказа, отчеты
+# читают только их. День - дата оформления заказа; отмененные заказы в
+# продажи не входят. Пересчет с нуля - команда rebuild_sales_rollups.
+# Счетчики - IntegerField, а не Positive: расхождение (например, после
+# queryset.update(status=...)) не должно ронять оформление заказа.
+# Товар или категорию могут удалить - их продажи остаются в строках с
+# NULL вместо ключа (таких строк за день может быть несколько, отчеты суммируют).
+
+class DailySales(models.Model):
+    """Итого за день, не зависит от товаров и категорий"""
+    date = models.DateField(unique=True)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Продажи за день"
+        verbose_name_plural = "Продажи по дням"
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.date}: {self.units} шт."
+
+
+class DailyProductSales(models.Model):
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, related_name='+')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Продажи товара за день"
+        verbose_name_plural = "Продажи товаров по дням"
+        unique_together = [['date', 'product']]
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.date} #{self.product_id}: {self.units} шт."
+
+
+class DailyCategorySales(models.Model):
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='+')
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Продажи категории за день"
+        verbose_name_plural = "Продажи категорий по дням"
+        unique_together = [['date', 'category']]
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.date} #{self.category_id}: {self.units} шт."
+
+
+class DailyOrderStatus(models.Model):
+    """Сколько заказов, оформленных в этот день, сейчас в каждом статусе"""
+    date = models.DateField()
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Заказы по статусам за день"
+        verbose_name_plural = "Заказы по статусам"
+        unique_together = [['date', 'status']]
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.date} {self.status}: {self.orders}"
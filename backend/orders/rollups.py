@@ -0,0 +1,214 @@
+"""
+Сводные таблицы продаж: штуки и выручка по дням (итого и в разрезе
+товаров и категорий), число заказов по дням в разрезе статусов.
+
+Таблицы ведутся инкрементально: place_order добавляет продажи заказа
+(record_sales) в своей транзакции, сигналы Order двигают счетчики статусов,
+при отмене/возврате из отмены вычитают/добавляют продажи заказа, а при
+удалении заказа (и каскадном - вместе с пользователем) - вычитают все (forget_order).
+Каждое изменение - вставка недостающих строк (ignore_conflicts) и один
+UPDATE с Case/When на таблицу, как списание остатков в services.py.
+
+queryset.update(status=...) и удаление сырым SQL сигналов не шлют, такие
+изменения (и любые расхождения) исправляет rebuild() - команда rebuild_sales_rollups.
+
+Категория строки берется из снапшота OrderItem.category, а продажи
+удаленных товаров/категорий идут в строки с NULL-ключом - и инкрементально,
+и при пересчете, поэтому оба пути дают одинаковые суммы.
+"""
+
+from django.db import transaction
+from django.db.models import Case, When, Value, F, Sum, Count, IntegerField, DecimalField
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Order, OrderItem, DailySales, DailyProductSales, DailyCategorySales, DailyOrderStatus
+
+CANCELED = 'canceled'
+REVENUE_FIELD = DecimalField(max_digits=14, decimal_places=2)
+
+
+def sale_day(order):
+    return timezone.localdate(order.created_at)
+
+
+def _add(target, day, key, **deltas):
+    """target: {день: {ключ: {поле: значение}}}; ключ None - удаленный товар/категория"""
+    row = target.setdefault(day, {}).setdefault(key, {})
+    for field, delta in deltas.items():
+        row[field] = row.get(field, 0) + delta
+
+
+def _output_field(field):
+    return REVENUE_FIELD if field == 'revenue' else IntegerField()
+
+
+def _increment(model, key_field, deltas):
+    """
+    Прибавляет deltas ({день: {ключ: {поле: дельта}}}) к строкам model.
+    key_field=None - таблица с одной строкой на день (DailySales).
+    """
+    for day, rows in deltas.items():
+        if None in rows:
+            _increment_null(model, day, {key_field: None} if key_field else {}, rows[None])
+        rows = {key: values for key, values in rows.items() if key is not None}
+        if not rows:
+            continue
+        model.objects.bulk_create(
+            [model(date=day, **{key_field: key}) for key in rows], ignore_conflicts=True
+        )
+        fields = {field for values in rows.values() for field in values}
+        model.objects.filter(date=day, **{f'{key_field}__in': rows.keys()}).update(**{
+            field: F(field) + Case(
+                *[When(**{key_field: key}, then=Value(values.get(field, 0))) for key, values in rows.items()],
+                default=Value(0),
+                output_field=_output_field(field),
+            )
+            for field in fields
+        })
+
+
+def _increment_null(model, day, lookup, values):
+    """
+    Строка без ключа или итог дня. unique_together NULL-ы не различает,
+    поэтому для NULL-ключа - первая из строк дня или новая.
+    """
+    if not lookup:
+        # У итога дня date уникальна - вставка без гонки, как в _increment
+        model.objects.bulk_create([model(date=day)], ignore_conflicts=True)
+    pk = model.objects.filter(date=day, **lookup).order_by('pk').values_list('pk', flat=True).first()
+    if pk is None:
+        model.objects.create(date=day, **lookup, **values)
+        return
+    model.objects.filter(pk=pk).update(**{
+        field: F(field) + Value(delta, output_field=_output_field(field)) for field, delta in values.items()
+    })
+
+
+def _split_sales(lines, sign=1):
+    """(день, товар, категория, штуки, выручка) -> дельты товаров, категорий и итогов дня"""
+    products, categories, totals = {}, {}, {}
+    for day, product_id, category_id, units, revenue in lines:
+        _add(products, day, product_id, units=sign * units, revenue=sign * revenue)
+        _add(categories, day, category_id, units=sign * units, revenue=sign * revenue)
+        _add(totals, day, None, units=sign * units, revenue=sign * revenue)
+    return products, categories, totals
+
+
+def apply_sales(lines, sign=1):
+    products, categories, totals = _split_sales(lines, sign)
+    _increment(DailyProductSales, 'product_id', products)
+    _increment(DailyCategorySales, 'category_id', categories)
+    _increment(DailySales, None, totals)
+
+
+def record_sales(order, items):
+    """Продажи нового заказа; items - созданные OrderItem (категория - снапшот в строке)"""
+    if order.status == CANCELED:
+        return
+    day = sale_day(order)
+    apply_sales([
+        (day, item.product_id, item.category_id, item.quantity, item.price * item.quantity)
+        for item in items
+    ])
+
+
+def order_lines(order):
+    day = sale_day(order)
+    rows = OrderItem.objects.filter(order=order).values_list('product_id', 'category_id', 'quantity', 'price')
+    return [(day, product_id, category_id, quantity, price * quantity) for product_id, category_id, quantity, price in rows]
+
+
+def record_status(order, old_status=None):
+    """Новый заказ (old_status=None) или смена статуса"""
+    day = sale_day(order)
+    statuses = {}
+    if old_status is not None:
+        _add(statuses, day, old_status, orders=-1)
+    _add(statuses, day, order.status, orders=1)
+    _increment(DailyOrderStatus, 'status', statuses)
+
+    if old_status is not None and (old_status == CANCELED) != (order.status == CANCELED):
+        # Отмена вычитает продажи заказа, возврат из отмены - добавляет обратно
+        apply_sales(order_lines(order), sign=-1 if order.status == CANCELED else 1)
+
+
+def forget_order(order):
+    """Заказ удаляется: вычитает его из счетчика статусов и (если не отменен) его продажи"""
+    day = sale_day(order)
+    statuses = {}
+    _add(statuses, day, order.status, orders=-1)
+    _increment(DailyOrderStatus, 'status', statuses)
+    if order.status != CANCELED:
+        apply_sales(order_lines(order), sign=-1)
+
+
+# --- Пересчет с нуля ---
+
+def _scan_chunk(first_id, last_id, products, categories, totals, statuses):
+    """Агрегаты заказов с id в (first_id, last_id] - GROUP BY в БД, суммы в памяти"""
+    orders = Order.objects.filter(pk__gt=first_id, pk__lte=last_id).order_by()
+    for day, status, count in (
+        orders.annotate(day=TruncDate('created_at')).values_list('day', 'status').annotate(count=Count('pk'))
+    ):
+        _add(statuses, day, status, orders=count)
+
+    lines = (
+        OrderItem.objects.filter(order_id__gt=first_id, order_id__lte=last_id)
+        .exclude(order__status=CANCELED).order_by()
+        .annotate(day=TruncDate('order__created_at'))
+        .values_list('day', 'product_id', 'category_id')
+        .annotate(units=Sum('quantity'), revenue=Sum(F('price') * F('quantity'), output_field=REVENUE_FIELD))
+    )
+    chunk_products, chunk_categories, chunk_totals = _split_sales(lines)
+    for target, chunk in ((products, chunk_products), (categories, chunk_categories), (totals, chunk_totals)):
+        for day, rows in chunk.items():
+            for key, values in rows.items():
+                _add(target, day, key, **values)
+
+
+def _scan(after_id, chunk_size, products, categories, totals, statuses, progress=None):
+    """Проходит заказы с id > after_id пачками, возвращает последний id"""
+    scanned = 0
+    while True:
+        ids = list(Order.objects.filter(pk__gt=after_id).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return after_id
+        _scan_chunk(after_id, ids[-1], products, categories, totals, statuses)
+        after_id = ids[-1]
+        scanned += len(ids)
+        if progress:
+            progress(scanned)
+
+
+def _rows(model, key_field, data):
+    return [
+        model(date=day, **({key_field: key} if key_field else {}), **values)
+        for day, rows in data.items() for key, values in rows.items()
+    ]
+
+
+def rebuild(chunk_size=1000, progress=None):
+    """
+    Пересчитывает все сводные таблицы. Заказы читаются пачками по id вне
+    транзакции; затем в одной короткой транзакции дочитываются заказы,
+    оформленные за время прохода, и таблицы заменяются целиком.
+    Смена статуса уже прочитанного заказа во время прохода потеряется -
+    запускать в тихое время. Возвращает число строк (товары, категории, статусы).
+    """
+    products, categories, totals, statuses = {}, {}, {}, {}
+    last_id = _scan(0, chunk_size, products, categories, totals, statuses, progress)
+
+    with transaction.atomic():
+        _scan(last_id, chunk_size, products, categories, totals, statuses)
+        DailySales.objects.all().delete()
+        DailySales.objects.bulk_create(_rows(DailySales, None, totals), batch_size=chunk_size)
+        tables = [
+            (DailyProductSales, _rows(DailyProductSales, 'product_id', products)),
+            (DailyCategorySales, _rows(DailyCategorySales, 'category_id', categories)),
+            (DailyOrderStatus, _rows(DailyOrderStatus, 'status', statuses)),
+        ]
+        for model, rows in tables:
+            model.objects.all().delete()
+            model.objects.bulk_create(rows, batch_size=chunk_size)
+    return tuple(len(rows) for _, rows in tables)
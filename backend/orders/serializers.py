@@ -1,3 +1,6 @@
+from datetime import timedelta
+
+from django.utils import timezone
 from rest_framework import serializers
 from .models import Order, OrderItem
 # Импортируем Cart (предполагаем, что он в приложении carts или store)
@@ -26,6 +29,21 @@ class OrderReadSerializer(serializers.ModelSerializer):
             'items'
         ]
 
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """
+    Строка истории заказов: без позиций, количества считает БД
+    (аннотации items_count/total_quantity в OrderViewSet.get_queryset).
+    """
+    items_count = serializers.IntegerField(read_only=True)
+    total_quantity = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = [
+            'id', 'status', 'is_paid', 'created_at', 'total_price',
+            'delivery_address', 'items_count', 'total_quantity',
+        ]
+
 class OrderCreateSerializer(serializers.ModelSerializer):
     """
     Сериализатор для СОЗДАНИЯ заказа.
@@ -36,4 +54,18 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         model = Order
         fields = [
             'first_name', 'last_name', 'phone', 'email', 'delivery_address'
-        ]
\ No newline at end of file
+        ]
+
+
+class ReportPeriodSerializer(serializers.Serializer):
+    """Параметры отчетов: период (по умолчанию последние 30 дней) и размер топа"""
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    limit = serializers.IntegerField(required=False, default=20, min_value=1, max_value=200)
+
+    def validate(self, attrs):
+        date_to = attrs.setdefault('date_to', timezone.localdate())
+        date_from = attrs.setdefault('date_from', date_to - timedelta(days=29))
+        if date_from > date_to:
+            raise serializers.ValidationError("date_from позже date_to.")
+        return attrs
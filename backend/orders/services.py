@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.db.models import Case, When, Value, F, IntegerField
+from django.db.models.functions import Now
+
+from cart.reservations import cart_owner, release_owner
+from store.cache import bump_catalog_version
+from store.models import Product
+from .models import Order, OrderItem
+from .rollups import record_sales
+
+
+class InsufficientStock(Exception):
+    """Каких-то товаров на складе меньше, чем в корзине"""
+
+    def __init__(self, items):
+        super().__init__(items)
+        # [{'product_id', 'name', 'requested', 'available'}]
+        self.items = items
+
+
+class EmptyCart(Exception):
+    """В корзине нет позиций"""
+
+
+class _StockConflict(Exception):
+    """Внутренний сигнал откатить транзакцию оформления"""
+
+
+def decrement_stock(quantities):
+    """
+    Списывает остатки одним UPDATE: stock = stock - qty только там, где stock >= qty.
+    Пишутся только stock и updated_at (UPDATE не вызывает auto_now, а по
+    updated_at работает инкрементальная выгрузка). Возвращает True, если списались все позиции;
+    иначе часть строк уже обновлена и транзакцию нужно откатить.
+    Гонки нет: проверка и списание происходят в одном операторе.
+    """
+    if not quantities:
+        return True
+    required = Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    updated = Product.objects.filter(pk__in=quantities.keys(), stock__gte=required).update(
+        stock=F('stock') - required, updated_at=Now()
+    )
+    return updated == len(quantities)
+
+
+def get_insufficient_items(quantities):
+    rows = Product.objects.filter(pk__in=quantities.keys()).values_list('pk', 'name', 'stock')
+    return [
+        {'product_id': pk, 'name': name, 'requested': quantities[pk], 'available': stock}
+        for pk, name, stock in sorted(rows)
+        if stock < quantities[pk]
+    ]
+
+
+def place_order(user, cart, contact):
+    """
+    Оформление заказа из корзины: списание остатков, снапшот цен, очистка корзины.
+    Всё в одной транзакции; при нехватке товара ничего не меняется
+    и выбрасывается InsufficientStock со списком позиций.
+    """
+    quantities = {}
+    try:
+        with transaction.atomic():
+            # Позиции в порядке id товара: блокировки строк берутся в одном порядке
+            items = list(cart.items.select_related('product').order_by('product_id'))
+            if not items:
+                raise EmptyCart
+            quantities = {item.product_id: item.quantity for item in items}
+
+            if not decrement_stock(quantities):
+                raise _StockConflict
+
+            order = Order.objects.create(
+                user=user,
+                first_name=contact['first_name'],
+                last_name=contact['last_name'],
+                phone=contact['phone'],
+                email=contact.get('email', user.email), # Если не указал, берем из профиля
+                delivery_address=contact['delivery_address'],
+                total_price=0,
+                status='new'
+            )
+
+            total_price = 0
+            order_items = []
+            for item in items:
+                product = item.product
+                # Снапшот цены и имени
+                order_item = OrderItem(
+                    order=order,
+                    product=product,
+                    category_id=product.category_id,
+                    product_name=product.name,
+                    price=product.current_price, # Важно: берем текущую цену (со скидкой если есть)
+                    quantity=item.quantity
+                )
+                order_items.append(order_item)
+                total_price += order_item.price * order_item.quantity
+
+            OrderItem.objects.bulk_create(order_items)
+            # Сводные таблицы продаж - в той же транзакции (статус учел сигнал post_save)
+            record_sales(order, order_items)
+
+            order.total_price = total_price
+            order.save(update_fields=['total_price'])
+
+            cart.items.all().delete()
+
+            # Остатки видны в каталоге - сбрасываем кэш ответов после коммита
+            transaction.on_commit(bump_catalog_version)
+            # Товар списан со склада, брони корзины больше не нужны
+            transaction.on_commit(lambda: release_owner(cart_owner(cart.pk)))
+    except _StockConflict:
+        # Транзакция уже откатилась, смотрим актуальные остатки для ответа
+        raise InsufficientStock(get_insufficient_items(quantities))
+
+    return order
@@ -0,0 +1,30 @@
+from django.db.models.signals import post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import rollups
+from .models import Order
+
+
+# --- Сводные таблицы продаж ---
+
+@receiver(post_init, sender=Order)
+def remember_status(sender, instance, **kwargs):
+    # Через __dict__: отложенное (only/defer) поле не должно грузиться запросом
+    instance._rollup_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Order)
+def track_status(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        rollups.record_status(instance)
+    elif instance._rollup_status is not None and instance._rollup_status != instance.status:
+        rollups.record_status(instance, old_status=instance._rollup_status)
+    instance._rollup_status = instance.status
+
+
+@receiver(pre_delete, sender=Order)
+def forget_order(sender, instance, **kwargs):
+    # pre_, а не post_delete: строки заказа (и их товары) еще на месте
+    rollups.forget_order(instance)
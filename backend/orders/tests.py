@@ -1,3 +1,224 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db.models import Sum
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from cart.models import Cart, CartItem
+from store.models import Category, Product
+from store.pagination import KeysetPagination
+from .idempotency import expire_keys
+from .rollups import rebuild
+from .models import Order, OrderItem, IdempotencyKey, DailySales, DailyProductSales, DailyCategorySales, DailyOrderStatus
+
+
+class CheckoutTest(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Электроника', slug='electronics')
+        self.phone = Product.objects.create(category=category, name='Смартфон', slug='phone', price=100, stock=5)
+        self.case = Product.objects.create(category=category, name='Чехол', slug='case', price=10, stock=1)
+        self.cart = Cart.objects.create(user=self.user)
+        self.contact = {
+            'first_name': 'Иван', 'last_name': 'Иванов', 'phone': '+79990000000',
+            'delivery_address': 'Москва',
+        }
+
+    def test_checkout_decrements_stock(self):
+        CartItem.objects.create(cart=self.cart, product=self.phone, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.case, quantity=1)
+
+        response = self.client.post('/api/order/orders/', self.contact)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_price'], '210.00')
+
+        self.phone.refresh_from_db()
+        self.case.refresh_from_db()
+        self.assertEqual((self.phone.stock, self.case.stock), (3, 0))
+        self.assertFalse(self.cart.items.exists())
+
+    def test_insufficient_stock_changes_nothing(self):
+        CartItem.objects.create(cart=self.cart, product=self.phone, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.case, quantity=3)
+
+        response = self.client.post('/api/order/orders/', self.contact)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data['insufficient'],
+            [{'product_id': self.case.pk, 'name': 'Чехол', 'requested': 3, 'available': 1}],
+        )
+
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 5)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(self.cart.items.count(), 2)
+
+    def test_idempotency_key_replays_response(self):
+        CartItem.objects.create(cart=self.cart, product=self.phone, quantity=2)
+
+        first = self.client.post('/api/order/orders/', self.contact, HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(first.status_code, 201)
+        # Повтор после коммита: тот же ответ, заказ и списание не повторяются
+        with self.assertNumQueries(1):
+            second = self.client.post('/api/order/orders/', self.contact, HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.stock, 3)
+
+        other = {**self.contact, 'delivery_address': 'Казань'}
+        self.assertEqual(self.client.post('/api/order/orders/', other, HTTP_IDEMPOTENCY_KEY='retry-1').status_code, 422)
+
+    def test_failed_checkout_frees_key(self):
+        CartItem.objects.create(cart=self.cart, product=self.case, quantity=3)
+        response = self.client.post('/api/order/orders/', self.contact, HTTP_IDEMPOTENCY_KEY='retry-2')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.cart.items.update(quantity=1)
+        response = self.client.post('/api/order/orders/', self.contact, HTTP_IDEMPOTENCY_KEY='retry-2')
+        self.assertEqual(response.status_code, 201)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(expire_keys(), 1)
+
+
+class OrderHistoryTest(TestCase):
+    """История заказов: сводка одним запросом, лента по created_at"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client.force_authenticate(self.user)
+        self.orders = []
+        for number in range(3):
+            order = Order.objects.create(
+                user=self.user, first_name='Иван', last_name='Иванов', phone='+79990000000',
+                delivery_address='Москва', total_price=30,
+            )
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_name='Смартфон', price=10, quantity=2),
+                OrderItem(order=order, product_name='Чехол', price=10, quantity=1),
+            ])
+            self.orders.append(order)
+
+    def test_list_is_summary_with_keyset_pages(self):
+        with mock.patch.object(KeysetPagination, 'page_size', 2):
+            with self.assertNumQueries(1):
+                first = self.client.get('/api/order/orders/')
+            self.assertEqual([row['id'] for row in first.data['results']], [self.orders[2].pk, self.orders[1].pk])
+            self.assertEqual(first.data['results'][0]['items_count'], 2)
+            self.assertEqual(first.data['results'][0]['total_quantity'], 3)
+            self.assertNotIn('items', first.data['results'][0])
+
+            second = self.client.get(first.data['next'])
+        self.assertEqual([row['id'] for row in second.data['results']], [self.orders[0].pk])
+        self.assertIsNone(second.data['next'])
+
+    def test_detail_prefetches_items(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/order/orders/{self.orders[0].pk}/')
+        self.assertEqual(len(response.data['items']), 2)
+
+
+class SalesRollupTest(TestCase):
+    """Сводные таблицы ведутся при оформлении и смене статуса, отчеты читают только их"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        category = Category.objects.create(name='Электроника', slug='electronics')
+        self.phone = Product.objects.create(category=category, name='Смартфон', slug='phone', price=100, stock=5)
+        self.case = Product.objects.create(category=category, name='Чехол', slug='case', price=10, stock=5)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.phone, quantity=2)
+        CartItem.objects.create(cart=cart, product=self.case, quantity=1)
+        self.client.force_authenticate(self.user)
+        self.client.post('/api/order/orders/', {
+            'first_name': 'Иван', 'last_name': 'Иванов', 'phone': '+79990000000', 'delivery_address': 'Москва',
+        })
+        self.order = Order.objects.get()
+
+    def snapshot(self):
+        """Суммы по (день, ключ) без нулевых: NULL-строк за день может быть несколько"""
+        def sums(model, key):
+            rows = model.objects.order_by().values_list('date', key).annotate(units=Sum('units'), revenue=Sum('revenue'))
+            return sorted((row for row in rows if row[2]), key=str)
+        return (
+            sums(DailyProductSales, 'product_id'),
+            sums(DailyCategorySales, 'category_id'),
+            sorted(DailySales.objects.exclude(units=0).values_list('date', 'units', 'revenue')),
+            sorted(DailyOrderStatus.objects.exclude(orders=0).values_list('date', 'status', 'orders')),
+        )
+
+    def test_rollups_follow_orders(self):
+        category_sales = DailyCategorySales.objects.get()
+        self.assertEqual((category_sales.units, category_sales.revenue), (3, 210))
+        self.assertEqual(DailyProductSales.objects.get(product=self.phone).revenue, 200)
+        self.assertEqual(rebuild()[0], 2)
+
+        self.order.status = 'canceled'
+        self.order.save()
+        self.assertEqual(DailyCategorySales.objects.get().units, 0)
+        self.assertEqual(
+            list(DailyOrderStatus.objects.exclude(orders=0).values_list('status', 'orders')), [('canceled', 1)]
+        )
+
+        # Пересчет с нуля дает то же, что и инкрементальные обновления
+        snapshot = self.snapshot()
+        self.assertEqual(snapshot[:3], ([], [], []))
+        rebuild(chunk_size=1)
+        self.assertEqual(self.snapshot(), snapshot)
+
+    def test_deleted_product_stays_in_rollups(self):
+        self.phone.delete()
+        snapshot = self.snapshot()
+        # Продажи удаленного товара - в NULL-строке, категория и итог дня не меняются
+        self.assertIn((None, 2, 200), [row[1:] for row in snapshot[0]])
+        self.assertEqual([row[2:] for row in snapshot[1]], [(3, 210)])
+        rebuild()
+        self.assertEqual(self.snapshot(), snapshot)
+
+        # Отмена вычитает из тех же строк, что дал бы пересчет
+        self.order.status = 'canceled'
+        self.order.save()
+        snapshot = self.snapshot()
+        self.assertEqual(snapshot[:3], ([], [], []))
+        rebuild()
+        self.assertEqual(self.snapshot(), snapshot)
+
+    def test_deleted_orders_leave_rollups(self):
+        canceled = Order.objects.create(
+            user=self.user, first_name='Иван', last_name='Иванов', phone='+79990000000',
+            delivery_address='Москва', status='canceled',
+        )
+        canceled.delete()
+        self.assertEqual(self.snapshot()[3], [(timezone.localdate(self.order.created_at), 'new', 1)])
+
+        # Каскадом вместе с пользователем, как в очистке bench_checkout, и до удаления товаров
+        self.user.delete()
+        self.phone.delete()
+        self.assertEqual(self.snapshot(), ([], [], [], []))
+        rebuild()
+        self.assertEqual(self.snapshot(), ([], [], [], []))
+
+    def test_reports_read_rollups(self):
+        self.assertEqual(self.client.get('/api/order/reports/daily/').status_code, 403)
 
-# Create your tests here.
+        self.user.is_staff = True
+        self.user.save()
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/order/reports/products/')
+        self.assertEqual([row['slug'] for row in response.data], ['phone', 'case'])
+        response = self.client.get('/api/order/reports/daily/')
+        self.assertEqual([(row['units'], row['revenue']) for row in response.data], [(3, 210)])
+        response = self.client.get('/api/order/reports/statuses/')
+        self.assertEqual((response.data['new'], response.data['canceled']), (1, 0))
@@ -1,10 +1,11 @@
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import OrderViewSet
+from .views import OrderViewSet, SalesReportViewSet
 app_name = 'orders'
 router = DefaultRouter()
 router.register(r'orders', OrderViewSet, basename='orders')
+router.register(r'reports', SalesReportViewSet, basename='reports')
 
 urlpatterns = [
     path('', include(router.urls)),
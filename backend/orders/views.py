@@ -1,97 +1,164 @@
 from rest_framework import viewsets, status, exceptions
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from django.db import transaction
-from .models import Order, OrderItem
-from .serializers import OrderReadSerializer, OrderCreateSerializer
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from .models import Order, DailySales, DailyProductSales, DailyCategorySales, DailyOrderStatus
+from .serializers import OrderReadSerializer, OrderSummarySerializer, OrderCreateSerializer, ReportPeriodSerializer
+from .services import place_order, EmptyCart, InsufficientStock
+from . import idempotency
 
 # Импорты моделей из прошлых шагов (подставьте свои пути)
 from store.models import Product 
+from store.pagination import KeysetPagination
 
 from cart.models import Cart
+from cart.storage import merge_anonymous_cart
 class OrderViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     http_method_names = ['get', 'post', 'head', 'options'] # Запрещаем PUT/PATCH для заказов юзером
+    # История - лентой по (created_at, id) от новых к старым, без OFFSET и COUNT(*)
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         # Пользователь видит только свои заказы
-        return Order.objects.filter(user=self.request.user)
+        queryset = Order.objects.filter(user=self.request.user)
+        if self.action == 'list':
+            # Сводка одним запросом: число позиций и штук считает GROUP BY
+            return queryset.annotate(
+                items_count=Count('items'),
+                total_quantity=Coalesce(Sum('items__quantity'), 0),
+            )
+        # Детальная карточка: все позиции вторым запросом
+        return queryset.prefetch_related('items')
 
     def get_serializer_class(self):
         if self.action == 'create':
             return OrderCreateSerializer
+        if self.action == 'list':
+            return OrderSummarySerializer
         return OrderReadSerializer
 
     def create(self, request, *args, **kwargs):
         """
         Процесс оформления заказа (Checkout).
         Переносит товары из корзины в заказ.
+        С заголовком Idempotency-Key повтор того же запроса получает
+        сохраненный ответ, второй заказ не создается (orders/idempotency.py).
         """
+        key = idempotency.get_idempotency_key(request)
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
+        if key is None:
+            return self.perform_checkout(request, serializer)
+
+        record = idempotency.claim(
+            request.user, key, idempotency.request_fingerprint(request, serializer.validated_data)
+        )
+        if record.status_code is not None:
+            return idempotency.replay(record)
+
+        try:
+            response = self.perform_checkout(request, serializer, record)
+        except Exception:
+            idempotency.release(record)
+            raise
+        if not status.is_success(response.status_code):
+            # Ошибки (нехватка товара) не запоминаем: клиент поправит корзину и повторит
+            idempotency.release(record)
+        return response
+
+    def perform_checkout(self, request, serializer, idempotency_record=None):
+        # Корзина, собранная анонимно (X-Cart-Token), переезжает в БД
+        merge_anonymous_cart(request, request.user)
+
         # 1. Получаем корзину пользователя
         try:
             cart = Cart.objects.get(user=request.user)
         except Cart.DoesNotExist:
             raise exceptions.ValidationError("Корзина пуста или не найдена.")
 
-        if not cart.items.exists():
+        # Списание остатков, перенос позиций и очистка корзины - одной транзакцией,
+        # туда же сохраняется ответ для ключа идемпотентности
+        try:
+            with transaction.atomic():
+                order = place_order(request.user, cart, serializer.validated_data)
+                # Возвращаем созданный заказ
+                read_serializer = OrderReadSerializer(order)
+                response = Response(read_serializer.data, status=status.HTTP_201_CREATED)
+                if idempotency_record is not None:
+                    idempotency.save_response(idempotency_record, response, order)
+        except EmptyCart:
             raise exceptions.ValidationError("Корзина пуста.")
+        except InsufficientStock as e:
+            # Не через ValidationError: он превратил бы числа в строки
+            return Response({
+                "detail": "Недостаточно товара на складе.",
+                "insufficient": e.items,
+            }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Начинаем транзакцию: всё или ничего
-        with transaction.atomic():
-            # 2. Создаем "шапку" заказа
-            order = Order.objects.create(
-                user=request.user,
-                first_name=serializer.validated_data['first_name'],
-                last_name=serializer.validated_data['last_name'],
-                phone=serializer.validated_data['phone'],
-                email=serializer.validated_data.get('email', request.user.email), # Если не указал, берем из профиля
-                delivery_address=serializer.validated_data['delivery_address'],
-                total_price=0, # Посчитаем ниже
-                status='new'
-            )
+        return response
+
+
+class SalesReportViewSet(viewsets.ViewSet):
+    """
+    Отчеты по продажам для админов. Читают только сводные таблицы
+    (orders/rollups.py): объем работы зависит от числа дней, а не строк заказов.
+    Параметры: ?date_from=&date_to= (YYYY-MM-DD), для топов ?limit=.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get_period(self, request):
+        serializer = ReportPeriodSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        return {'date__gte': params['date_from'], 'date__lte': params['date_to']}, params['limit']
+
+    @action(detail=False)
+    def daily(self, request):
+        """Штуки и выручка по дням"""
+        period, _ = self.get_period(request)
+        rows = DailySales.objects.filter(**period).values('date', 'units', 'revenue').order_by('date')
+        return Response(list(rows))
+
+    @action(detail=False)
+    def products(self, request):
+        """Топ товаров по выручке за период"""
+        period, limit = self.get_period(request)
+        rows = (
+            DailyProductSales.objects.filter(product__isnull=False, **period)
+            .values('product_id', 'product__name', 'product__slug')
+            .annotate(units=Sum('units'), revenue=Sum('revenue')).order_by('-revenue')[:limit]
+        )
+        return Response([
+            {'product_id': row['product_id'], 'name': row['product__name'], 'slug': row['product__slug'],
+             'units': row['units'], 'revenue': row['revenue']}
+            for row in rows
+        ])
+
+    @action(detail=False)
+    def categories(self, request):
+        """Продажи по категориям за период"""
+        period, limit = self.get_period(request)
+        rows = (
+            DailyCategorySales.objects.filter(category__isnull=False, **period)
+            .values('category_id', 'category__name', 'category__slug')
+            .annotate(units=Sum('units'), revenue=Sum('revenue')).order_by('-revenue')[:limit]
+        )
+        return Response([
+            {'category_id': row['category_id'], 'name': row['category__name'], 'slug': row['category__slug'],
+             'units': row['units'], 'revenue': row['revenue']}
+            for row in rows
+        ])
 
-            total_price = 0
-            order_items = []
-
-            # 3. Перебираем товары в корзине и переносим в OrderItem
-            for item in cart.items.select_related('product').all():
-                product = item.product
-                
-                # Проверка наличия (на всякий случай, если кто-то купил за секунду до этого)
-                if product.stock < item.quantity:
-                    raise exceptions.ValidationError(f"Товара {product.name} недостаточно на складе.")
-
-                # Снапшот цены и имени
-                order_item = OrderItem(
-                    order=order,
-                    product=product,
-                    product_name=product.name,
-                    price=product.current_price, # Важно: берем текущую цену (со скидкой если есть)
-                    quantity=item.quantity
-                )
-                order_items.append(order_item)
-                
-                total_price += order_item.price * order_item.quantity
-                
-                # Списываем со склада (опционально, зависит от бизнес-логики:
-                # иногда списывают только после оплаты)
-                product.stock -= item.quantity
-                product.save()
-
-            # Массовое создание записей (быстрее, чем в цикле)
-            OrderItem.objects.bulk_create(order_items)
-
-            # 4. Обновляем итоговую цену заказа
-            order.total_price = total_price
-            order.save()
-
-            # 5. Очищаем корзину
-            cart.items.all().delete()
-            # cart.delete() # Если нужно удалять саму корзину, но обычно очищают items
-
-        # Возвращаем созданный заказ
-        read_serializer = OrderReadSerializer(order)
-        return Response(read_serializer.data, status=status.HTTP_201_CREATED)
\ No newline at end of file
+    @action(detail=False)
+    def statuses(self, request):
+        """Сколько заказов, оформленных за период, сейчас в каждом статусе"""
+        period, _ = self.get_period(request)
+        rows = DailyOrderStatus.objects.filter(**period).values('status').annotate(orders=Sum('orders')).order_by()
+        counts = {status: 0 for status, _ in Order.STATUS_CHOICES}
+        counts.update({row['status']: row['orders'] for row in rows})
+        return Response(counts)
@@ -0,0 +1,193 @@
+"""
+Кэш ответов каталога для анонимных пользователей.
+
+Ключ строится из версии каталога и нормализованных параметров запроса.
+Любое изменение товаров, картинок, категорий или брендов увеличивает
+версию (store/signals.py), и все старые ключи просто перестают читаться -
+ничего не нужно искать и удалять, они сами истекут по таймауту.
+"""
+import hashlib
+import logging
+import time
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = 'catalog_version'
+CATALOG_LAST_MODIFIED_KEY = 'catalog_last_modified'
+CATALOG_CACHE_TIMEOUT = 60 * 15
+# Версия названий товаров, брендов и категорий (индекс подсказок, store/suggest.py).
+# Отдельно от версии каталога: остатки и цены меняются на каждом заказе
+SUGGEST_VERSION_KEY = 'suggest_version'
+
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Стартуем с текущего времени, чтобы после вытеснения ключа
+        # не вернуться к старой версии и не прочитать устаревшие ответы
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Ключа нет (первый запуск или вытеснен) - заводим новую версию
+        version = int(time.time() * 1000)
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def get_catalog_version():
+    try:
+        return _get_version(CATALOG_VERSION_KEY)
+    except Exception:
+        logger.warning("Кэш недоступен, версия каталога не получена", exc_info=True)
+        return None
+
+
+def bump_catalog_version():
+    """Инвалидирует все закэшированные ответы каталога за O(1)"""
+    try:
+        _bump_version(CATALOG_VERSION_KEY)
+        cache.set(CATALOG_LAST_MODIFIED_KEY, int(time.time()), timeout=None)
+    except Exception:
+        logger.warning("Кэш недоступен, версия каталога не увеличена", exc_info=True)
+
+
+def get_suggest_version():
+    try:
+        return _get_version(SUGGEST_VERSION_KEY)
+    except Exception:
+        logger.warning("Кэш недоступен, версия подсказок не получена", exc_info=True)
+        return None
+
+
+def bump_suggest_version():
+    """Новая версия подсказок или None, если кэш недоступен"""
+    try:
+        return _bump_version(SUGGEST_VERSION_KEY)
+    except Exception:
+        logger.warning("Кэш недоступен, версия подсказок не увеличена", exc_info=True)
+        return None
+
+
+def get_catalog_last_modified():
+    """Время последнего изменения каталога (unix timestamp) или None"""
+    try:
+        last_modified = cache.get(CATALOG_LAST_MODIFIED_KEY)
+        if last_modified is None:
+            # Неизвестно, когда меняли - считаем, что только что
+            cache.add(CATALOG_LAST_MODIFIED_KEY, int(time.time()), timeout=None)
+            last_modified = cache.get(CATALOG_LAST_MODIFIED_KEY)
+        return last_modified
+    except Exception:
+        logger.warning("Кэш недоступен, время изменения каталога не получено", exc_info=True)
+        return None
+
+
+def normalize_query_params(query_params):
+    """Параметры в каноническом виде: порядок ключей и повторов не важен"""
+    items = []
+    for key in sorted(query_params):
+        for value in sorted(query_params.getlist(key)):
+            items.append((key, value))
+    return urlencode(items)
+
+
+class CatalogCacheMixin:
+    """
+    Кэширует GET-ответы вьюсета для анонимов.
+    Авторизованным отдаем всегда свежее: у них персональные флаги и
+    (для staff) неактивные товары.
+    """
+    catalog_cache_timeout = CATALOG_CACHE_TIMEOUT
+    catalog_cached_actions = ('list', 'retrieve')
+
+    def is_catalog_cacheable(self, request):
+        return (
+            request.method == 'GET'
+            and self.action in self.catalog_cached_actions
+            and not request.user.is_authenticated
+        )
+
+    def get_catalog_cache_key(self, request, version):
+        # Хост тоже в ключе: в ответах абсолютные ссылки на картинки
+        raw = '|'.join([
+            request.get_host(),
+            self.basename,
+            self.action,
+            urlencode(sorted((key, str(value)) for key, value in self.kwargs.items())),
+            normalize_query_params(request.query_params),
+        ])
+        digest = hashlib.md5(raw.encode()).hexdigest()
+        return f"catalog:{version}:{digest}"
+
+    def cached_response(self, request, build_response):
+        if not self.is_catalog_cacheable(request):
+            return build_response()
+
+        version = get_catalog_version()
+        if version is None:
+            return build_response()
+
+        key = self.get_catalog_cache_key(request, version)
+        try:
+            data = cache.get(key)
+        except Exception:
+            logger.warning("Кэш недоступен, ответ каталога не прочитан", exc_info=True)
+            return build_response()
+        if data is not None:
+            return Response(data)
+
+        response = build_response()
+        if response.status_code == 200:
+            try:
+                cache.set(key, response.data, self.catalog_cache_timeout)
+            except Exception:
+                logger.warning("Кэш недоступен, ответ каталога не сохранен", exc_info=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CatalogCacheMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CatalogCacheMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified для GET-ответов.
+    Валидаторы считаются заранее и дешево (без сериализации), и если клиент
+    прислал совпадающие If-None-Match / If-Modified-Since, сразу отдаем 304.
+    """
+
+    def conditional_response(self, request, etag_parts, last_modified, build_response):
+        etag = quote_etag(hashlib.md5('|'.join(str(part) for part in etag_parts).encode()).hexdigest())
+        response = get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = build_response()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            # Клиент может хранить ответ, но обязан его перепроверять
+            if request.user.is_authenticated:
+                patch_cache_control(response, no_cache=True, private=True)
+            else:
+                patch_cache_control(response, no_cache=True)
+        return response
@@ -0,0 +1,137 @@
+"""
+Потоковая выгрузка каталога для партнеров (JSONL / CSV, по желанию gzip).
+
+Товары читаются keyset-пачками по (updated_at, id) через .values(), без
+моделей и сериализаторов, строки формируются генератором - память не
+зависит от размера каталога. Тот же генератор используют эндпоинт
+(StreamingHttpResponse) и команда export_products.
+
+Полная выгрузка - только активные товары. Инкрементальная (since) -
+товары, измененные после since; снятые с продажи идут "надгробиями"
+{id, is_active: false, updated_at} без остальных полей: партнер убирает
+их у себя, а данные неопубликованных товаров наружу не уходят.
+Формат строк совместим с командой import_products.
+"""
+import csv
+import json
+import zlib
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from .models import Product
+
+EXPORT_FIELDS = [
+    'id', 'slug', 'name', 'category', 'brand', 'description',
+    'price', 'discount_price', 'stock', 'is_active', 'specifications',
+    'main_image', 'updated_at',
+]
+_VALUES = {
+    'category': 'category__slug',
+    'brand': 'brand__slug',
+    'main_image': 'main_image__image',
+}
+# Все, что партнер узнает о снятом с продажи товаре
+TOMBSTONE_FIELDS = ('id', 'is_active', 'updated_at')
+# Строки копятся до такого размера, прежде чем уйти в ответ/файл
+FLUSH_SIZE = 64 * 1024
+
+
+def iter_products(since=None, chunk_size=1000):
+    """
+    Словари товаров в порядке (updated_at, id). Каждая пачка - отдельный
+    запрос с условием "после последней строки", так что долгих курсоров
+    и OFFSET нет, а товар, измененный во время выгрузки, просто уедет в конец.
+    """
+    columns = [_VALUES.get(field, field) for field in EXPORT_FIELDS]
+    queryset = Product.objects.order_by('updated_at', 'pk')
+    if since is None:
+        queryset = queryset.filter(is_active=True)
+    else:
+        queryset = queryset.filter(updated_at__gt=since)
+
+    last = None
+    while True:
+        chunk = queryset
+        if last is not None:
+            chunk = chunk.filter(
+                Q(updated_at__gt=last[0]) | Q(updated_at=last[0], pk__gt=last[1])
+            )
+        rows = list(chunk.values_list(*columns)[:chunk_size])
+        if not rows:
+            return
+        for row in rows:
+            row = dict(zip(EXPORT_FIELDS, row))
+            if not row['is_active']:
+                row = {field: row[field] for field in TOMBSTONE_FIELDS}
+            yield row
+        last = (rows[-1][EXPORT_FIELDS.index('updated_at')], rows[-1][0])
+
+
+def _with_image_url(rows, build_url):
+    for row in rows:
+        if row.get('main_image'):
+            url = default_storage.url(row['main_image'])
+            row['main_image'] = build_url(url) if build_url else url
+        yield row
+
+
+def jsonl_lines(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+class _Echo:
+    """Псевдофайл для csv.writer: write() просто возвращает строку"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        if 'specifications' in row:
+            row['specifications'] = json.dumps(row['specifications'] or {}, ensure_ascii=False)
+        row['updated_at'] = row['updated_at'].isoformat()
+        # У надгробий остальные колонки пустые
+        yield writer.writerow([
+            '' if row.get(field) is None else row[field] for field in EXPORT_FIELDS
+        ])
+
+
+def buffered(lines, size=FLUSH_SIZE):
+    """Склеивает строки в куски ~size байт (меньше мелких записей в сокет)"""
+    buffer = []
+    length = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzipped(chunks):
+    """gzip на лету: сжатые куски отдаются по мере готовности"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(feed_format, since=None, gzip=False, chunk_size=1000, build_url=None):
+    """Байтовые куски выгрузки. build_url - как делать абсолютные ссылки на картинки"""
+    rows = _with_image_url(iter_products(since=since, chunk_size=chunk_size), build_url)
+    lines = csv_lines(rows) if feed_format == 'csv' else jsonl_lines(rows)
+    chunks = buffered(lines)
+    return gzipped(chunks) if gzip else chunks
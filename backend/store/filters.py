@@ -1,12 +1,77 @@
+from rest_framework.exceptions import ValidationError
 from django_filters import rest_framework as filters
-from .models import Product
+from rest_framework.filters import SearchFilter
+from .models import Product, ProductAttribute, Category, normalize_spec_key, normalize_spec_value
+from .search import get_search_backend
 
 class ProductFilter(filters.FilterSet):
     min_price = filters.NumberFilter(field_name="price", lookup_expr='gte')
     max_price = filters.NumberFilter(field_name="price", lookup_expr='lte')
     brand = filters.CharFilter(field_name="brand__slug") # Фильтр по слагу бренда
-    category = filters.CharFilter(field_name="category__slug") # Фильтр по слагу категории
+    category = filters.CharFilter(method='filter_category') # Фильтр по слагу категории (вместе с подкатегориями)
     
     class Meta:
         model = Product
-        fields = ['is_active', 'brand', 'category']
\ No newline at end of file
+        fields = ['is_active', 'brand', 'category']
+
+    def filter_category(self, queryset, name, value):
+        # Товары категории и всех её потомков: поддерево берем по индексу path
+        category = Category.objects.filter(slug=value).only('pk', 'path').first()
+        if category is None:
+            return queryset.none()
+        return queryset.filter(category__in=Category.objects.subtree(category).values('pk'))
+
+    # Фильтры по характеристикам (Product.specifications) через индекс ProductAttribute:
+    #   ?spec.color=red&spec.color=blue  - любое из значений
+    #   ?spec.weight__min=1&spec.weight__max=3  - числовой диапазон
+    SPEC_PREFIX = 'spec.'
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        for param in self.data:
+            if not param.startswith(self.SPEC_PREFIX):
+                continue
+            key = param[len(self.SPEC_PREFIX):]
+            attributes = self.filter_spec(key, self.data.getlist(param))
+            if attributes is not None:
+                queryset = queryset.filter(pk__in=attributes.values('product_id'))
+        return queryset
+
+    def filter_spec(self, key, values):
+        values = [value for value in values if value != '']
+        if not values:
+            return None
+
+        for suffix, lookup in (('__min', 'value_num__gte'), ('__max', 'value_num__lte')):
+            if key.endswith(suffix):
+                try:
+                    number = float(values[0].replace(',', '.'))
+                except ValueError:
+                    raise ValidationError({self.SPEC_PREFIX + key: "Ожидается число."})
+                return ProductAttribute.objects.filter(
+                    key=normalize_spec_key(key[:-len(suffix)]), **{lookup: number}
+                )
+
+        return ProductAttribute.objects.filter(
+            key=normalize_spec_key(key), value__in=[normalize_spec_value(value) for value in values]
+        )
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Поиск ?search= через полнотекстовый индекс (store/search.py) вместо
+    LIKE-сканов по всей таблице. Совпадения ищутся в том же запросе, что и
+    остальные фильтры (без предварительного списка id), количество
+    ограничивает пагинация. Если не передан ?ordering=, результаты
+    сортируются по релевантности.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        queryset = get_search_backend().filter_queryset(queryset, ' '.join(terms))
+        if not request.query_params.get('ordering'):
+            queryset = queryset.order_by('search_rank', 'id')
+        return queryset
@@ -0,0 +1,196 @@
+"""
+Уменьшенные копии фото товаров (thumbnail / medium / large, WebP).
+
+Загрузка в запросе только сохраняет оригинал, ProductImage создается со
+статусом pending. Команда process_product_images (по крону или постоянно
+с --loop) забирает такие строки пачками и считает варианты в пуле
+процессов: воркеры получают байты оригинала и возвращают байты WebP,
+в БД и хранилище пишет только основной процесс. Замена оригинала
+(ProductImage.save) сбрасывает варианты и возвращает строку в pending.
+
+Строки берутся условным UPDATE с меткой claim (как письма в user/outbox.py),
+поэтому несколько воркеров не возьмут одну картинку. Строка, которую воркер
+держит дольше STORE_IMAGE_CLAIM_TIMEOUT, считается брошенной и возвращается
+в очередь (reset_stale).
+
+Списки (ProductListSerializer) отдают STORE_LIST_IMAGE_VARIANT (medium),
+галерея в детальной карточке - все размеры.
+"""
+import logging
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import bump_catalog_version
+from .models import ProductImage
+
+logger = logging.getLogger(__name__)
+
+# Максимальная сторона варианта в пикселях (пропорции сохраняются, без увеличения)
+VARIANT_SIZES = getattr(settings, 'STORE_IMAGE_VARIANTS', {
+    'thumbnail': 200,
+    'medium': 600,
+    'large': 1200,
+})
+WEBP_QUALITY = 80
+# Какой вариант главного фото отдавать в списках (каталог, корзина, избранное)
+LIST_IMAGE_VARIANT = getattr(settings, 'STORE_LIST_IMAGE_VARIANT', 'medium')
+# Через сколько секунд взятая в работу картинка считается брошенной упавшим воркером
+CLAIM_TIMEOUT = getattr(settings, 'STORE_IMAGE_CLAIM_TIMEOUT', 60 * 30)
+
+
+def render_variants(data, sizes=VARIANT_SIZES, quality=WEBP_QUALITY):
+    """
+    Байты оригинала -> {вариант: байты WebP}. Чистая функция без Django,
+    выполняется в процессе пула.
+    """
+    with Image.open(BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        variants = {}
+        for name, size in sizes.items():
+            variant = image.copy()
+            variant.thumbnail((size, size), Image.Resampling.LANCZOS)
+            buffer = BytesIO()
+            variant.save(buffer, 'WEBP', quality=quality, method=4)
+            variants[name] = buffer.getvalue()
+    return variants
+
+
+def _render(job):
+    pk, data = job
+    try:
+        return pk, render_variants(data), None
+    except Exception as e:
+        return pk, None, repr(e)
+
+
+def _claim(queryset):
+    """pending/любые строки queryset -> processing с новой меткой; возвращает взятые"""
+    claim = uuid.uuid4().hex
+    queryset.update(variants_status='processing', variants_claim=claim, variants_claimed_at=timezone.now())
+    return list(ProductImage.objects.filter(variants_claim=claim, variants_status='processing').order_by('pk'))
+
+
+def claim_batch(limit):
+    """
+    Берет до limit картинок в работу (pending -> processing). UPDATE
+    условный: строку, которую между SELECT и UPDATE взял другой воркер, не трогаем.
+    """
+    ids = list(
+        ProductImage.objects.filter(variants_status='pending').order_by('pk').values_list('pk', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    return _claim(ProductImage.objects.filter(pk__in=ids, variants_status='pending'))
+
+
+def reset_stale(timeout=CLAIM_TIMEOUT):
+    """Строки, которые воркер держит дольше timeout (упал), возвращаются в очередь"""
+    deadline = timezone.now() - timedelta(seconds=timeout)
+    return (
+        ProductImage.objects.filter(variants_status='processing')
+        .exclude(variants_claimed_at__gt=deadline)
+        .update(variants_status='pending', variants_claim='', variants_claimed_at=None)
+    )
+
+
+def _read(image):
+    with image.image.open('rb') as file:
+        return file.read()
+
+
+def save_variants(image, variants):
+    stem = os.path.splitext(os.path.basename(image.image.name))[0]
+    for name, data in variants.items():
+        # Старый вариант не удаляем: блоб может быть общим, его уберет gc_media_blobs
+        getattr(image, name).save(f"{stem}_{name}.webp", ContentFile(data), save=False)
+    image.variants_status = 'ready'
+
+
+def process_batch(images, executor=None):
+    """
+    Считает варианты для пачки (в пуле, если передан executor) и
+    сохраняет файлы и статусы. Возвращает (готово, ошибок).
+    """
+    jobs = []
+    failed = []
+    for image in images:
+        try:
+            jobs.append((image.pk, _read(image)))
+        except Exception:
+            logger.warning("Не удалось прочитать оригинал %s", image.image.name, exc_info=True)
+            image.variants_status = 'failed'
+            failed.append(image)
+
+    by_pk = {image.pk: image for image in images}
+    results = executor.map(_render, jobs) if executor else map(_render, jobs)
+    ready = []
+    for pk, variants, error in results:
+        image = by_pk[pk]
+        if error:
+            logger.warning("Не удалось обработать %s: %s", image.image.name, error)
+            image.variants_status = 'failed'
+            failed.append(image)
+            continue
+        save_variants(image, variants)
+        ready.append(image)
+
+    # Пока считали, строку могли признать брошенной и отдать другому воркеру -
+    # тогда результат пишет он (файлы-блобы без ссылок уберет gc_media_blobs)
+    owned = set(
+        ProductImage.objects.filter(
+            pk__in=by_pk, variants_claim__in={image.variants_claim for image in images}
+        ).values_list('pk', 'variants_claim')
+    )
+    done = [image for image in ready + failed if (image.pk, image.variants_claim) in owned]
+    ready = [image for image in ready if image in done]
+    for image in done:
+        image.variants_claim = ''
+        image.variants_claimed_at = None
+    ProductImage.objects.bulk_update(
+        done, ['thumbnail', 'medium', 'large', 'variants_status', 'variants_claim', 'variants_claimed_at']
+    )
+    if ready:
+        # bulk_update без сигналов, а ссылки на картинки в ответах каталога поменялись
+        bump_catalog_version()
+    return len(ready), len(done) - len(ready)
+
+
+def process_pending(batch_size=50, workers=None, rebuild=False, executor=None):
+    """
+    Обрабатывает очередь до конца. Пул процессов - переданный executor
+    или новый на workers процессов; workers=0 без executor - в текущем процессе.
+    rebuild=True - пересчитать все картинки (бэкфилл после смены размеров).
+    """
+    if executor is None and workers != 0:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return process_pending(batch_size, rebuild=rebuild, executor=pool)
+
+    total_ready = total_failed = 0
+    last_pk = 0
+    while True:
+        if rebuild:
+            # Все строки по порядку id, независимо от статуса
+            ids = list(ProductImage.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            images = _claim(ProductImage.objects.filter(pk__in=ids)) if ids else []
+            if ids:
+                last_pk = ids[-1]
+        else:
+            images = claim_batch(batch_size)
+        if not images:
+            break
+        ready, failed = process_batch(images, executor)
+        total_ready += ready
+        total_failed += failed
+    return total_ready, total_failed
@@ -0,0 +1,36 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from store.cache import bump_catalog_version
+from store.storage import adopt_legacy_files
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит загруженные раньше файлы (avatars/, products/, categories/, brands/) "
+        "в контентно-адресуемое хранилище media/cas, одинаковые файлы схлопываются"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Сколько строк обновлять за раз")
+        parser.add_argument('--keep-files', action='store_true', help="Не удалять старые файлы после переноса")
+
+    def handle(self, *args, **options):
+        adopted, missing, legacy = adopt_legacy_files(batch_size=options['batch_size'])
+        if missing:
+            self.stderr.write(f"Файлов нет на диске (ссылки оставлены как есть): {missing}")
+        if adopted:
+            # bulk_update без сигналов, а ссылки на картинки в ответах каталога поменялись
+            bump_catalog_version()
+
+        removed = 0
+        if not options['keep_files']:
+            # Новые загрузки идут только в cas/, на старое имя после переноса никто не ссылается
+            for name in legacy:
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                    removed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Перенесено ссылок: {adopted}, удалено старых файлов: {removed}"
+        ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.related import build, update
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит рекомендации \"часто покупают вместе\" по совместным покупкам. "
+        "По умолчанию учитывает только новые и измененные заказы, --full - пересчет с нуля"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Пересчитать по всем заказам")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Сколько заказов читать за раз")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        run = build if options['full'] else update
+        orders, products = run(
+            chunk_size=options['batch_size'],
+            progress=lambda done: self.stdout.write(f"Заказов обработано: {done}"),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово за {time.monotonic() - started:.1f} с. Заказов: {orders}, товаров с рекомендациями: {products}"
+        ))
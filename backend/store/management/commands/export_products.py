@@ -0,0 +1,45 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from store.export import export_stream
+
+
+class Command(BaseCommand):
+    help = "Потоковая выгрузка каталога в JSONL/CSV (полная или изменения с --since)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Куда писать; '-' - stdout. Имя на .gz - сжать gzip")
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help="По умолчанию - по расширению файла")
+        parser.add_argument('--since', help="Только товары, измененные после этого момента (ISO 8601)")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Сколько товаров читать одним запросом")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError("--since: ожидается дата и время в ISO 8601")
+
+        use_gzip = path.endswith('.gz')
+        name = path[:-3] if use_gzip else path
+        feed_format = options['format'] or ('csv' if name.endswith('.csv') else 'jsonl')
+
+        started = time.monotonic()
+        written = 0
+        output = sys.stdout.buffer if path == '-' else open(path, 'wb')
+        try:
+            for chunk in export_stream(feed_format, since=since, gzip=use_gzip, chunk_size=options['chunk_size']):
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+        if path != '-':
+            self.stdout.write(self.style.SUCCESS(
+                f"Готово: {written} байт за {time.monotonic() - started:.1f} с -> {path}"
+            ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from store.storage import GC_GRACE, collect_garbage
+
+
+class Command(BaseCommand):
+    help = (
+        "Сборка мусора в media/cas: считает ссылки из всех файловых полей "
+        "(фото товаров и их варианты, категории, бренды, аватары) и удаляет блобы без ссылок"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=GC_GRACE, help="Не трогать блобы моложе стольких секунд")
+        parser.add_argument('--batch-size', type=int, default=2000, help="По сколько ссылок читать из БД за раз")
+        parser.add_argument('--dry-run', action='store_true', help="Только посчитать, ничего не удалять")
+
+    def handle(self, *args, **options):
+        removed, freed = collect_garbage(
+            grace=options['grace'], dry_run=options['dry_run'], chunk_size=options['batch_size'],
+        )
+        verb = "Можно удалить" if options['dry_run'] else "Удалено"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} блобов: {removed}, {freed / 1024 / 1024:.1f} МБ"
+        ))
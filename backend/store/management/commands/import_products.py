@@ -0,0 +1,308 @@
+import csv
+import json
+import os
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from store.cache import bump_catalog_version, bump_suggest_version
+from store.models import Product, ProductAttribute, Category, Brand
+from store.search import get_search_backend
+
+# Поля фида; обязательны для новых товаров: slug, name, category, price
+FEED_FIELDS = (
+    'slug', 'name', 'category', 'brand', 'description',
+    'price', 'discount_price', 'stock', 'is_active', 'specifications',
+)
+REQUIRED_FIELDS = ('slug', 'name', 'category', 'price')
+UPDATE_FIELDS = [
+    'category', 'brand', 'name', 'description', 'price', 'discount_price',
+    'stock', 'is_active', 'specifications', 'updated_at',
+]
+# Поля фида, которые пишутся во внешние ключи
+FK_FIELDS = {'category': 'category_id', 'brand': 'brand_id'}
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да'}
+MAX_REPORTED_ERRORS = 20
+
+
+class RowError(ValueError):
+    pass
+
+
+class FeedReader:
+    """
+    Построчное чтение фида (CSV с заголовком или JSONL) без загрузки файла в память.
+    offset - сколько байт файла разобрано; по нему возобновляется импорт.
+    Файл читается в бинарном режиме построчно, csv.reader сам забирает
+    столько строк, сколько занимает запись (в том числе многострочные поля),
+    поэтому offset после каждой записи точный.
+    """
+
+    def __init__(self, path, feed_format, offset=0):
+        self.path = path
+        self.format = feed_format
+        self.start = offset
+        self.offset = offset
+
+    def _lines(self, file):
+        for raw in file:
+            self.offset += len(raw)
+            yield raw.decode('utf-8')
+
+    def __iter__(self):
+        with open(self.path, 'rb') as file:
+            if self.format == 'csv':
+                yield from self._iter_csv(file)
+            else:
+                yield from self._iter_jsonl(file)
+
+    def _iter_csv(self, file):
+        self.offset = 0
+        reader = csv.reader(self._lines(file))
+        header = [name.strip().lstrip('\ufeff') for name in next(reader, [])]
+        if self.start:
+            # Заголовок прочитан, дальше - с места остановки
+            file.seek(self.start)
+            self.offset = self.start
+        for values in reader:
+            if not any(values):
+                continue
+            yield dict(zip(header, values))
+
+    def _iter_jsonl(self, file):
+        file.seek(self.start)
+        for line in self._lines(file):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield RowError(f"Некорректный JSON: {e}")
+                continue
+            yield row if isinstance(row, dict) else RowError("Строка JSONL должна быть объектом")
+
+
+class Command(BaseCommand):
+    help = (
+        "Потоковый импорт товаров из CSV/JSONL: upsert по slug пачками "
+        "(bulk_create/bulk_update), память не зависит от размера файла, "
+        "можно продолжить с места остановки (--resume)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Файл фида (.csv или .jsonl)")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="По умолчанию - по расширению файла")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Сколько строк писать за одну транзакцию")
+        parser.add_argument('--checkpoint', help="Файл контрольной точки (по умолчанию <path>.checkpoint)")
+        parser.add_argument('--resume', action='store_true', help="Продолжить с контрольной точки")
+
+    def handle(self, *args, **options):
+        path = os.path.abspath(options['path'])
+        if not os.path.exists(path):
+            raise CommandError(f"Файл не найден: {path}")
+        feed_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        batch_size = options['batch_size']
+        self.checkpoint_path = options['checkpoint'] or f"{path}.checkpoint"
+
+        offset, rows_done = 0, 0
+        if options['resume']:
+            offset, rows_done = self.read_checkpoint(path)
+            self.stdout.write(f"Продолжаем со строки {rows_done} (байт {offset})")
+
+        # Категорий и брендов немного - держим соответствие slug -> id в памяти
+        self.categories = dict(Category.objects.values_list('slug', 'pk'))
+        self.brands = dict(Brand.objects.values_list('slug', 'pk'))
+        self.search_backend = get_search_backend()
+
+        self.created = self.updated = self.skipped = 0
+        reader = FeedReader(path, feed_format, offset)
+        started = time.monotonic()
+        rows = rows_done
+        batch = {}
+
+        for row in reader:
+            rows += 1
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                slug, values = self.parse_row(row)
+            except RowError as e:
+                self.report_error(rows, e)
+                continue
+            # Повтор slug в пачке - побеждает последняя строка
+            batch[slug] = values
+            if len(batch) >= batch_size:
+                self.write_batch(batch)
+                batch = {}
+                self.write_checkpoint(path, reader.offset, rows)
+                self.report_progress(rows - rows_done, started)
+
+        if batch:
+            self.write_batch(batch)
+        self.report_progress(rows - rows_done, started)
+
+        if self.created or self.updated:
+            # bulk-операции не шлют сигналы: кэш каталога и подсказки сбрасываем сами
+            bump_catalog_version()
+            bump_suggest_version()
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово. Создано: {self.created}, обновлено: {self.updated}, пропущено: {self.skipped}"
+        ))
+
+    # --- Разбор строк ---
+
+    def parse_row(self, row):
+        values = {}
+        for field in FEED_FIELDS:
+            if field not in row:
+                continue
+            raw = row[field]
+            if isinstance(raw, str):
+                raw = raw.strip()
+            values[field] = getattr(self, f'clean_{field}', lambda value: value)(raw)
+
+        slug = values.pop('slug', None)
+        if not slug:
+            raise RowError("Нет slug")
+        return slug, values
+
+    def clean_name(self, value):
+        if not value:
+            raise RowError("Пустое название")
+        return str(value)[:255]
+
+    def clean_category(self, value):
+        if value not in self.categories:
+            raise RowError(f"Неизвестная категория: {value!r}")
+        return self.categories[value]
+
+    def clean_brand(self, value):
+        if value in (None, ''):
+            return None
+        if value not in self.brands:
+            raise RowError(f"Неизвестный бренд: {value!r}")
+        return self.brands[value]
+
+    def clean_description(self, value):
+        return value or ''
+
+    def clean_price(self, value):
+        try:
+            price = Decimal(str(value).replace(',', '.'))
+        except InvalidOperation:
+            raise RowError(f"Некорректная цена: {value!r}")
+        if not price.is_finite() or price < 0:
+            raise RowError(f"Некорректная цена: {value!r}")
+        return price.quantize(Decimal('0.01'))
+
+    def clean_discount_price(self, value):
+        if value in (None, ''):
+            return None
+        return self.clean_price(value)
+
+    def clean_stock(self, value):
+        if value in (None, ''):
+            return 0
+        try:
+            stock = int(value)
+        except (TypeError, ValueError):
+            raise RowError(f"Некорректный остаток: {value!r}")
+        if stock < 0:
+            raise RowError(f"Некорректный остаток: {value!r}")
+        return stock
+
+    def clean_is_active(self, value):
+        if isinstance(value, bool):
+            return value
+        if value in (None, ''):
+            return True
+        return str(value).lower() in TRUE_VALUES
+
+    def clean_specifications(self, value):
+        if value in (None, ''):
+            return {}
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise RowError("specifications должны быть JSON-объектом")
+        if not isinstance(value, dict):
+            raise RowError("specifications должны быть JSON-объектом")
+        return value
+
+    # --- Запись ---
+
+    def write_batch(self, batch):
+        """Upsert пачки по slug: один SELECT, bulk_update, bulk_create, индексы"""
+        now = timezone.now()
+        with transaction.atomic():
+            existing = Product.objects.filter(slug__in=batch.keys()).in_bulk(field_name='slug')
+            to_update = []
+            to_create = []
+            for slug, values in batch.items():
+                product = existing.get(slug)
+                if product is None:
+                    missing = [field for field in REQUIRED_FIELDS if field != 'slug' and field not in values]
+                    if missing:
+                        self.report_error(None, RowError(f"{slug}: новому товару не хватает полей {missing}"))
+                        continue
+                    product = Product(slug=slug)
+                    to_create.append(product)
+                else:
+                    to_update.append(product)
+                for field, value in values.items():
+                    setattr(product, FK_FIELDS.get(field, field), value)
+                # auto_now в bulk_update не срабатывает
+                product.updated_at = now
+
+            Product.objects.bulk_update(to_update, UPDATE_FIELDS)
+            Product.objects.bulk_create(to_create)
+
+            # Сигналы post_save не пришли - поисковый индекс и характеристики пачкой
+            products = to_update + to_create
+            self.search_backend.index(products)
+            ProductAttribute.rebuild_for_many(products)
+
+        self.created += len(to_create)
+        self.updated += len(to_update)
+
+    # --- Контрольная точка и отчет ---
+
+    def read_checkpoint(self, path):
+        try:
+            with open(self.checkpoint_path) as file:
+                checkpoint = json.load(file)
+        except FileNotFoundError:
+            raise CommandError(f"Нет контрольной точки: {self.checkpoint_path}")
+        if checkpoint.get('path') != path or checkpoint.get('size', 0) > os.path.getsize(path):
+            raise CommandError("Контрольная точка от другого файла")
+        return checkpoint['offset'], checkpoint['rows']
+
+    def write_checkpoint(self, path, offset, rows):
+        # Через временный файл: при падении посреди записи старая точка цела
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({'path': path, 'size': os.path.getsize(path), 'offset': offset, 'rows': rows}, file)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def report_progress(self, rows, started):
+        elapsed = time.monotonic() - started
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(
+            f"Строк: {rows}, создано: {self.created}, обновлено: {self.updated}, "
+            f"пропущено: {self.skipped} ({rate:.0f} строк/с)"
+        )
+
+    def report_error(self, row_number, error):
+        self.skipped += 1
+        if self.skipped <= MAX_REPORTED_ERRORS:
+            where = f"Строка {row_number}: " if row_number else ""
+            self.stderr.write(f"{where}{error}")
+        elif self.skipped == MAX_REPORTED_ERRORS + 1:
+            self.stderr.write("Дальше ошибки не показываются, смотрите итоговый счетчик")
@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from store.images import process_pending, reset_stale
+
+
+class Command(BaseCommand):
+    help = (
+        "Делает WebP-варианты (thumbnail/medium/large) для фото товаров в пуле процессов. "
+        "Без флагов - все необработанные, в том числе старые картинки из media/products (бэкфилл)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Сколько картинок брать за раз")
+        parser.add_argument('--workers', type=int, default=None, help="Процессов в пуле (по умолчанию - по числу ядер, 0 - без пула)")
+        parser.add_argument('--rebuild', action='store_true', help="Пересчитать варианты у всех картинок")
+        parser.add_argument('--loop', action='store_true', help="Не выходить, ждать новые загрузки")
+        parser.add_argument('--interval', type=float, default=5, help="Пауза между проверками очереди в режиме --loop, сек")
+
+    def handle(self, *args, **options):
+        # Пул один на все время работы, процессы не пересоздаются на каждой проверке
+        executor = ProcessPoolExecutor(max_workers=options['workers']) if options['workers'] != 0 else None
+        try:
+            self.run(executor, options)
+        finally:
+            if executor:
+                executor.shutdown()
+
+    def run(self, executor, options):
+        started = time.monotonic()
+        total_ready = total_failed = 0
+        rebuild = options['rebuild']
+        while True:
+            # Только строки, взятые давно: живые воркеры свои держат меньше таймаута
+            stale = reset_stale()
+            if stale:
+                self.stdout.write(f"Возвращено в очередь после сбоя: {stale}")
+            ready, failed = process_pending(
+                batch_size=options['batch_size'], workers=0, rebuild=rebuild, executor=executor,
+            )
+            rebuild = False
+            total_ready += ready
+            total_failed += failed
+            if ready or failed:
+                self.stdout.write(f"Готово: {ready}, ошибок: {failed}")
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Обработано: {total_ready}, ошибок: {total_failed} за {time.monotonic() - started:.1f} с"
+        ))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.popularity import recalculate
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает рейтинг популярности товаров (продажи, избранное и просмотры "
+        "с затуханием по времени) для ?ordering=-popularity и бестселлеров. Запускать по крону"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Сколько строк читать за раз")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        updated = recalculate(chunk_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Обновлено товаров: {updated} за {time.monotonic() - started:.1f} с"
+        ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from store.cache import bump_catalog_version
+from store.models import Product
+from store.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = "Полностью перестраивает поисковый индекс товаров пачками"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Сколько товаров индексировать за раз")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        backend = get_search_backend()
+        backend.clear()
+
+        # Идем по id (keyset), чтобы не держать весь каталог в памяти
+        last_pk = 0
+        total = 0
+        while True:
+            batch = list(
+                Product.objects.filter(pk__gt=last_pk).order_by('pk')
+                .only('pk', 'name', 'description')[:batch_size]
+            )
+            if not batch:
+                break
+            backend.index(batch)
+            last_pk = batch[-1].pk
+            total += len(batch)
+            self.stdout.write(f"Проиндексировано: {total}")
+
+        # Результаты поиска поменялись, а закэшированные ответы каталога о переиндексации не знают
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f"Готово. Товаров в индексе: {total}"))
@@ -0,0 +1,41 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:09
+
+from django.db import migrations, models
+
+
+def fill_category_paths(apps, schema_editor):
+    Category = apps.get_model('store', 'Category')
+    categories = {c.pk: c for c in Category.objects.all()}
+
+    def build(category):
+        if category.path:
+            return category.path
+        parent_path = build(categories[category.parent_id]) if category.parent_id else ''
+        category.path = f"{parent_path}{category.pk}/"
+        category.depth = category.path.count('/') - 1
+        return category.path
+
+    for category in categories.values():
+        build(category)
+    Category.objects.bulk_update(categories.values(), ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:02
+
+from django.db import migrations
+
+
+def create_fts_table(apps, schema_editor):
+    # Виртуальная таблица FTS5 есть только в SQLite, на других БД
+    # используется другой поисковый бэкенд (см. store/search.py)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from store.search import tokenize
+
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS store_product_fts "
+        "USING fts5(name, description, tokenize='unicode61 remove_diacritics 2')"
+    )
+
+    Product = apps.get_model('store', 'Product')
+    rows = [
+        (pk, ' '.join(tokenize(name)), ' '.join(tokenize(description)))
+        for pk, name, description in Product.objects.values_list('pk', 'name', 'description').iterator(chunk_size=1000)
+    ]
+    if not rows:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO store_product_fts (rowid, name, description) VALUES (%s, %s, %s)", rows
+        )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS store_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_category_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_product_attributes(apps, schema_editor):
+    from store.models import normalize_spec_key, normalize_spec_value, parse_spec_number
+
+    Product = apps.get_model('store', 'Product')
+    ProductAttribute = apps.get_model('store', 'ProductAttribute')
+    batch = []
+    for pk, specifications in Product.objects.values_list('pk', 'specifications').iterator(chunk_size=1000):
+        for key, raw in (specifications or {}).items():
+            for value in (raw if isinstance(raw, list) else [raw]):
+                if value is None or isinstance(value, dict):
+                    continue
+                batch.append(ProductAttribute(
+                    product_id=pk,
+                    key=normalize_spec_key(key)[:100],
+                    value=normalize_spec_value(value)[:255],
+                    value_num=parse_spec_number(value),
+                ))
+        if len(batch) >= 1000:
+            ProductAttribute.objects.bulk_create(batch)
+            batch = []
+    ProductAttribute.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_product_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductAttribute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100)),
+                ('value', models.CharField(max_length=255)),
+                ('value_num', models.FloatField(blank=True, null=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attributes', to='store.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'value'], name='store_produ_key_8f0ad1_idx'), models.Index(fields=['key', 'value_num'], name='store_produ_key_b5f960_idx')],
+            },
+        ),
+        migrations.RunPython(fill_product_attributes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_main_images(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductImage = apps.get_model('store', 'ProductImage')
+    main_images = {}
+    # Сначала is_main, потом по id: первая попавшаяся картинка товара и есть главная
+    for pk, product_id in ProductImage.objects.order_by('-is_main', 'id').values_list('pk', 'product_id'):
+        main_images.setdefault(product_id, pk)
+    for product_id, image_id in main_images.items():
+        Product.objects.filter(pk=product_id).update(main_image_id=image_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_productattribute'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='main_image',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='store.productimage'),
+        ),
+        migrations.RunPython(fill_main_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_product_updated_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='large',
+            field=models.ImageField(blank=True, editable=False, upload_to='products/variants/%Y/%m/%d'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='medium',
+            field=models.ImageField(blank=True, editable=False, upload_to='products/variants/%Y/%m/%d'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='products/variants/%Y/%m/%d'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='variants_status',
+            field=models.CharField(choices=[('pending', 'Ожидает обработки'), ('processing', 'Обрабатывается'), ('ready', 'Готово'), ('failed', 'Ошибка')], db_index=True, default='pending', editable=False, max_length=10),
+        ),
+    ]
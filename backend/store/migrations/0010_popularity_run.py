@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_related_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularityRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ran_at', models.DateTimeField()),
+                ('updated', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-id'],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-18 20:20
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_counted_orders(apps, schema_editor):
+    # До этой миграции учтены все неотмененные заказы до отметки последнего пересчета
+    RelatedProductsBuild = apps.get_model('store', 'RelatedProductsBuild')
+    RelatedProductsOrder = apps.get_model('store', 'RelatedProductsOrder')
+    Order = apps.get_model('orders', 'Order')
+    # Старые проходы: отметка по времени - когда проход закончился (новые заказы после него)
+    RelatedProductsBuild.objects.update(scanned_until=F('created_at'))
+    last_build = RelatedProductsBuild.objects.order_by('-id').first()
+    if last_build is None:
+        return
+    order_ids = (
+        Order.objects.filter(pk__lte=last_build.last_order_id).exclude(status='canceled')
+        .values_list('pk', flat=True).iterator(chunk_size=5000)
+    )
+    batch = []
+    for pk in order_ids:
+        batch.append(RelatedProductsOrder(order_id=pk))
+        if len(batch) >= 5000:
+            RelatedProductsOrder.objects.bulk_create(batch)
+            batch = []
+    RelatedProductsOrder.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_order_updated_idx'),
+        ('store', '0011_productimage_claim'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedProductsOrder',
+            fields=[
+                ('order_id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='relatedproductsbuild',
+            name='scanned_until',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_counted_orders, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='relatedproductsbuild',
+            name='last_order_id',
+        ),
+    ]
@@ -1,5 +1,47 @@
+import re
+from collections import defaultdict
+
 from django.db import models
+from django.db.models import F, Q, Value, Case, When
+from django.db.models.functions import Concat, Substr
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.core.validators import MinValueValidator
+
+# Разделитель в материализованном пути категории: "1/5/12/"
+CATEGORY_PATH_SEPARATOR = '/'
+
+
+def category_path_range(path):
+    """
+    Границы поддерева для материализованного пути.
+    Все потомки лежат в полуинтервале [path, path без '/' + '0'),
+    поэтому выборка поддерева - это range-scan по индексу, а не LIKE.
+    """
+    return path, path[:-1] + chr(ord(CATEGORY_PATH_SEPARATOR) + 1)
+
+
+class CategoryQuerySet(models.QuerySet):
+    def subtree(self, category, include_self=True):
+        """Категория и все её потомки одним запросом по индексу path"""
+        start, end = category_path_range(category.path)
+        qs = self.filter(path__gte=start, path__lt=end)
+        if not include_self:
+            qs = qs.exclude(pk=category.pk)
+        return qs
+
+    def children_map(self):
+        """
+        Загружает категории одним запросом и раскладывает их по родителям:
+        {parent_id: [дочерние категории, отсортированные по имени]}.
+        Корневые категории лежат под ключом None.
+        """
+        children = defaultdict(list)
+        for category in self.order_by('name'):
+            children[category.parent_id].append(category)
+        return children
+
+
 class Category(models.Model):
     """Категории с вложенностью (Электроника -> Телефоны -> Смартфоны)"""
     name = models.CharField(max_length=255, verbose_name="Название")
@@ -7,12 +49,66 @@ class Category(models.Model):
     # Ссылка на саму себя для создания дерева категорий
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='children', verbose_name="Родительская категория")
     image = models.ImageField(upload_to='categories/', blank=True, null=True)
-    
+
+    # Материализованный путь от корня: "id_корня/.../id_категории/".
+    # Поддерживается в save(), руками не редактируется.
+    path = models.CharField(max_length=255, default='', db_index=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    objects = CategoryQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Категория"
         verbose_name_plural = "Категории"
         ordering = ['name']
 
+    PARENT_CYCLE_MESSAGE = "Категория не может быть вложена в саму себя или своего потомка."
+
+    def parent_makes_cycle(self, parent_id=None):
+        """Родитель (по умолчанию текущий parent_id) - сама категория или её потомок"""
+        parent_id = parent_id or self.parent_id
+        if not self.pk or not parent_id:
+            return False
+        parent_path = Category.objects.filter(pk=parent_id).values_list('path', flat=True).first() or ''
+        return f"{CATEGORY_PATH_SEPARATOR}{self.pk}{CATEGORY_PATH_SEPARATOR}" in f"{CATEGORY_PATH_SEPARATOR}{parent_path}"
+
+    def clean(self):
+        # Нельзя сделать категорию потомком самой себя
+        if self.parent_makes_cycle():
+            raise ValidationError({'parent': self.PARENT_CYCLE_MESSAGE})
+
+    def save(self, *args, **kwargs):
+        # clean() зовут только формы, а цикл оторвал бы поддерево от корня
+        # и переписал пути сам в себя - проверяем при любом сохранении
+        if self.parent_makes_cycle():
+            raise ValidationError({'parent': self.PARENT_CYCLE_MESSAGE})
+        old_path = ''
+        if self.pk:
+            old_path = Category.objects.filter(pk=self.pk).values_list('path', flat=True).first() or ''
+
+        super().save(*args, **kwargs)
+
+        parent_path = ''
+        if self.parent_id:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
+        new_path = f"{parent_path}{self.pk}{CATEGORY_PATH_SEPARATOR}"
+        new_depth = new_path.count(CATEGORY_PATH_SEPARATOR) - 1
+
+        if new_path == old_path:
+            self.path, self.depth = new_path, new_depth
+            return
+
+        if old_path:
+            # Категорию перенесли: переписываем пути всего поддерева одним UPDATE
+            start, end = category_path_range(old_path)
+            Category.objects.filter(path__gte=start, path__lt=end).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (new_depth - (old_path.count(CATEGORY_PATH_SEPARATOR) - 1)),
+            )
+        else:
+            Category.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+        self.path, self.depth = new_path, new_depth
+
     def __str__(self):
         full_path = [self.name]
         k = self.parent
@@ -21,6 +117,19 @@ class Category(models.Model):
             k = k.parent
         return ' -> '.join(full_path[::-1])
 
+def current_price_expression(prefix=''):
+    """
+    SQL-аналог Product.current_price: цена со скидкой, если она задана (и не 0),
+    иначе обычная цена. prefix - путь до товара, например 'product__'.
+    """
+    discount = f'{prefix}discount_price'
+    return Case(
+        When(Q(**{f'{discount}__isnull': False}) & ~Q(**{discount: 0}), then=F(discount)),
+        default=F(f'{prefix}price'),
+        output_field=models.DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
 class Brand(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True)
@@ -46,9 +155,25 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Денормализованная ссылка на главное фото для списков (каталог, корзина, избранное).
+    # Обновляется при изменении ProductImage (см. refresh_main_image), руками не редактируется.
+    main_image = models.ForeignKey('ProductImage', on_delete=models.SET_NULL, null=True, blank=True, related_name='+', editable=False)
+
+    # Популярность: продажи, избранное и просмотры с затуханием по времени.
+    # Пересчитывается командой recalculate_popularity (store/popularity.py).
+    popularity = models.FloatField(default=0, db_index=True, editable=False, verbose_name="Популярность")
+    # Просмотры с затуханием, накопленные к последнему пересчету
+    popularity_views = models.FloatField(default=0, editable=False)
+
     class Meta:
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
+        indexes = [
+            # Keyset-выгрузка каталога и инкрементальный режим (store/export.py)
+            models.Index(fields=['updated_at', 'id'], name='store_product_updated_idx'),
+            # Бестселлеры категории
+            models.Index(fields=['category', '-popularity'], name='store_product_cat_pop_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -57,9 +182,203 @@ class Product(models.Model):
     def current_price(self):
         return self.discount_price if self.discount_price else self.price
 
+    @classmethod
+    def refresh_main_image(cls, product_id):
+        """Главное фото: картинка с флагом is_main, иначе первая загруженная"""
+        main_image_id = (
+            ProductImage.objects.filter(product_id=product_id)
+            .order_by('-is_main', 'id')
+            .values_list('pk', flat=True)
+            .first()
+        )
+        cls.objects.filter(pk=product_id).update(main_image_id=main_image_id, updated_at=timezone.now())
+
 class ProductImage(models.Model):
     """Галерея изображений товара"""
+    VARIANT_STATUS_CHOICES = [
+        ('pending', 'Ожидает обработки'),
+        ('processing', 'Обрабатывается'),
+        ('ready', 'Готово'),
+        ('failed', 'Ошибка'),
+    ]
+
     product = models.ForeignKey(Product, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='products/%Y/%m/%d')
     is_main = models.BooleanField(default=False, verbose_name="Главное фото")
-    created_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Уменьшенные копии в WebP (store/images.py), делаются вне запроса
+    # командой process_product_images. Пока не готовы - отдается оригинал.
+    thumbnail = models.ImageField(upload_to='products/variants/%Y/%m/%d', blank=True, editable=False)
+    medium = models.ImageField(upload_to='products/variants/%Y/%m/%d', blank=True, editable=False)
+    large = models.ImageField(upload_to='products/variants/%Y/%m/%d', blank=True, editable=False)
+    variants_status = models.CharField(max_length=10, choices=VARIANT_STATUS_CHOICES, default='pending', db_index=True, editable=False)
+    # Какой воркер и когда взял строку в работу (processing); давно взятые возвращает reset_stale
+    variants_claim = models.CharField(max_length=32, blank=True, editable=False)
+    variants_claimed_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # От меньшего к большему
+    VARIANTS = ('thumbnail', 'medium', 'large')
+    VARIANT_STATE_FIELDS = (*VARIANTS, 'variants_status', 'variants_claim', 'variants_claimed_at')
+
+    def save(self, *args, **kwargs):
+        # Оригинал заменили (админка, PUT) - варианты от старого фото, в очередь заново.
+        # Снятая метка не даст воркеру, который считает старое фото, записать результат
+        if self.pk and self.image_changed():
+            for variant in self.VARIANTS:
+                setattr(self, variant, '')
+            self.variants_status = 'pending'
+            self.variants_claim = ''
+            self.variants_claimed_at = None
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, *self.VARIANT_STATE_FIELDS}
+        super().save(*args, **kwargs)
+
+    def image_changed(self):
+        """Оригинал отличается от сохраненного в БД (новая загрузка или другое имя)"""
+        if not self.image._committed:
+            return True
+        old_name = ProductImage.objects.filter(pk=self.pk).values_list('image', flat=True).first()
+        return old_name is not None and old_name != self.image.name
+
+    def get_variant(self, name):
+        """Файл варианта name или ближайшего большего, иначе оригинал"""
+        if self.variants_status == 'ready':
+            for variant in self.VARIANTS[self.VARIANTS.index(name):]:
+                field = getattr(self, variant)
+                if field:
+                    return field
+        return self.image
+
+_NUMBER_RE = re.compile(r'^\s*(-?\d+(?:[.,]\d+)?)')
+
+
+def parse_spec_number(value):
+    """Число в начале значения характеристики: "2kg" -> 2.0, "1,5 кг" -> 1.5"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER_RE.match(str(value))
+    return float(match.group(1).replace(',', '.')) if match else None
+
+
+def normalize_spec_key(key):
+    return str(key).strip().lower()
+
+
+def normalize_spec_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return ' '.join(str(value).lower().replace('ё', 'е').split())
+
+
+class ProductAttribute(models.Model):
+    """
+    Типизированный индекс характеристик товара.
+    Строится из Product.specifications при сохранении товара (store/signals.py),
+    чтобы фильтровать и считать фасеты индексными запросами, а не по JSON.
+    """
+    product = models.ForeignKey(Product, related_name='attributes', on_delete=models.CASCADE)
+    key = models.CharField(max_length=100)
+    value = models.CharField(max_length=255)  # нормализованное значение
+    value_num = models.FloatField(null=True, blank=True)  # числовое значение, если удалось распарсить
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['key', 'value']),
+            models.Index(fields=['key', 'value_num']),
+        ]
+
+    def __str__(self):
+        return f"{self.key}: {self.value}"
+
+    @classmethod
+    def from_specifications(cls, product):
+        """Строки индекса для товара (списки значений раскладываются на несколько строк)"""
+        attributes = []
+        for key, raw in (product.specifications or {}).items():
+            values = raw if isinstance(raw, list) else [raw]
+            for value in values:
+                if value is None or isinstance(value, dict):
+                    continue
+                attributes.append(cls(
+                    product=product,
+                    key=normalize_spec_key(key)[:100],
+                    value=normalize_spec_value(value)[:255],
+                    value_num=parse_spec_number(value),
+                ))
+        return attributes
+
+    @classmethod
+    def rebuild_for(cls, product):
+        cls.objects.filter(product=product).delete()
+        cls.objects.bulk_create(cls.from_specifications(product))
+
+    @classmethod
+    def rebuild_for_many(cls, products):
+        """То же для пачки товаров (массовый импорт): один DELETE и один INSERT"""
+        cls.objects.filter(product__in=[product.pk for product in products]).delete()
+        cls.objects.bulk_create([
+            attribute for product in products for attribute in cls.from_specifications(product)
+        ])
+
+
+# --- "Часто покупают вместе" (store/related.py) ---
+
+class ProductPair(models.Model):
+    """
+    В скольких заказах товары встретились вместе. Пара хранится в обе
+    стороны, строка (товар, товар) - в скольких заказах был сам товар.
+    Соседи товара читаются по индексу (product, other).
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [['product', 'other']]
+
+
+class RelatedProduct(models.Model):
+    """Топ-N товаров, которые покупают вместе с product; rank с 1"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    orders = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = [['product', 'related']]
+        indexes = [
+            models.Index(fields=['product', 'rank'], name='store_related_rank_idx'),
+        ]
+
+
+class RelatedProductsBuild(models.Model):
+    """
+    Журнал пересчетов. scanned_until - время начала прохода: следующий
+    инкрементальный запуск читает заказы, измененные после него (с запасом).
+    """
+    scanned_until = models.DateTimeField()
+    is_full = models.BooleanField(default=False)
+    orders = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-id']
+
+
+class RelatedProductsOrder(models.Model):
+    """Заказ, чьи пары сейчас учтены в ProductPair (id заказа, без FK - заказы в другом приложении)"""
+    order_id = models.PositiveIntegerField(primary_key=True)
+
+
+class PopularityRun(models.Model):
+    """Журнал пересчетов популярности: от последнего считается затухание накопленных просмотров"""
+    ran_at = models.DateTimeField()
+    updated = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-id']
@@ -0,0 +1,141 @@
+import base64
+import json
+import math
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset-пагинация ("бесконечная лента") для каталога.
+
+    Включается параметром ?pagination=cursor (или наличием ?cursor=).
+    Учитывает ?ordering= вьюхи (первое поле из ordering_fields), вторым ключом
+    сортировки всегда идет id, поэтому порядок стабилен при равных ценах/датах.
+    Страница выбирается условием WHERE (поле, id) > (значение, id) вместо
+    OFFSET, и COUNT(*) не считается.
+
+    С поиском (?search=) не работает: результаты упорядочены по релевантности,
+    а по ней ключ не построить - такой запрос получает 400.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    ordering_query_param = 'ordering'
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 20)
+    default_ordering = '-created_at'
+    tiebreaker = 'id'
+    invalid_cursor_message = "Некорректный курсор."
+    search_not_supported_message = "Курсорная пагинация не работает с поиском, используйте ?page=."
+
+    @classmethod
+    def is_requested(cls, request):
+        params = request.query_params
+        return params.get(cls.mode_query_param) == 'cursor' or cls.cursor_query_param in params
+
+    def get_ordering(self, request, view):
+        allowed = set(getattr(view, 'ordering_fields', None) or [])
+        for field in request.query_params.get(self.ordering_query_param, '').split(','):
+            field = field.strip()
+            if field and field.lstrip('-') in allowed:
+                return field
+        return self.default_ordering
+
+    def encode_cursor(self, ordering, value, pk):
+        payload = json.dumps([ordering, value, pk], default=str, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor, ordering, model):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            cursor_ordering, value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            field = model._meta.get_field(ordering.lstrip('-'))
+            value = field.to_python(value)
+            pk = int(pk)
+        except (TypeError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None or (isinstance(value, (float, Decimal)) and not math.isfinite(value)):
+            # Поддельный курсор: с null/NaN условие (поле, id) > (значение, id) не построить
+            raise NotFound(self.invalid_cursor_message)
+        if cursor_ordering != ordering:
+            # Курсор выдан для другой сортировки
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(api_settings.SEARCH_PARAM):
+            # order_by ниже затер бы сортировку по релевантности
+            raise ValidationError({self.mode_query_param: self.search_not_supported_message})
+        self.request = request
+        self.ordering = self.get_ordering(request, view)
+        field = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-')
+        sign = '-' if descending else ''
+
+        queryset = queryset.order_by(f'{sign}{field}', f'{sign}{self.tiebreaker}')
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            value, pk = self.decode_cursor(cursor, self.ordering, queryset.model)
+            op = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{op}': value})
+                | Q(**{field: value, f'{self.tiebreaker}__{op}': pk})
+            )
+
+        # Берем на одну запись больше, чтобы понять, есть ли следующая страница
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        field = self.ordering.lstrip('-')
+        cursor = self.encode_cursor(self.ordering, getattr(last, field), getattr(last, self.tiebreaker))
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.mode_query_param,
+                'required': False,
+                'in': 'query',
+                'description': "cursor - включить keyset-пагинацию",
+                'schema': {'type': 'string', 'enum': ['cursor']},
+            },
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': "Курсор следующей страницы (из поля next)",
+                'schema': {'type': 'string'},
+            },
+        ]
@@ -1,7 +1,26 @@
+import hmac
+
+from django.conf import settings
 from rest_framework import permissions
 
 class IsAdminOrReadOnly(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.method in permissions.SAFE_METHODS: # GET, HEAD, OPTIONS
             return True
-        return request.user and request.user.is_staff
\ No newline at end of file
+        return request.user and request.user.is_staff
+
+
+class HasExportToken(permissions.BasePermission):
+    """
+    Партнерский доступ к выгрузке каталога: заголовок X-Export-Token
+    с одним из токенов STORE_EXPORT_TOKENS (без пользователя в БД).
+    """
+
+    def has_permission(self, request, view):
+        token = request.META.get('HTTP_X_EXPORT_TOKEN', '')
+        if not token:
+            return False
+        return any(
+            hmac.compare_digest(token.encode(), allowed.encode())
+            for allowed in getattr(settings, 'STORE_EXPORT_TOKENS', [])
+        )
@@ -0,0 +1,140 @@
+"""
+Рейтинг популярности товаров (Product.popularity, индексированная колонка).
+
+    popularity = SALE * продажи + WISHLIST * добавления в избранное + VIEW * просмотры
+
+каждое событие весит 0.5 ** (возраст / HALF_LIFE_DAYS), то есть свежие
+продажи важнее старых. Считает recalculate() (команда recalculate_popularity
+по крону): строки заказов за WINDOW_DAYS и избранное читаются keyset-пачками
+по id, в памяти только {товар: сумма} - объем не зависит от числа строк.
+
+Просмотры карточки в запросе только увеличивают счетчик в кэше
+(record_view); при пересчете накопленное переносится в
+Product.popularity_views, а старое значение затухает так же, как продажи.
+Счетчики должен видеть процесс пересчета, поэтому кэш нужен общий (Redis,
+REDIS_URL): с локальным кэшем просмотры копятся в воркерах и не учитываются.
+Время прошлого пересчета (от него считается затухание) - в БД, PopularityRun.
+
+Каталог сортируется по ?ordering=-popularity, бестселлеры категории -
+GET /api/store/categories/{slug}/bestsellers/.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from cart.models import Wishlist
+from orders.models import OrderItem
+from .cache import bump_catalog_version
+from .models import Product, PopularityRun
+
+logger = logging.getLogger(__name__)
+
+_DEFAULTS = {
+    'half_life_days': 14,
+    # Продажи старше весят меньше 1/80 и не читаются
+    'window_days': 90,
+    'sale': 1.0,
+    'wishlist': 0.5,
+    'view': 0.02,
+}
+POPULARITY = {**_DEFAULTS, **getattr(settings, 'STORE_POPULARITY', {})}
+
+VIEWS_KEY = 'popularity:views:{}'
+CANCELED = 'canceled'
+
+
+def record_view(product_id):
+    """Просмотр карточки: один incr в общем кэше, без записи в БД"""
+    key = VIEWS_KEY.format(product_id)
+    try:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+    except Exception:
+        logger.warning("Кэш недоступен, просмотр не учтен", exc_info=True)
+
+
+def decay(age_seconds, half_life_days=None):
+    half_life = (half_life_days or POPULARITY['half_life_days']) * 24 * 60 * 60
+    return 0.5 ** (max(age_seconds, 0) / half_life)
+
+
+def _iter_chunks(queryset, fields, chunk_size):
+    """values_list пачками по id: WHERE id > последний ORDER BY id LIMIT n"""
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', *fields)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1][0]
+
+
+def _add_events(scores, events, weight, now):
+    """events: (товар, количество, когда)"""
+    for product_id, quantity, created_at in events:
+        if product_id is not None:
+            age = (now - created_at).total_seconds()
+            scores[product_id] = scores.get(product_id, 0) + weight * quantity * decay(age)
+
+
+def collect_scores(now=None, chunk_size=5000):
+    """{product_id: продажи + избранное} с затуханием; просмотры добавляются отдельно"""
+    now = now or timezone.now()
+    since = now - timedelta(days=POPULARITY['window_days'])
+    scores = {}
+
+    lines = OrderItem.objects.filter(order__created_at__gte=since).exclude(order__status=CANCELED)
+    for rows in _iter_chunks(lines, ['product_id', 'quantity', 'order__created_at'], chunk_size):
+        _add_events(scores, (row[1:] for row in rows), POPULARITY['sale'], now)
+
+    for rows in _iter_chunks(Wishlist.objects.all(), ['product_id', 'added_at'], chunk_size):
+        _add_events(scores, ((product_id, 1, added_at) for _, product_id, added_at in rows), POPULARITY['wishlist'], now)
+    return scores
+
+
+def _take_views(product_ids):
+    """Забирает накопленные в кэше просмотры: {product_id: n}"""
+    keys = {VIEWS_KEY.format(pk): pk for pk in product_ids}
+    try:
+        values = cache.get_many(list(keys))
+        for key, count in values.items():
+            if count:
+                # decr, а не delete: просмотры, пришедшие после get_many, не теряются
+                cache.decr(key, count)
+    except Exception:
+        logger.warning("Кэш недоступен, просмотры не учтены", exc_info=True)
+        return {}
+    return {keys[key]: count for key, count in values.items() if count}
+
+
+def recalculate(chunk_size=5000, now=None):
+    """
+    Пересчитывает popularity всех товаров. Товары идут пачками по id,
+    пишутся только изменившиеся (bulk_update). Возвращает число обновленных.
+    """
+    now = now or timezone.now()
+    scores = collect_scores(now, chunk_size)
+
+    last_run = PopularityRun.objects.first()
+    views_decay = decay((now - last_run.ran_at).total_seconds()) if last_run else 1.0
+
+    updated = 0
+    for rows in _iter_chunks(Product.objects.all(), ['popularity', 'popularity_views'], chunk_size):
+        fresh_views = _take_views([row[0] for row in rows])
+        changed = []
+        for pk, old_popularity, old_views in rows:
+            views = round(old_views * views_decay + fresh_views.get(pk, 0), 4)
+            popularity = round(scores.get(pk, 0) + POPULARITY['view'] * views, 4)
+            if popularity != old_popularity or views != old_views:
+                changed.append(Product(pk=pk, popularity=popularity, popularity_views=views))
+        Product.objects.bulk_update(changed, ['popularity', 'popularity_views'])
+        updated += len(changed)
+
+    PopularityRun.objects.create(ran_at=now, updated=updated)
+    if updated:
+        # bulk_update без сигналов, а порядок в каталоге поменялся
+        bump_catalog_version()
+    return updated
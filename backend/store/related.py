@@ -0,0 +1,261 @@
+"""
+"Часто покупают вместе": рекомендации по совместным покупкам.
+
+Офлайн-задача (команда build_related_products) читает строки заказов
+пачками по id заказа, для каждого заказа считает пары товаров в Counter
+(разреженная матрица совместной встречаемости: только ненулевые ячейки,
+одна сторона пары), затем для каждого товара оставляет TOP_N соседей по
+
+    score = вместе / sqrt(заказов с A * заказов с B)
+
+(косинусная мера: хиты, которые лежат в каждом заказе, не вытесняют
+действительно связанные товары). Результат - RelatedProduct с rank,
+эндпоинт /products/{slug}/related/ читает его одним запросом по индексу.
+
+Полные счетчики пар хранятся в ProductPair, поэтому заказы учитываются
+инкрементально (update): прибавляются их пары, и топ пересчитывается
+только для затронутых товаров. Знаменатель у соседей, которых новые
+заказы не коснулись, при этом не обновляется - полный пересчет (--full)
+раз в сутки/неделю это выравнивает.
+
+Какие заказы уже учтены, хранит RelatedProductsOrder. update() читает
+заказы, измененные (Order.updated_at) после прошлого прохода с запасом
+OVERLAP - так не теряются заказы, закоммиченные позже соседних, - и
+сверяет с учтенными: новые и возвращенные из отмены добавляет, отмененные
+вычитает, уже учтенные пропускает. queryset.update(status=...) updated_at
+не трогает - такие изменения выравнивает полный пересчет.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import combinations
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When, Value, F, IntegerField
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+from .cache import bump_catalog_version
+from .models import ProductPair, RelatedProduct, RelatedProductsBuild, RelatedProductsOrder
+
+TOP_N = getattr(settings, 'STORE_RELATED_TOP_N', 10)
+# Пара, встретившаяся в одном заказе, - случайность
+MIN_SUPPORT = getattr(settings, 'STORE_RELATED_MIN_SUPPORT', 2)
+# Оптовые заказы дают k^2 пар и ничего не говорят о связанности товаров
+MAX_BASKET_SIZE = 50
+CANCELED = 'canceled'
+WRITE_BATCH = 5000
+# По сколько товаров пересобирать топ в инкрементальном режиме
+REFRESH_BATCH = 500
+# Запас назад от прошлого прохода, секунд: дольше любой транзакции оформления заказа
+OVERLAP = getattr(settings, 'STORE_RELATED_OVERLAP', 60 * 60)
+
+
+def load_baskets(order_ids):
+    """{id заказа: множество товаров} одним запросом по строкам заказов"""
+    baskets = defaultdict(set)
+    rows = (
+        OrderItem.objects.filter(order_id__in=order_ids, product__isnull=False)
+        .values_list('order_id', 'product_id').order_by()
+    )
+    for order_id, product_id in rows:
+        baskets[order_id].add(product_id)
+    return baskets
+
+
+def iter_baskets(chunk_size=5000):
+    """
+    Пачки (id заказов, [множества товаров заказов]) по всем неотмененным заказам.
+    Заказы выбираются по id (WHERE id > ... LIMIT), их строки - одним запросом.
+    """
+    after_order_id = 0
+    while True:
+        order_ids = list(
+            Order.objects.filter(pk__gt=after_order_id).exclude(status=CANCELED)
+            .order_by('pk').values_list('pk', flat=True)[:chunk_size]
+        )
+        if not order_ids:
+            return
+        after_order_id = order_ids[-1]
+        yield order_ids, list(load_baskets(order_ids).values())
+
+
+def count_pairs(baskets, counts, sign=1):
+    """counts[(a, b)] += sign для пар a < b и counts[(a, a)] - заказы с товаром"""
+    for basket in baskets:
+        if len(basket) > MAX_BASKET_SIZE:
+            continue
+        products = sorted(basket)
+        for product_id in products:
+            counts[(product_id, product_id)] += sign
+        for pair in combinations(products, 2):
+            counts[pair] += sign
+
+
+def top_related(pair_counts, product_counts, symmetric=True):
+    """
+    {товар: [(score, вместе, сосед), ...] по убыванию}. symmetric - в
+    pair_counts пары в одну сторону (a < b, как после count_pairs), иначе
+    только строки "товар -> сосед" (как в ProductPair).
+    """
+    neighbours = defaultdict(list)
+    for (a, b), together in pair_counts.items():
+        if a == b or together < MIN_SUPPORT:
+            continue
+        score = together / math.sqrt(product_counts[a] * product_counts[b])
+        neighbours[a].append((score, together, b))
+        if symmetric:
+            neighbours[b].append((score, together, a))
+    return {
+        product_id: heapq.nlargest(TOP_N, candidates)
+        for product_id, candidates in neighbours.items()
+    }
+
+
+def _related_rows(top):
+    return [
+        RelatedProduct(product_id=product_id, related_id=other_id, rank=rank, score=round(score, 6), orders=together)
+        for product_id, candidates in top.items()
+        for rank, (score, together, other_id) in enumerate(candidates, start=1)
+    ]
+
+
+def _pair_rows(counts):
+    for (a, b), together in counts.items():
+        yield ProductPair(product_id=a, other_id=b, count=together)
+        if a != b:
+            yield ProductPair(product_id=b, other_id=a, count=together)
+
+
+def _bulk_create(model, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= WRITE_BATCH:
+            model.objects.bulk_create(batch)
+            batch = []
+    model.objects.bulk_create(batch)
+
+
+def build(chunk_size=5000, progress=None):
+    """Полный пересчет: все заказы, таблицы заменяются в одной транзакции"""
+    started = timezone.now()
+    counts = Counter()
+    counted = []
+    for order_ids, baskets in iter_baskets(chunk_size):
+        count_pairs(baskets, counts)
+        counted += order_ids
+        if progress:
+            progress(len(counted))
+
+    product_counts = {a: together for (a, b), together in counts.items() if a == b}
+    top = top_related(counts, product_counts)
+
+    with transaction.atomic():
+        ProductPair.objects.all().delete()
+        _bulk_create(ProductPair, _pair_rows(counts))
+        RelatedProduct.objects.all().delete()
+        _bulk_create(RelatedProduct, _related_rows(top))
+        RelatedProductsOrder.objects.all().delete()
+        _bulk_create(RelatedProductsOrder, (RelatedProductsOrder(order_id=pk) for pk in counted))
+        RelatedProductsBuild.objects.create(scanned_until=started, is_full=True, orders=len(counted))
+    bump_catalog_version()
+    return len(counted), len(top)
+
+
+def _add_pair_counts(counts):
+    """Прибавляет counts к ProductPair: вставка недостающих строк и UPDATE на каждый товар"""
+    by_product = defaultdict(dict)
+    for pair in _pair_rows(counts):
+        by_product[pair.product_id][pair.other_id] = pair.count
+
+    ProductPair.objects.bulk_create(
+        [ProductPair(product_id=a, other_id=b) for a, others in by_product.items() for b in others],
+        ignore_conflicts=True, batch_size=WRITE_BATCH,
+    )
+    for product_id, others in by_product.items():
+        ProductPair.objects.filter(product_id=product_id, other_id__in=others.keys()).update(
+            count=F('count') + Case(
+                *[When(other_id=other_id, then=Value(delta)) for other_id, delta in others.items()],
+                default=Value(0), output_field=IntegerField(),
+            )
+        )
+    return set(by_product)
+
+
+def _refresh_top(product_ids):
+    """Пересобирает топ для товаров по сохраненным счетчикам ProductPair"""
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), REFRESH_BATCH):
+        chunk = set(product_ids[start:start + REFRESH_BATCH])
+        pair_counts = {
+            (a, b): together
+            for a, b, together in ProductPair.objects.filter(product_id__in=chunk).values_list('product_id', 'other_id', 'count')
+        }
+        involved = {b for _, b in pair_counts} | chunk
+        product_counts = dict(
+            ProductPair.objects.filter(product_id__in=involved, other_id=F('product_id')).values_list('product_id', 'count')
+        )
+        top = top_related(pair_counts, product_counts, symmetric=False)
+        RelatedProduct.objects.filter(product_id__in=chunk).delete()
+        RelatedProduct.objects.bulk_create(_related_rows(top))
+
+
+def iter_changed_orders(since, chunk_size=5000):
+    """Пачки [(id, статус)] заказов, измененных с since, по id"""
+    after_order_id = 0
+    while True:
+        rows = list(
+            Order.objects.filter(updated_at__gte=since, pk__gt=after_order_id)
+            .order_by('pk').values_list('pk', 'status')[:chunk_size]
+        )
+        if not rows:
+            return
+        after_order_id = rows[-1][0]
+        yield rows
+
+
+def update(chunk_size=5000, progress=None):
+    """
+    Инкрементальный режим: заказы, измененные после прошлого прохода (с запасом OVERLAP).
+    Без предыдущего пересчета - полный build(). Возвращает (учтено/вычтено заказов, товаров с обновленным топом).
+    """
+    last_build = RelatedProductsBuild.objects.first()
+    if last_build is None:
+        return build(chunk_size, progress)
+
+    started = timezone.now()
+    since = last_build.scanned_until - timedelta(seconds=OVERLAP)
+    orders = 0
+    affected = set()
+    for rows in iter_changed_orders(since, chunk_size):
+        counted = set(
+            RelatedProductsOrder.objects.filter(order_id__in=[pk for pk, _ in rows]).values_list('order_id', flat=True)
+        )
+        added = [pk for pk, status in rows if status != CANCELED and pk not in counted]
+        removed = [pk for pk, status in rows if status == CANCELED and pk in counted]
+        if not added and not removed:
+            continue
+        baskets = load_baskets(added + removed)
+        counts = Counter()
+        count_pairs((baskets[pk] for pk in added), counts)
+        count_pairs((baskets[pk] for pk in removed), counts, sign=-1)
+        # Счетчики, топ и учтенные заказы - одной транзакцией: после сбоя пачка просто повторится
+        with transaction.atomic():
+            chunk_affected = _add_pair_counts(counts)
+            _refresh_top(chunk_affected)
+            RelatedProductsOrder.objects.bulk_create(
+                [RelatedProductsOrder(order_id=pk) for pk in added], ignore_conflicts=True
+            )
+            RelatedProductsOrder.objects.filter(order_id__in=removed).delete()
+        affected |= chunk_affected
+        orders += len(added) + len(removed)
+        if progress:
+            progress(orders)
+
+    RelatedProductsBuild.objects.create(scanned_until=started, orders=orders)
+    if affected:
+        bump_catalog_version()
+    return orders, len(affected)
@@ -0,0 +1,218 @@
+"""
+Полнотекстовый поиск по товарам.
+
+Индекс хранится отдельно от таблицы товаров и обновляется сигналами
+(см. store/signals.py). Текст перед индексацией режется на слова и
+прогоняется через стеммер для русского языка, поэтому "смартфоны"
+и "смартфона" находятся по одному запросу.
+
+Бэкенд выбирается настройкой STORE_SEARCH_BACKEND (путь до класса).
+По умолчанию на SQLite используется FTS5, на остальных БД - простой
+icontains-поиск, пока не подключен свой бэкенд.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+
+# --- Токенизация и стемминг ---
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+_CYRILLIC_RE = re.compile(r'[а-я]')
+
+# Стеммер Портера (Snowball) для русского языка
+_RV_RE = re.compile(r'^(.*?[аеиоуыэюя])(.*)$')
+_PERFECTIVE_GERUND_RE = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+_REFLEXIVE_RE = re.compile(r'(с[яь])$')
+_ADJECTIVE_RE = re.compile(r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$')
+_PARTICIPLE_RE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+_VERB_RE = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+_NOUN_RE = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+_I_RE = re.compile(r'и$')
+_SOFT_SIGN_RE = re.compile(r'ь$')
+_NN_RE = re.compile(r'нн$')
+_DERIVATIONAL_RE = re.compile(r'.*[^аеиоуыэюя]+[аеиоуыэюя].*ость?$')
+_DERIVATIONAL_SUFFIX_RE = re.compile(r'ость?$')
+_SUPERLATIVE_RE = re.compile(r'(ейше|ейш)$')
+
+
+def stem_russian(word):
+    """Отрезает окончание у русского слова (слово уже в нижнем регистре)"""
+    match = _RV_RE.match(word)
+    if not match:
+        return word
+    start, rv = match.groups()
+
+    rv, found = _PERFECTIVE_GERUND_RE.subn('', rv)
+    if not found:
+        rv = _REFLEXIVE_RE.sub('', rv)
+        rv, found = _ADJECTIVE_RE.subn('', rv)
+        if found:
+            rv = _PARTICIPLE_RE.sub('', rv)
+        else:
+            rv, found = _VERB_RE.subn('', rv)
+            if not found:
+                rv = _NOUN_RE.sub('', rv)
+
+    rv = _I_RE.sub('', rv)
+
+    if _DERIVATIONAL_RE.match(rv):
+        rv = _DERIVATIONAL_SUFFIX_RE.sub('', rv)
+
+    without_soft_sign = _SOFT_SIGN_RE.sub('', rv)
+    if without_soft_sign == rv:
+        rv = _SUPERLATIVE_RE.sub('', rv)
+        rv = _NN_RE.sub('н', rv)
+    else:
+        rv = without_soft_sign
+
+    return start + rv
+
+
+def tokenize(text):
+    """Разбивает текст на нормализованные термы (нижний регистр, ё -> е, стемминг)"""
+    tokens = []
+    for word in _WORD_RE.findall((text or '').lower().replace('ё', 'е')):
+        if _CYRILLIC_RE.search(word):
+            word = stem_russian(word)
+        if word:
+            tokens.append(word)
+    return tokens
+
+
+# --- Бэкенды ---
+
+class BaseSearchBackend:
+    """Интерфейс поискового бэкенда. Все методы работают с товарами (store.Product)."""
+
+    def index(self, products):
+        """Добавляет или обновляет товары в индексе"""
+        raise NotImplementedError
+
+    def remove(self, product_ids):
+        """Удаляет товары из индекса"""
+        raise NotImplementedError
+
+    def clear(self):
+        """Полностью очищает индекс (перед переиндексацией)"""
+        raise NotImplementedError
+
+    def filter_queryset(self, queryset, query):
+        """
+        Товары queryset, подходящие под query, с аннотацией search_rank
+        (меньше - релевантнее). Поиск идет в том же SQL, что и остальные
+        фильтры, поэтому совпадения не обрезаются до фильтрации.
+        """
+        raise NotImplementedError
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Запасной вариант без отдельного индекса: icontains по названию и описанию.
+    Релевантность: сначала совпадения в названии.
+    """
+
+    def index(self, products):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def filter_queryset(self, queryset, query):
+        if not query.split():
+            return queryset.none()
+        in_name = Q()
+        in_any = Q()
+        for word in query.split():
+            in_name &= Q(name__icontains=word)
+            in_any &= Q(name__icontains=word) | Q(description__icontains=word)
+        return queryset.filter(in_any).annotate(search_rank=Case(
+            When(in_name, then=Value(0)), default=Value(1), output_field=IntegerField(),
+        ))
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    Индекс на виртуальной таблице SQLite FTS5 (создается миграцией).
+    В таблицу пишутся уже простеммированные термы, rowid = id товара.
+    Ранжирование - bm25, совпадение в названии весит больше описания.
+    """
+    table = 'store_product_fts'
+    name_weight = 10.0
+    description_weight = 1.0
+
+    def index(self, products):
+        rows = [
+            (product.pk, ' '.join(tokenize(product.name)), ' '.join(tokenize(product.description)))
+            for product in products
+        ]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(row[0],) for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, name, description) VALUES (%s, %s, %s)', rows
+            )
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', [(pk,) for pk in product_ids])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def build_match_query(self, query):
+        # Каждый терм - префиксный запрос в кавычках, термы через AND.
+        # Префикс нужен для поиска "на лету", пока слово еще не допечатано.
+        terms = tokenize(query)
+        return ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+    def filter_queryset(self, queryset, query):
+        match = self.build_match_query(query)
+        if not match:
+            return queryset.none()
+        # Фильтр - подзапрос к индексу (работает и внутри других подзапросов, например
+        # фасетов), ранг - коррелированный bm25: FTS5 ищет по rowid внутри совпадений
+        table = connection.ops.quote_name(queryset.model._meta.db_table)
+        return queryset.filter(
+            pk__in=RawSQL(f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [match])
+        ).annotate(search_rank=RawSQL(
+            f'SELECT bm25({self.table}, %s, %s) FROM {self.table} '
+            f'WHERE {self.table} MATCH %s AND rowid = {table}.id',
+            [self.name_weight, self.description_weight, match],
+            output_field=FloatField(),
+        ))
+
+
+_backend = None
+
+
+def get_search_backend():
+    """Текущий поисковый бэкенд (создается один раз на процесс)"""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'STORE_SEARCH_BACKEND', None)
+        if path:
+            backend_class = import_string(path)
+        elif connection.vendor == 'sqlite':
+            backend_class = SQLiteFTSBackend
+        else:
+            backend_class = DatabaseSearchBackend
+        _backend = backend_class()
+    return _backend
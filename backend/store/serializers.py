@@ -1,12 +1,16 @@
 from rest_framework import serializers
 from .models import *
+from cart.utils import get_user_product_flags
+from cart.reservations import get_available_stock
+from .images import LIST_IMAGE_VARIANT
 
 # --- Вспомогательные сериализаторы ---
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    # WebP-варианты (store/images.py); null, пока не посчитаны
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'is_main']
+        fields = ['id', 'image', 'is_main', 'thumbnail', 'medium', 'large']
 
 class BrandSerializer(serializers.ModelSerializer):
     class Meta:
@@ -23,15 +27,73 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = ['id', 'name', 'slug', 'image', 'parent', 'children']
 
+    def validate_parent(self, parent):
+        # DRF не вызывает Category.clean(), а ValidationError из save() стал бы 500
+        if self.instance is not None and parent is not None and self.instance.parent_makes_cycle(parent.pk):
+            raise serializers.ValidationError(Category.PARENT_CYCLE_MESSAGE)
+        return parent
+
     def get_children(self, obj):
-        # Возвращаем только прямых потомков
-        if obj.children.exists():
-            return CategorySerializer(obj.children.all(), many=True, context=self.context).data
-        return []
+        # Возвращаем только прямых потомков.
+        # Если вьюха заранее загрузила дерево одним запросом (children_map),
+        # берем детей из памяти, иначе - запрос к БД.
+        children_map = self.context.get('children_map')
+        if children_map is not None:
+            children = children_map.get(obj.pk, [])
+        else:
+            children = obj.children.all()
+        if not children:
+            return []
+        return CategorySerializer(children, many=True, context=self.context).data
 
 # --- Сериализаторы Товаров ---
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductFlagsMixin:
+    """
+    Флаги is_in_cart / is_in_wishlist для текущего пользователя.
+    Множества id из корзины и избранного берутся один раз на весь ответ
+    и кладутся в общий контекст, каталог при этом не зависит от пользователя.
+    """
+
+    def get_product_flags(self):
+        flags = self.context.get('product_flags')
+        if flags is None:
+            request = self.context.get('request')
+            flags = get_user_product_flags(getattr(request, 'user', None))
+            self.context['product_flags'] = flags
+        return flags
+
+    def get_is_in_cart(self, obj):
+        return obj.pk in self.get_product_flags()[0]
+
+    def get_is_in_wishlist(self, obj):
+        return obj.pk in self.get_product_flags()[1]
+
+
+def prefetch_available_stock(context, products):
+    """Кладет в контекст свободные остатки сразу для всех товаров ответа"""
+    available = context.setdefault('available_stock', {})
+    missing = [product for product in products if product.pk not in available]
+    if missing:
+        available.update(get_available_stock(missing))
+
+
+class AvailableStockMixin:
+    """
+    available - сколько можно положить в корзину: stock минус брони корзин
+    (cart/reservations.py). Брони читаются из счетчиков в кэше, без агрегатов
+    в SQL; для списков - одним get_many на страницу.
+    Брони меняются без версии каталога, поэтому в кэшируемые ответы каталога
+    (и их ETag) available не входит: его отдают корзина и
+    GET /api/store/products/availability/?ids=...
+    """
+
+    def get_available(self, obj):
+        prefetch_available_stock(self.context, [obj])
+        return self.context['available_stock'][obj.pk]
+
+
+class ProductListSerializer(ProductFlagsMixin, serializers.ModelSerializer):
     """
     Облегченный сериализатор для списков (каталога).
     Возвращает только главную картинку и основные цены.
@@ -40,25 +102,31 @@ class ProductListSerializer(serializers.ModelSerializer):
     brand = serializers.CharField(source='brand.name', default=None)
     main_image = serializers.SerializerMethodField()
     price_display = serializers.DecimalField(source='current_price', max_digits=10, decimal_places=2, read_only=True)
+    is_in_cart = serializers.SerializerMethodField()
+    is_in_wishlist = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = ['id', 'name', 'slug', 'price', 'discount_price', 'price_display', 
-                  'category', 'brand', 'main_image', 'stock', 'is_active']
+                  'category', 'brand', 'main_image', 'stock', 'is_active',
+                  'is_in_cart', 'is_in_wishlist']
 
     def get_main_image(self, obj):
-        # Ищем картинку с флагом is_main, иначе берем первую попавшуюся
-        main_img = obj.images.filter(is_main=True).first()
-        if not main_img:
-            main_img = obj.images.first()
-        
+        # Главное фото денормализовано в Product.main_image (is_main, иначе первое).
+        # В querysets списков нужен select_related('main_image'), тогда запросов нет.
+        if obj.main_image_id is None:
+            return None
+        main_img = obj.main_image
+
         if main_img:
+            # Уменьшенная копия вместо оригинала, пока ее нет - оригинал
+            url = main_img.get_variant(LIST_IMAGE_VARIANT).url
             # Возвращаем полный URL
             request = self.context.get('request')
-            return request.build_absolute_uri(main_img.image.url) if request else main_img.image.url
+            return request.build_absolute_uri(url) if request else url
         return None
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class ProductDetailSerializer(ProductFlagsMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     brand = BrandSerializer(read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
@@ -75,8 +143,8 @@ class ProductDetailSerializer(serializers.ModelSerializer):
         required=False
     )
 
-    is_in_cart = serializers.BooleanField(read_only=True)
-    is_in_wishlist = serializers.BooleanField(read_only=True)
+    is_in_cart = serializers.SerializerMethodField()
+    is_in_wishlist = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
@@ -97,4 +165,12 @@ class ProductDetailSerializer(serializers.ModelSerializer):
         
         for img in uploaded_images:
             ProductImage.objects.create(product=product, image=img)
-        return product
\ No newline at end of file
+        return product
+
+
+class CartProductSerializer(AvailableStockMixin, ProductListSerializer):
+    """Товар в корзине: как в каталоге плюс свободный остаток (ответ не кэшируется)"""
+    available = serializers.SerializerMethodField()
+
+    class Meta(ProductListSerializer.Meta):
+        fields = ProductListSerializer.Meta.fields + ['available']
\ No newline at end of file
@@ -0,0 +1,86 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import suggest
+from .cache import bump_catalog_version
+from .models import Product, ProductImage, ProductAttribute, Brand, Category
+from .search import get_search_backend
+
+
+# --- Поисковый индекс ---
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    get_search_backend().index([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+# --- Подсказки (автодополнение) ---
+
+@receiver(post_save, sender=Product)
+def suggest_product(sender, instance, **kwargs):
+    suggest.update_object(suggest.PRODUCT, instance.pk, instance.name, instance.slug, active=instance.is_active)
+
+
+@receiver(post_save, sender=Brand)
+def suggest_brand(sender, instance, **kwargs):
+    suggest.update_object(suggest.BRAND, instance.pk, instance.name, instance.slug)
+
+
+@receiver(post_save, sender=Category)
+def suggest_category(sender, instance, **kwargs):
+    suggest.update_object(suggest.CATEGORY, instance.pk, instance.name, instance.slug)
+
+
+@receiver(post_delete, sender=Product)
+def unsuggest_product(sender, instance, **kwargs):
+    suggest.remove_object(suggest.PRODUCT, instance.pk)
+
+
+@receiver(post_delete, sender=Brand)
+def unsuggest_brand(sender, instance, **kwargs):
+    suggest.remove_object(suggest.BRAND, instance.pk)
+
+
+@receiver(post_delete, sender=Category)
+def unsuggest_category(sender, instance, **kwargs):
+    suggest.remove_object(suggest.CATEGORY, instance.pk)
+
+
+# --- Индекс характеристик (фасеты) ---
+
+@receiver(post_save, sender=Product)
+def index_product_attributes(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    ProductAttribute.rebuild_for(instance)
+
+
+# --- Главное фото товара ---
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def refresh_product_main_image(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    Product.refresh_main_image(instance.product_id)
+
+
+# --- Версия каталога (кэш ответов) ---
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
@@ -0,0 +1,169 @@
+"""
+Контентно-адресуемое хранилище медиа (STORAGES['default']).
+
+Имя файла - sha256 содержимого: cas/ab/cd/abcd...ef.jpg. Одинаковое фото,
+загруженное к десятку вариантов товара (или как аватар и фото товара),
+лежит на диске один раз, а все строки ссылаются на один путь. Содержимое
+по пути никогда не меняется, поэтому /media/cas/ можно кэшировать навсегда
+(Cache-Control: immutable). На проде это делает nginx:
+
+    location /media/cas/ {
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
+в DEBUG - serve_media ниже. upload_to полей на путь больше не влияет.
+
+Файлы при удалении/замене картинки не удаляются (блоб может быть нужен
+другим строкам). Ссылки считает команда gc_media_blobs: проходит все
+файловые поля моделей на этом хранилище и удаляет блобы, на которые
+никто не ссылается дольше MEDIA_GC_GRACE. Старые файлы (avatars/...,
+products/...) переносит в cas/ команда adopt_media_blobs.
+"""
+import hashlib
+import os
+import time
+import uuid
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import models
+from django.views.static import serve
+
+PREFIX = 'cas/'
+# Блоб без ссылок живет столько секунд: строка с новой загрузкой могла еще не закоммититься
+GC_GRACE = getattr(settings, 'MEDIA_GC_GRACE', 60 * 60 * 24)
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def blob_name(digest, ext):
+    return f"{PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{ext}"
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(PREFIX)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, который кладет файл по хэшу содержимого"""
+
+    def get_available_name(self, name, max_length=None):
+        # Имя все равно заменит хэш, суффиксы _NuKS4Gx не нужны
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+        ext = os.path.splitext(name)[1].lower()[:10]
+        name = blob_name(digest.hexdigest(), ext)
+        if self.exists(name):
+            # Блоб переиспользован - обновляем mtime, чтобы сборщик мусора
+            # не удалил его, пока строка с новой ссылкой не закоммичена
+            os.utime(self.path(name))
+            return name
+
+        # Пишем во временный файл рядом и атомарно переименовываем: параллельная
+        # загрузка того же файла не увидит недописанный блоб, а гонка двух
+        # записей безвредна - содержимое одинаковое
+        tmp_name = super()._save(f"{name}.{uuid.uuid4().hex}.tmp", content)
+        os.replace(self.path(tmp_name), self.path(name))
+        return name
+
+
+def referencing_fields():
+    """(модель, поле) для всех файловых полей на контентно-адресуемом хранилище"""
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, models.FileField) and isinstance(field.storage, ContentAddressedStorage):
+                yield model, field
+
+
+def blob_refcounts(chunk_size=2000):
+    """Counter {имя блоба: число ссылок} по всем полям, без загрузки моделей"""
+    refcounts = Counter()
+    for model, field in referencing_fields():
+        names = (
+            model._default_manager.filter(**{f'{field.attname}__startswith': PREFIX})
+            .values_list(field.attname, flat=True)
+            .iterator(chunk_size=chunk_size)
+        )
+        refcounts.update(names)
+    return refcounts
+
+
+def collect_garbage(storage=None, grace=GC_GRACE, dry_run=False, chunk_size=2000):
+    """
+    Удаляет блобы без ссылок старше grace секунд (и брошенные .tmp).
+    Возвращает (удалено файлов, освобождено байт).
+    """
+    storage = storage or default_storage
+    referenced = blob_refcounts(chunk_size)
+    root = storage.path(PREFIX)
+    deadline = time.time() - grace
+    removed = freed = 0
+
+    for directory, _, files in os.walk(root):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            if name in referenced:
+                continue
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime > deadline:
+                    continue
+                if not dry_run:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += stat.st_size
+    return removed, freed
+
+
+def adopt_legacy_files(storage=None, batch_size=500):
+    """
+    Переносит файлы со старыми путями (avatars/..., products/...) в cas/ и
+    переписывает ссылки пачками через bulk_update. Одинаковые файлы
+    схлопываются в один блоб. Возвращает (перенесено, не найдено, старые имена) -
+    старые файлы удаляет вызывающий, когда ссылок на них уже нет.
+    """
+    storage = storage or default_storage
+    adopted = missing = 0
+    legacy = set()
+    for model, field in referencing_fields():
+        queryset = (
+            model._default_manager.exclude(**{f'{field.attname}__startswith': PREFIX})
+            .exclude(**{field.attname: ''}).exclude(**{f'{field.attname}__isnull': True})
+            .order_by('pk')
+        )
+        last_pk = None
+        while True:
+            chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            rows = list(chunk.values_list('pk', field.attname)[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            updated = []
+            for pk, name in rows:
+                try:
+                    with storage.open(name) as file:
+                        new_name = storage.save(name, file)
+                except FileNotFoundError:
+                    missing += 1
+                    continue
+                legacy.add(name)
+                updated.append(model(pk=pk, **{field.attname: new_name}))
+            model._default_manager.bulk_update(updated, [field.name])
+            adopted += len(updated)
+    return adopted, missing, legacy
+
+
+def serve_media(request, path, document_root=None, show_indexes=False):
+    """django.views.static.serve + вечный кэш для cas/ (только DEBUG)"""
+    response = serve(request, path, document_root=document_root, show_indexes=show_indexes)
+    if is_blob(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
@@ -0,0 +1,218 @@
+"""
+Подсказки для строки поиска (автодополнение).
+
+Индекс живет в памяти процесса: отсортированный список записей
+(нормализованный текст, тип, id) и поиск префикса через bisect.
+Строится одним проходом по БД при первом запросе, дальше обновляется
+сигналами (store/signals.py), так что сам поиск в БД не ходит.
+
+Каждый процесс держит свою копию индекса, а сигналы видит только свои -
+изменения из других воркеров, админки и bulk-операций до него не доходят.
+Поэтому индекс помнит версию подсказок (store/cache.py, меняется только при
+правке товаров, брендов и категорий, но не при заказах), с которой построен.
+Когда она поменялась, индекс перестраивается в фоновом потоке, не чаще
+REBUILD_INTERVAL, а запросы до конца перестройки отвечают по старому.
+Версия должна быть общей для процессов (Redis, REDIS_URL).
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connection
+
+from .cache import get_suggest_version, bump_suggest_version
+
+logger = logging.getLogger(__name__)
+
+
+PRODUCT = 'product'
+BRAND = 'brand'
+CATEGORY = 'category'
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().replace('ё', 'е').split())
+
+
+class PrefixIndex:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = []      # отсортированные (текст, тип, id)
+        self._objects = {}      # (тип, id) -> (название, slug, [ключи записей])
+        self._lock = threading.Lock()
+        self.is_built = False
+        self.version = None     # версия каталога на момент построения
+        self.built_at = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _keys_for(self, kind, obj_id, name):
+        # Название целиком и "хвосты" с начала каждого слова,
+        # чтобы "apple" находил "Смартфон Apple iPhone"
+        words = normalize(name).split(' ')
+        return [(' '.join(words[i:]), kind, obj_id) for i in range(len(words)) if words[i]]
+
+    def _remove_locked(self, kind, obj_id):
+        obj = self._objects.pop((kind, obj_id), None)
+        if obj is None:
+            return
+        for key in obj[2]:
+            position = bisect_left(self._entries, key)
+            if position < len(self._entries) and self._entries[position] == key:
+                del self._entries[position]
+
+    def _add_locked(self, kind, obj_id, name, slug):
+        keys = self._keys_for(kind, obj_id, name)
+        free = self.max_entries - len(self._entries)
+        if free <= 0:
+            return
+        # Лимит памяти: если места мало, храним хотя бы полное название
+        keys = keys[:free]
+        for key in keys:
+            insort(self._entries, key)
+        self._objects[(kind, obj_id)] = (name, slug, keys)
+
+    def add(self, kind, obj_id, name, slug):
+        with self._lock:
+            self._remove_locked(kind, obj_id)
+            self._add_locked(kind, obj_id, name, slug)
+
+    def remove(self, kind, obj_id):
+        with self._lock:
+            self._remove_locked(kind, obj_id)
+
+    def load(self, objects, version=None):
+        """Полная перестройка из итерируемого (тип, id, название, slug)"""
+        entries = []
+        index = {}
+        for kind, obj_id, name, slug in objects:
+            keys = self._keys_for(kind, obj_id, name)
+            free = self.max_entries - len(entries)
+            if free <= 0:
+                break
+            keys = keys[:free]
+            entries.extend(keys)
+            index[(kind, obj_id)] = (name, slug, keys)
+        entries.sort()
+        with self._lock:
+            self._entries = entries
+            self._objects = index
+            self.is_built = True
+            self.version = version
+            self.built_at = time.monotonic()
+
+    def is_stale(self, version):
+        """Версия менялась после построения и с перестройки прошло REBUILD_INTERVAL"""
+        return (
+            version is not None and version != self.version
+            and time.monotonic() - self.built_at >= REBUILD_INTERVAL
+        )
+
+    def search(self, prefix, limit=10):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        with self._lock:
+            position = bisect_left(self._entries, (prefix,))
+            while position < len(self._entries) and len(results) < limit:
+                text, kind, obj_id = self._entries[position]
+                if not text.startswith(prefix):
+                    break
+                position += 1
+                if (kind, obj_id) in seen:
+                    continue
+                seen.add((kind, obj_id))
+                name, slug, _ = self._objects[(kind, obj_id)]
+                results.append({'type': kind, 'name': name, 'slug': slug})
+        return results
+
+
+# Секунды: каждое сохранение товара меняет версию, а перестройка - проход по всей БД
+REBUILD_INTERVAL = getattr(settings, 'STORE_SUGGEST_REBUILD_INTERVAL', 60)
+
+_index = PrefixIndex(getattr(settings, 'STORE_SUGGEST_MAX_ENTRIES', 200_000))
+_build_lock = threading.Lock()
+
+
+def _load_from_db():
+    from .models import Product, Brand, Category
+
+    for pk, name, slug in Brand.objects.values_list('pk', 'name', 'slug'):
+        yield BRAND, pk, name, slug
+    for pk, name, slug in Category.objects.values_list('pk', 'name', 'slug'):
+        yield CATEGORY, pk, name, slug
+    for pk, name, slug in Product.objects.filter(is_active=True).values_list('pk', 'name', 'slug').iterator():
+        yield PRODUCT, pk, name, slug
+
+
+def rebuild(version=None):
+    """Полная перестройка из БД в текущем потоке"""
+    _index.load(_load_from_db(), version)
+
+
+def rebuild_in_background(version):
+    """Перестройка в отдельном потоке; если уже идет - ничего не делает"""
+    if not _build_lock.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            rebuild(version)
+        except Exception:
+            logger.exception("Не удалось перестроить индекс подсказок")
+        finally:
+            _build_lock.release()
+            # Соединение с БД у потока свое, само оно не закроется
+            connection.close()
+
+    threading.Thread(target=run, name='suggest-rebuild', daemon=True).start()
+
+
+def get_suggest_index():
+    """
+    Индекс подсказок. Первое обращение ждет загрузки из БД, дальше
+    устаревший индекс перестраивается в фоне, а запрос получает текущий.
+    """
+    version = get_suggest_version()
+    if not _index.is_built:
+        with _build_lock:
+            if not _index.is_built:
+                rebuild(version)
+    elif _index.is_stale(version):
+        rebuild_in_background(version)
+    return _index
+
+
+def suggest(query, limit=10):
+    return get_suggest_index().search(query, limit)
+
+
+def _changed():
+    """
+    Своя правка: версия растет для других процессов. Если до нее индекс был
+    актуален, он остается актуальным - изменение уже внесено в память.
+    """
+    version = bump_suggest_version()
+    if isinstance(version, int) and _index.version == version - 1:
+        _index.version = version
+
+
+def update_object(kind, obj_id, name, slug, active=True):
+    """Вызывается из сигналов. Пока индекс не построен, менять в памяти нечего."""
+    if _index.is_built:
+        if active:
+            _index.add(kind, obj_id, name, slug)
+        else:
+            _index.remove(kind, obj_id)
+    _changed()
+
+
+def remove_object(kind, obj_id):
+    if _index.is_built:
+        _index.remove(kind, obj_id)
+    _changed()
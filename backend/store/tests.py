@@ -1,3 +1,747 @@
-from django.test import TestCase
+import base64
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from PIL import Image
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from cart.models import Cart, CartItem, Wishlist
+from cart.reservations import reconcile_counters
+from orders.models import Order, OrderItem
+from orders.services import decrement_stock
+from . import suggest
+from .cache import bump_catalog_version, bump_suggest_version, get_suggest_version
+from .export import iter_products
+from .pagination import KeysetPagination
+from .images import claim_batch, process_batch, process_pending, reset_stale
+from .models import Category, Brand, Product, ProductImage, ProductAttribute, ProductPair, RelatedProduct, RelatedProductsOrder
+from .popularity import POPULARITY, recalculate
+from .related import build, update
+from .storage import PREFIX, collect_garbage, serve_media
+
+
+class CategoryTreeTest(TestCase):
+    """Материализованные пути категорий: перенос поддерева и защита от циклов"""
+
+    def setUp(self):
+        self.electronics = Category.objects.create(name='Электроника', slug='electronics')
+        self.phones = Category.objects.create(name='Телефоны', slug='phones', parent=self.electronics)
+        self.smartphones = Category.objects.create(name='Смартфоны', slug='smartphones', parent=self.phones)
+        self.gadgets = Category.objects.create(name='Гаджеты', slug='gadgets')
+
+    def paths(self):
+        return {slug: (path, depth) for slug, path, depth in Category.objects.values_list('slug', 'path', 'depth')}
+
+    def test_reparent_rewrites_subtree(self):
+        e, p, s, g = (c.pk for c in (self.electronics, self.phones, self.smartphones, self.gadgets))
+        self.assertEqual(self.paths()['smartphones'], (f'{e}/{p}/{s}/', 2))
+
+        self.phones.parent = self.gadgets
+        self.phones.save()
+        self.assertEqual(self.paths(), {
+            'electronics': (f'{e}/', 0),
+            'phones': (f'{g}/{p}/', 1),
+            'smartphones': (f'{g}/{p}/{s}/', 2),
+            'gadgets': (f'{g}/', 0),
+        })
+        self.assertEqual(list(Category.objects.subtree(self.electronics).values_list('slug', flat=True)), ['electronics'])
+
+        # В корень
+        self.phones.parent = None
+        self.phones.save()
+        self.assertEqual(self.paths()['smartphones'], (f'{p}/{s}/', 1))
+
+    def test_category_filter_includes_descendants(self):
+        for slug, category in [('tv', self.electronics), ('nokia', self.phones), ('iphone', self.smartphones), ('watch', self.gadgets)]:
+            Product.objects.create(category=category, name=slug, slug=slug, price=100)
+
+        def slugs(category):
+            response = self.client.get('/api/store/products/', {'category': category})
+            return sorted(row['slug'] for row in response.data['results'])
+
+        self.assertEqual(slugs('electronics'), ['iphone', 'nokia', 'tv'])
+        self.assertEqual(slugs('phones'), ['iphone', 'nokia'])
+        self.assertEqual(slugs('smartphones'), ['iphone'])
+        self.assertEqual(slugs('unknown'), [])
+
+        # После переноса поддерево фильтруется по новым путям
+        self.phones.parent = self.gadgets
+        self.phones.save()
+        self.assertEqual(slugs('electronics'), ['tv'])
+        self.assertEqual(slugs('gadgets'), ['iphone', 'nokia', 'watch'])
+
+    def test_cycles_are_rejected(self):
+        before = self.paths()
+        for parent in (self.electronics, self.smartphones):
+            self.electronics.parent = parent
+            with self.assertRaises(ValidationError):
+                self.electronics.save()
+        self.assertEqual(self.paths(), before)
+
+        client = APIClient()
+        admin = get_user_model().objects.create_user(
+            email='admin@example.com', username='admin', password='pass', is_staff=True,
+        )
+        client.force_authenticate(admin)
+        response = client.patch('/api/store/categories/electronics/', {'parent': self.smartphones.pk}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('parent', response.data)
+        response = client.patch('/api/store/categories/smartphones/', {'parent': self.gadgets.pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.paths()['smartphones'], (f'{self.gadgets.pk}/{self.smartphones.pk}/', 1))
+
+
+class ProductListQueriesTest(TestCase):
+    """Список товаров не должен делать запросов на каждую строку"""
+
+    def setUp(self):
+        cache.clear()
+        # Счетчики броней прогреты, как на работающем сервере
+        reconcile_counters()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Электроника', slug='electronics')
+
+    def create_product(self, n):
+        product = Product.objects.create(category=self.category, name=f'Товар {n}', slug=f'product-{n}', price=100)
+        ProductImage.objects.create(product=product, image=f'products/{n}-1.jpg')
+        ProductImage.objects.create(product=product, image=f'products/{n}-2.jpg', is_main=True)
+        return product
+
+    def test_main_image_is_maintained(self):
+        product = self.create_product(1)
+        product.refresh_from_db()
+        self.assertEqual(product.main_image.image.name, 'products/1-2.jpg')
+
+        product.main_image.delete()
+        product.refresh_from_db()
+        self.assertEqual(product.main_image.image.name, 'products/1-1.jpg')
+
+    def test_list_runs_constant_number_of_queries(self):
+        self.create_product(1)
+        # COUNT для пагинации + сама выборка
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/store/products/')
+        self.assertTrue(response.data['results'][0]['main_image'].endswith('products/1-2.jpg'))
+
+        for n in range(2, 12):
+            self.create_product(n)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/store/products/')
+        self.assertEqual(len(response.data['results']), 11)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProductFlagsTest(TestCase):
+    """Флаги корзины/избранного считаются одним набором запросов на страницу"""
+
+    def setUp(self):
+        cache.clear()
+        # Счетчики броней прогреты, как на работающем сервере
+        reconcile_counters()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(email='buyer@example.com', username='buyer', password='pass')
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Электроника', slug='electronics')
+        self.products = [
+            Product.objects.create(category=category, name=f'Товар {n}', slug=f'product-{n}', price=100)
+            for n in range(5)
+        ]
+
+    def test_flags_follow_cart_and_wishlist(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.products[0])
+        Wishlist.objects.create(user=self.user, product=self.products[1])
+
+        # COUNT + выборка + корзина + избранное
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/store/products/')
+        flags = {p['slug']: (p['is_in_cart'], p['is_in_wishlist']) for p in response.data['results']}
+        self.assertEqual(flags['product-0'], (True, False))
+        self.assertEqual(flags['product-1'], (False, True))
+        self.assertEqual(flags['product-2'], (False, False))
+
+        # Повторный запрос берет флаги из кэша
+        with self.assertNumQueries(2):
+            self.client.get('/api/store/products/')
+
+        # Изменение корзины сбрасывает кэш
+        CartItem.objects.create(cart=cart, product=self.products[2])
+        response = self.client.get('/api/store/products/product-2/')
+        self.assertTrue(response.data['is_in_cart'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CatalogCacheTest(TestCase):
+    """Анонимные ответы каталога кэшируются до первого изменения каталога"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Электроника', slug='electronics')
+        self.product = Product.objects.create(category=self.category, name='Смартфон', slug='phone', price=100)
+
+    def test_cached_until_catalog_changes(self):
+        self.client.get('/api/store/products/', {'ordering': 'price', 'brand': ''})
+        # Те же параметры в другом порядке - тот же ключ
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/store/products/', {'brand': '', 'ordering': 'price'})
+        self.assertEqual(response.data['results'][0]['price'], '100.00')
+
+        self.product.price = 90
+        self.product.save()
+        response = self.client.get('/api/store/products/', {'ordering': 'price', 'brand': ''})
+        self.assertEqual(response.data['results'][0]['price'], '90.00')
+
+    def test_authenticated_users_bypass_cache(self):
+        self.client.get('/api/store/categories/tree/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/store/categories/tree/')
+
+        user = get_user_model().objects.create_user(email='staff@example.com', username='staff', password='pass')
+        self.client.force_authenticate(user)
+        with self.assertNumQueries(1):
+            self.client.get('/api/store/categories/tree/')
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/store/products/phone/')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+        # Совпавший ETag - 304 без сериализации (только проверка товара)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/store/products/phone/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        etag = self.client.get('/api/store/products/')['ETag']
+        self.assertEqual(self.client.get('/api/store/products/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.product.save()
+        self.assertEqual(self.client.get('/api/store/products/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@mock.patch.object(KeysetPagination, 'page_size', 2)
+class CursorPaginationTest(TestCase):
+    """Keyset-пагинация: стабильный порядок при равных ценах, чужие курсоры и поиск"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Смартфоны', slug='phones')
+        for index, price in enumerate([300, 100, 200, 100, 100]):
+            Product.objects.create(category=category, name=f'Смартфон {index}', slug=f'phone-{index}', price=price)
+
+    def walk(self, **params):
+        response = self.client.get('/api/store/products/', {'pagination': 'cursor', **params})
+        pages = []
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            pages.append([row['slug'] for row in response.data['results']])
+            if not response.data['next']:
+                return pages
+            response = self.client.get(response.data['next'])
+
+    def test_pages_follow_ordering(self):
+        self.assertEqual(self.walk(ordering='price'), [
+            ['phone-1', 'phone-3'], ['phone-4', 'phone-2'], ['phone-0'],
+        ])
+        self.assertEqual(self.walk(ordering='-price'), [
+            ['phone-0', 'phone-2'], ['phone-4', 'phone-3'], ['phone-1'],
+        ])
+
+    def test_foreign_or_broken_cursor_is_404(self):
+        response = self.client.get('/api/store/products/', {'pagination': 'cursor', 'ordering': 'price'})
+        cursor = response.data['next'].split('cursor=')[1]
+        response = self.client.get('/api/store/products/', {'cursor': cursor, 'ordering': '-price'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('/api/store/products/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+        # Подделанные значения: null и NaN
+        for value in (None, 'NaN'):
+            payload = json.dumps(['price', value, 1]).encode()
+            cursor = base64.urlsafe_b64encode(payload).decode().rstrip('=')
+            response = self.client.get('/api/store/products/', {'cursor': cursor, 'ordering': 'price'})
+            self.assertEqual(response.status_code, 404)
+
+    def test_search_is_rejected(self):
+        response = self.client.get('/api/store/products/', {'pagination': 'cursor', 'search': 'смартфон'})
+        self.assertEqual(response.status_code, 400)
+        # Обычная пагинация с поиском работает
+        response = self.client.get('/api/store/products/', {'search': 'смартфон'})
+        self.assertEqual(response.data['count'], 5)
+
+
+class SpecFiltersTest(TestCase):
+    """Фильтры spec.* и фасеты по индексу характеристик"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Смартфоны', slug='phones')
+        for slug, specs in [
+            ('red-light', {'color': 'Red', 'weight': 1}),
+            ('red-heavy', {'color': 'red', 'weight': 5}),
+            ('blue', {'Color': 'Blue', 'weight': 2.5}),
+            ('plain', {}),
+        ]:
+            Product.objects.create(category=category, name=slug, slug=slug, price=100, specifications=specs)
+
+    def get(self, **params):
+        response = self.client.get('/api/store/products/', {'ordering': 'price', **params})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def slugs(self, **params):
+        return sorted(row['slug'] for row in self.get(**params).data['results'])
+
+    def test_spec_filters(self):
+        # Ключи и значения нормализуются, повторы параметра - любое из значений
+        self.assertEqual(self.slugs(**{'spec.color': 'RED'}), ['red-heavy', 'red-light'])
+        self.assertEqual(self.slugs(**{'spec.color': ['red', 'blue']}), ['blue', 'red-heavy', 'red-light'])
+        self.assertEqual(self.slugs(**{'spec.weight__min': '2', 'spec.weight__max': '2,5'}), ['blue'])
+        self.assertEqual(self.slugs(**{'spec.color': 'red', 'spec.weight__min': '2'}), ['red-heavy'])
+        response = self.client.get('/api/store/products/', {'spec.weight__min': 'тяжелый'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_facet_counts_follow_filters(self):
+        facets = self.get(facets='1').data['facets']
+        self.assertEqual(facets['color'], [{'value': 'red', 'count': 2}, {'value': 'blue', 'count': 1}])
+        self.assertEqual(len(facets['weight']), 3)
+
+        facets = self.get(facets='true', **{'spec.weight__max': '2'}).data['facets']
+        self.assertEqual(facets['color'], [{'value': 'red', 'count': 1}])
+
+        for value in ('0', 'false', ''):
+            self.assertNotIn('facets', self.get(facets=value).data)
+
+
+class ProductSearchTest(TestCase):
+    """Полнотекстовый поиск: стемминг, релевантность и фильтры в том же запросе"""
+
+    def setUp(self):
+        self.phones = Category.objects.create(name='Смартфоны', slug='phones')
+        self.cases = Category.objects.create(name='Чехлы', slug='cases')
+
+    def search(self, **params):
+        return [row['slug'] for row in self.client.get('/api/store/products/', params).data['results']]
+
+    def test_name_matches_rank_first(self):
+        Product.objects.create(category=self.cases, name='Чехол', slug='case', price=10,
+                               description='Подходит для смартфонов')
+        Product.objects.create(category=self.phones, name='Смартфон Apple', slug='apple', price=100)
+        self.assertEqual(self.search(search='смартфоны'), ['apple', 'case'])
+        # Явная сортировка важнее релевантности
+        self.assertEqual(self.search(search='смартфоны', ordering='price'), ['case', 'apple'])
+        self.assertEqual(self.search(search='планшет'), [])
+        # Фасеты считаются по той же выборке с поиском
+        response = self.client.get('/api/store/products/', {'search': 'смартфоны', 'facets': '1'})
+        self.assertEqual((response.status_code, response.data['count']), (200, 2))
+
+    def test_filters_apply_to_all_matches(self):
+        # Товары, созданные bulk_create, в индекс попадают только после переиндексации
+        Product.objects.bulk_create([
+            Product(category=self.phones, name=f'Смартфон {n}', slug=f'phone-{n}', price=100) for n in range(1100)
+        ])
+        Product.objects.bulk_create([
+            Product(category=self.cases, name='Чехол', slug='case', price=10, description='для смартфона'),
+        ])
+        self.assertEqual(self.search(search='смартфон', category='cases'), [])
+
+        call_command('reindex_products', batch_size=500, stdout=StringIO())
+        # Совпадение по описанию - последнее по релевантности, но фильтр по категории его находит
+        self.assertEqual(self.search(search='смартфон', category='cases'), ['case'])
+        response = self.client.get('/api/store/products/', {'search': 'смартфон'})
+        self.assertEqual(response.data['count'], 1101)
+        self.assertEqual(response.data['results'][0]['slug'], 'phone-0')
+
+
+# Поток перестройки не видит данных незакоммиченной транзакции теста - вместо него
+# тест сам вызывает rebuild с переданной версией
+@mock.patch('store.suggest.rebuild_in_background')
+class SuggestTest(TestCase):
+    """Подсказки: обновление сигналами и фоновая перестройка по версии подсказок"""
+
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Смартфоны', slug='phones')
+        self.product = Product.objects.create(category=category, name='Смартфон Apple iPhone', slug='iphone', price=100)
+        suggest.rebuild(get_suggest_version())
+
+    def slugs(self, query):
+        response = self.client.get('/api/store/suggest/', {'q': query})
+        return [row['slug'] for row in response.data['results']]
+
+    @mock.patch('store.suggest.REBUILD_INTERVAL', 0)
+    def test_rebuilt_when_suggest_version_changes(self, rebuild_in_background):
+        self.assertEqual(self.slugs('apple'), ['iphone'])
+        self.assertEqual(self.slugs('смарт'), ['iphone', 'phones'])
+
+        # Сохранение через модель - сигнал обновляет индекс сразу, без перестройки
+        self.product.is_active = False
+        self.product.save()
+        self.assertEqual(self.slugs('apple'), [])
+
+        # Заказы меняют версию каталога, но не подсказок
+        Product.objects.filter(pk=self.product.pk).update(name='Смартфон Samsung Galaxy', is_active=True)
+        bump_catalog_version()
+        self.assertEqual(self.slugs('samsung'), [])
+        rebuild_in_background.assert_not_called()
+
+        # Правка в другом процессе: запрос отвечает по старому индексу и запускает перестройку
+        version = bump_suggest_version()
+        self.assertEqual(self.slugs('samsung'), [])
+        rebuild_in_background.assert_called_once_with(version)
+        suggest.rebuild(version)
+        self.assertEqual(self.slugs('samsung'), ['iphone'])
+        self.assertEqual(self.slugs('apple'), [])
+
+    def test_rebuilds_are_throttled(self, rebuild_in_background):
+        Product.objects.filter(pk=self.product.pk).update(name='Смартфон Samsung Galaxy')
+        bump_suggest_version()
+        self.assertEqual(self.slugs('samsung'), [])
+        rebuild_in_background.assert_not_called()
+
+
+class ImportProductsTest(TestCase):
+    """Импорт фида: upsert по slug пачками, индексы строятся без сигналов"""
+
+    def setUp(self):
+        Category.objects.create(name='Смартфоны', slug='phones')
+        Brand.objects.create(name='Xiaomi', slug='xiaomi')
+        Product.objects.create(category=Category.objects.get(), name='Старое', slug='phone-1', price=1, stock=1)
+
+    def run_import(self, rows, **options):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8') as feed:
+            for row in rows:
+                feed.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self.addCleanup(os.remove, feed.name)
+        call_command('import_products', feed.name, stdout=StringIO(), stderr=StringIO(), **options)
+
+    def test_upsert_by_slug(self):
+        self.run_import([
+            {'slug': f'phone-{n}', 'name': f'Смартфон {n}', 'category': 'phones', 'brand': 'xiaomi',
+             'price': '100.50', 'stock': n, 'specifications': {'Память': '128 ГБ'}}
+            for n in range(1, 6)
+        ] + [{'slug': 'bad', 'name': 'Без категории', 'category': 'nope', 'price': 1}], batch_size=2)
+
+        self.assertEqual(Product.objects.count(), 5)
+        product = Product.objects.get(slug='phone-1')
+        self.assertEqual((product.name, product.stock, str(product.price)), ('Смартфон 1', 1, '100.50'))
+        self.assertEqual(ProductAttribute.objects.filter(key='память', value_num=128).count(), 5)
+
+        # Частичное обновление: остальные поля не трогаются
+        self.run_import([{'slug': 'phone-2', 'stock': 50}])
+        product = Product.objects.get(slug='phone-2')
+        self.assertEqual((product.name, product.stock), ('Смартфон 2', 50))
+
+
+class ProductExportTest(TestCase):
+    """Потоковая выгрузка: все активные товары пачками, gzip, инкрементальный режим"""
+
+    def setUp(self):
+        category = Category.objects.create(name='Смартфоны', slug='phones')
+        for n in range(5):
+            Product.objects.create(category=category, name=f'Смартфон {n}', slug=f'phone-{n}', price=100, stock=n)
+        Product.objects.filter(slug='phone-4').update(is_active=False)
+        self.client.defaults['HTTP_X_EXPORT_TOKEN'] = 'partner-token'
+        override = override_settings(STORE_EXPORT_TOKENS=['partner-token'])
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def read(self, response):
+        body = b''.join(response.streaming_content)
+        if response.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return body.decode()
+
+    def test_full_export_streams_active_products(self):
+        response = self.client.get('/api/store/export/products.jsonl', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([row['slug'] for row in rows], [f'phone-{n}' for n in range(4)])
+        self.assertEqual(rows[0]['category'], 'phones')
+        # Мелкие пачки дают ту же последовательность
+        self.assertEqual([row['slug'] for row in iter_products(chunk_size=3)], [row['slug'] for row in rows])
+
+        lines = self.read(self.client.get('/api/store/export/products.csv')).splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[0].startswith('id,slug,name'))
+
+    def test_incremental_export_tombstones_deactivated(self):
+        since = Product.objects.order_by('updated_at').values_list('updated_at', flat=True)[2]
+        response = self.client.get('/api/store/export/products.jsonl', {'since': since.isoformat()})
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual(rows[0]['slug'], 'phone-3')
+        # Снятый с продажи - только id, без цены, остатка и описания
+        hidden = Product.objects.get(slug='phone-4')
+        self.assertEqual(rows[1], {'id': hidden.pk, 'is_active': False, 'updated_at': rows[1]['updated_at']})
+
+    def test_order_moves_product_into_incremental_export(self):
+        since = Product.objects.order_by('-updated_at').values_list('updated_at', flat=True)[0]
+        product = Product.objects.get(slug='phone-3')
+        self.assertTrue(decrement_stock({product.pk: 2}))
+        self.assertEqual([(row['slug'], row['stock']) for row in iter_products(since)], [('phone-3', product.stock - 2)])
+
+    def test_export_requires_token_or_staff(self):
+        self.client.defaults.pop('HTTP_X_EXPORT_TOKEN')
+        self.assertIn(self.client.get('/api/store/export/products.csv').status_code, (401, 403))
+        response = self.client.get('/api/store/export/products.csv', HTTP_X_EXPORT_TOKEN='wrong')
+        self.assertIn(response.status_code, (401, 403))
+
+
+class ImageVariantsTest(TestCase):
+    """Списки отдают уменьшенную WebP-копию, как только она посчитана"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 1000), 'red').save(buffer, 'JPEG')
+        category = Category.objects.create(name='Смартфоны', slug='phones')
+        self.product = Product.objects.create(category=category, name='Смартфон', slug='phone', price=100)
+        self.image = ProductImage.objects.create(
+            product=self.product, image=SimpleUploadedFile('phone.jpg', buffer.getvalue(), 'image/jpeg')
+        )
+
+    def test_variants_are_rendered_outside_request(self):
+        response = self.client.get('/api/store/products/')
+        self.assertTrue(response.data['results'][0]['main_image'].endswith('.jpg'))
+
+        self.assertEqual(process_pending(workers=0), (1, 0))
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.variants_status, 'ready')
+        with Image.open(self.image.medium.path) as medium:
+            self.assertEqual((medium.format, medium.size), ('WEBP', (600, 300)))
+
+        response = self.client.get('/api/store/products/')
+        self.assertTrue(response.data['results'][0]['main_image'].endswith('.webp'))
+        self.assertEqual(process_pending(workers=0), (0, 0))
+
+    def test_replaced_image_is_rendered_again(self):
+        self.assertEqual(process_pending(workers=0), (1, 0))
+        self.image.refresh_from_db()
+        old_medium = self.image.medium.name
+
+        buffer = BytesIO()
+        Image.new('RGB', (800, 1600), 'blue').save(buffer, 'JPEG')
+        self.image.image = SimpleUploadedFile('phone-back.jpg', buffer.getvalue(), 'image/jpeg')
+        self.image.save()
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.variants_status, 'pending')
+        self.assertFalse(self.image.medium)
+        # Пока новые варианты не готовы, отдается новый оригинал, а не старое фото
+        self.assertEqual(self.image.get_variant('medium'), self.image.image)
+
+        self.assertEqual(process_pending(workers=0), (1, 0))
+        self.image.refresh_from_db()
+        self.assertNotEqual(self.image.medium.name, old_medium)
+        with Image.open(self.image.medium.path) as medium:
+            self.assertEqual(medium.size, (300, 600))
+
+        # Сохранение без смены оригинала варианты не сбрасывает
+        self.image.is_main = True
+        self.image.save()
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.variants_status, 'ready')
+
+    def test_live_claims_are_not_reset(self):
+        claimed = claim_batch(10)
+        self.assertEqual(claimed, [self.image])
+        # Строку держит живой воркер: второй ее не берет, старт команды не возвращает в очередь
+        self.assertEqual(claim_batch(10), [])
+        self.assertEqual(reset_stale(), 0)
+
+        # Воркер пропал дольше таймаута - строка снова в очереди, опоздавший результат не пишется
+        ProductImage.objects.update(variants_claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(reset_stale(), 1)
+        self.assertEqual(process_batch(claimed), (0, 0))
+        self.image.refresh_from_db()
+        self.assertEqual(self.image.variants_status, 'pending')
+        self.assertEqual(process_pending(workers=0), (1, 0))
+
+
+class ContentAddressedStorageTest(TestCase):
+    """Одинаковые загрузки - один файл, файлы без ссылок убирает сборщик мусора"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        buffer = BytesIO()
+        Image.new('RGB', (10, 10), 'blue').save(buffer, 'PNG')
+        self.data = buffer.getvalue()
+        category = Category.objects.create(name='Смартфоны', slug='phones')
+        self.product = Product.objects.create(category=category, name='Смартфон', slug='phone', price=100)
+
+    def upload(self, name):
+        return SimpleUploadedFile(name, self.data, 'image/png')
+
+    def test_duplicates_share_one_blob(self):
+        first = ProductImage.objects.create(product=self.product, image=self.upload('a.png'))
+        second = ProductImage.objects.create(product=self.product, image=self.upload('b.PNG'))
+        user = get_user_model().objects.create_user(
+            username='buyer', email='buyer@example.com', password='secret-pass-123'
+        )
+        user.avatar.save('avatar.png', self.upload('avatar.png'))
+
+        self.assertTrue(first.image.name.startswith(PREFIX))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(user.avatar.name, first.image.name)
+        blobs = [files for _, _, files in os.walk(os.path.join(self.media_root, 'cas')) if files]
+        self.assertEqual(blobs, [[os.path.basename(first.image.name)]])
+
+        request = RequestFactory().get(first.image.url)
+        response = serve_media(request, first.image.name, document_root=self.media_root)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_gc_removes_only_unreferenced(self):
+        image = ProductImage.objects.create(product=self.product, image=self.upload('a.png'))
+        self.assertEqual(collect_garbage(grace=0), (0, 0))
+        self.assertTrue(os.path.exists(image.image.path))
+
+        path = image.image.path
+        image.delete()
+        # Свежий блоб защищен grace-периодом
+        self.assertEqual(collect_garbage()[0], 0)
+        self.assertEqual(collect_garbage(grace=0)[0], 1)
+        self.assertFalse(os.path.exists(path))
+
+
+class PopularityTest(TestCase):
+    """Популярность: продажи, избранное и просмотры, сортировка и бестселлеры"""
+
+    def setUp(self):
+        cache.clear()
+        reconcile_counters()
+        parent = Category.objects.create(name='Электроника', slug='electronics')
+        child = Category.objects.create(name='Смартфоны', slug='phones', parent=parent)
+        self.sold = Product.objects.create(category=child, name='Продаваемый', slug='sold', price=100)
+        self.wished = Product.objects.create(category=parent, name='Желанный', slug='wished', price=100)
+        self.viewed = Product.objects.create(category=parent, name='Просматриваемый', slug='viewed', price=100)
+
+        user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='pass')
+        order = Order.objects.create(
+            user=user, first_name='Иван', last_name='Иванов', phone='+79990000000', delivery_address='Москва',
+        )
+        OrderItem.objects.create(order=order, product=self.sold, product_name='Продаваемый', price=100, quantity=3)
+        Wishlist.objects.create(user=user, product=self.wished)
+
+    def test_ordering_and_bestsellers(self):
+        for _ in range(5):
+            self.client.get(f'/api/store/products/{self.viewed.slug}/')
+        self.assertEqual(recalculate(chunk_size=1), 3)
+
+        response = self.client.get('/api/store/products/', {'ordering': '-popularity'})
+        self.assertEqual([row['slug'] for row in response.data['results']], ['sold', 'wished', 'viewed'])
+
+        # Подкатегории входят в бестселлеры родителя
+        response = self.client.get('/api/store/categories/electronics/bestsellers/', {'limit': 2})
+        self.assertEqual([row['slug'] for row in response.data], ['sold', 'wished'])
+
+        # Просмотры перенесены из кэша в БД, повторный пересчет их не удваивает
+        self.viewed.refresh_from_db()
+        self.assertEqual(self.viewed.popularity_views, 5)
+        recalculate()
+        self.viewed.refresh_from_db()
+        self.assertLessEqual(self.viewed.popularity_views, 5)
+
+        # Отметка прошлого пересчета в БД: потеря кэша не сбрасывает затухание
+        cache.clear()
+        recalculate(now=timezone.now() + timedelta(days=POPULARITY['half_life_days']))
+        self.viewed.refresh_from_db()
+        self.assertAlmostEqual(self.viewed.popularity_views, 2.5, places=2)
+
+
+class RelatedProductsTest(TestCase):
+    """Часто покупают вместе: полный пересчет, новые заказы и эндпоинт"""
+
+    def setUp(self):
+        cache.clear()
+        reconcile_counters()
+        category = Category.objects.create(name='Смартфоны', slug='phones')
+        self.phone, self.case, self.charger, self.cable = [
+            Product.objects.create(category=category, name=slug, slug=slug, price=10)
+            for slug in ('phone', 'case', 'charger', 'cable')
+        ]
+        self.user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='pass')
+
+    def order(self, *products, status='new'):
+        order = Order.objects.create(
+            user=self.user, first_name='Иван', last_name='Иванов', phone='+79990000000', delivery_address='Москва',
+            status=status,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, product_name=product.name, price=10) for product in products
+        ])
+        return order
+
+    def related(self, product):
+        return [row['slug'] for row in self.client.get(f'/api/store/products/{product.slug}/related/').data]
+
+    def test_build_and_incremental_update(self):
+        self.order(self.phone, self.case)
+        self.order(self.phone, self.case)
+        self.order(self.phone, self.case, self.charger)
+        self.order(self.phone, self.charger)
+        self.order(self.phone, self.cable)
+        self.assertEqual(build(chunk_size=2), (5, 3))
+
+        # Пара с кабелем встретилась один раз - ниже порога
+        self.assertEqual(self.related(self.phone), ['case', 'charger'])
+        self.assertEqual(self.related(self.cable), [])
+
+        self.order(self.phone, self.cable)
+        self.assertEqual(update(), (1, 2))
+        with self.assertNumQueries(2):
+            self.assertEqual(self.related(self.cable), ['phone'])
+
+        # У товаров из новых заказов топ такой же, как после полного пересчета
+        touched = RelatedProduct.objects.filter(product__in=[self.phone, self.cable])
+        incremental = sorted(touched.values_list('product_id', 'related_id', 'rank', 'score'))
+        build()
+        self.assertEqual(sorted(touched.values_list('product_id', 'related_id', 'rank', 'score')), incremental)
+
+    def test_update_follows_late_and_status_changes(self):
+        self.order(self.phone, self.case)
+        late = self.order(self.phone, self.case)
+        restored = self.order(self.phone, self.case, status='canceled')
+        build()
+        self.assertEqual(self.related(self.phone), ['case'])
+
+        # Заказ закоммитился позже прохода, но раньше соседа по id: берется по запасу OVERLAP
+        RelatedProductsOrder.objects.filter(order_id=late.pk).delete()
+        ProductPair.objects.filter(product=self.phone, other=self.case).update(count=1)
+        ProductPair.objects.filter(product=self.case, other=self.phone).update(count=1)
+        restored.status = 'new'
+        restored.save()
+        self.assertEqual(update(), (2, 2))
+        self.assertEqual(ProductPair.objects.get(product=self.phone, other=self.case).count, 3)
+        # Повторный запуск ничего не учитывает дважды
+        self.assertEqual(update(), (0, 0))
+
+        # Отмена вычитает пары заказа
+        for order in (late, restored):
+            order.status = 'canceled'
+            order.save()
+        self.assertEqual(update(), (2, 2))
+        self.assertEqual(self.related(self.phone), [])
+
+    def test_unknown_or_hidden_product_is_404(self):
+        self.assertEqual(self.client.get('/api/store/products/missing/related/').status_code, 404)
+        Product.objects.filter(pk=self.phone.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/api/store/products/phone/related/').status_code, 404)
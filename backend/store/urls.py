@@ -1,6 +1,6 @@
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
-from .views import CategoryViewSet, BrandViewSet, ProductViewSet
+from .views import CategoryViewSet, BrandViewSet, ProductViewSet, SuggestView, ProductExportView
 
 app_name = 'store'
 
@@ -10,5 +10,7 @@ router.register(r'brands', BrandViewSet)
 router.register(r'products', ProductViewSet)
 
 urlpatterns = [
+    path('suggest/', SuggestView.as_view(), name='suggest'),
+    re_path(r'^export/products\.(?P<feed_format>jsonl|csv)$', ProductExportView.as_view(), name='product-export'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
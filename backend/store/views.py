@@ -1,39 +1,270 @@
+import hashlib
+
 from rest_framework import viewsets, filters
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.parsers import MultiPartParser, FormParser
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import *
-from cart.models import *
 from .serializers import (
     CategorySerializer, BrandSerializer, 
     ProductListSerializer, ProductDetailSerializer
 )
-from .permissions import IsAdminOrReadOnly
-from .filters import ProductFilter
-from django.db.models import Exists, OuterRef, Value, BooleanField
-class CategoryViewSet(viewsets.ModelViewSet):
+from .permissions import IsAdminOrReadOnly, HasExportToken
+from .filters import ProductFilter, ProductSearchFilter
+from .suggest import suggest
+from .pagination import KeysetPagination
+from .cache import CatalogCacheMixin, ConditionalGetMixin, get_catalog_version, get_catalog_last_modified, normalize_query_params
+from cart.utils import get_user_product_flags
+from cart.reservations import get_available_stock
+from .export import export_stream
+from .popularity import record_view
+from django.db.models import Count, Max
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+class CategoryViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAdminOrReadOnly]
     lookup_field = 'slug' 
+    catalog_cached_actions = ('list', 'retrieve', 'tree', 'bestsellers')
+    # Сколько товаров отдавать в бестселлерах по умолчанию и максимум
+    bestsellers_limit = 12
+    bestsellers_max_limit = 50
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ('list', 'tree'):
+            # Все дерево одним запросом, дети собираются в памяти
+            context['children_map'] = Category.objects.children_map()
+        return context
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, self.get_subtree_response)
+
+    def get_subtree_response(self):
+        instance = self.get_object()
+        context = super().get_serializer_context()
+        context['children_map'] = Category.objects.subtree(instance).children_map()
+        # get_serializer() всегда вычисляет контекст заново, поэтому напрямую
+        serializer = self.get_serializer_class()(instance, context=context)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """
+        Полное дерево категорий для меню (GET /api/store/categories/tree/).
+        Без пагинации: корни с вложенными children.
+        """
+        return self.cached_response(request, self.get_tree_response)
 
-class BrandViewSet(viewsets.ModelViewSet):
+    def get_tree_response(self):
+        context = self.get_serializer_context()
+        roots = context['children_map'].get(None, [])
+        serializer = self.get_serializer_class()(roots, many=True, context=context)
+        return Response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def bestsellers(self, request, slug=None):
+        """
+        Самые популярные активные товары категории и ее подкатегорий
+        (GET /api/store/categories/{slug}/bestsellers/?limit=12).
+        Один запрос по индексу (category, -popularity), без пагинации.
+        """
+        return self.cached_response(request, self.get_bestsellers_response)
+
+    def get_bestsellers_response(self):
+        try:
+            limit = min(int(self.request.query_params.get('limit', self.bestsellers_limit)), self.bestsellers_max_limit)
+        except ValueError:
+            raise ValidationError({'limit': "Должно быть целым числом."})
+        category = self.get_object()
+        products = (
+            Product.objects.filter(
+                is_active=True, category__in=Category.objects.subtree(category).values('pk'),
+            )
+            .select_related('category', 'brand', 'main_image')
+            .order_by('-popularity', 'id')[:max(limit, 1)]
+        )
+        serializer = ProductListSerializer(products, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+class BrandViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
     permission_classes = [IsAdminOrReadOnly]
     lookup_field = 'slug'
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all().select_related('category', 'brand').prefetch_related('images')
+class ProductViewSet(ConditionalGetMixin, CatalogCacheMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.all().select_related('category', 'brand', 'main_image')
     permission_classes = [IsAdminOrReadOnly]
     lookup_field = 'slug'
     
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, filters.OrderingFilter]
     filterset_class = ProductFilter
     search_fields = ['name', 'description']
-    ordering_fields = ['price', 'created_at'] 
+    ordering_fields = ['price', 'created_at', 'popularity']
+    catalog_cached_actions = ('list', 'retrieve', 'related')
+    # Сколько рекомендаций "часто покупают вместе" отдавать
+    related_limit = 10
     
     parser_classes = (MultiPartParser, FormParser)
 
+    @property
+    def paginator(self):
+        # Keyset-пагинация включается по запросу клиента (?pagination=cursor),
+        # по умолчанию остается обычная постраничная из настроек
+        if (
+            not hasattr(self, '_paginator')
+            and self.request is not None
+            and KeysetPagination.is_requested(self.request)
+        ):
+            self._paginator = KeysetPagination()
+        return super().paginator
+
+    # Сколько значений одной характеристики отдавать в фасетах
+    facet_values_limit = 50
+    # ?facets=0 / false - выключено, как и отсутствие параметра
+    facets_true_values = {'1', 'true', 'yes', 'on'}
+
+    def list(self, request, *args, **kwargs):
+        version = get_catalog_version()
+        if version is not None:
+            etag_parts = ['list', version, normalize_query_params(request.query_params)]
+            last_modified = get_catalog_last_modified()
+        else:
+            # Кэш недоступен - валидаторы из БД одним агрегатом по выборке
+            stats = self.filter_queryset(self.get_queryset()).order_by().aggregate(
+                last_modified=Max('updated_at'), total=Count('pk')
+            )
+            etag_parts = ['list', stats['last_modified'], stats['total'], normalize_query_params(request.query_params)]
+            last_modified = int(stats['last_modified'].timestamp()) if stats['last_modified'] else None
+
+        etag_parts += self.get_user_etag_parts()
+        return self.conditional_response(
+            request, etag_parts, last_modified,
+            lambda: self.cached_response(request, self.get_list_response),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        # Дешевый запрос без join-ов: есть ли товар и когда он менялся
+        products = Product.objects.filter(slug=kwargs[self.lookup_field])
+        if not request.user.is_staff:
+            products = products.filter(is_active=True)
+        row = products.values_list('pk', 'updated_at').first()
+        if row is None:
+            raise Http404
+        pk, updated_at = row
+        # Для рейтинга популярности: счетчик в кэше, в БД его переносит пересчет
+        record_view(pk)
+
+        # Версия каталога учитывает и изменения категории/бренда во вложенных полях
+        etag_parts = ['detail', pk, updated_at, get_catalog_version()]
+        etag_parts += self.get_user_etag_parts(pk)
+        return self.conditional_response(
+            request, etag_parts, int(updated_at.timestamp()),
+            # CatalogCacheMixin.retrieve - тело ответа берется из кэша, если есть
+            lambda: super(ProductViewSet, self).retrieve(request, *args, **kwargs),
+        )
+
+    @action(detail=True, methods=['get'])
+    def related(self, request, slug=None):
+        """
+        "Часто покупают вместе" (GET /api/store/products/{slug}/related/).
+        Готовый топ из RelatedProduct (store/related.py), без пагинации.
+        """
+        return self.cached_response(request, self.get_related_response)
+
+    def get_related_response(self):
+        # Неизвестный или снятый с продажи товар - 404, а не пустой список (и не в кэш)
+        product_id = (
+            Product.objects.filter(slug=self.kwargs[self.lookup_field], is_active=True)
+            .values_list('pk', flat=True).first()
+        )
+        if product_id is None:
+            raise Http404
+        # RelatedProduct по индексу (product, rank) вместе с товарами
+        rows = (
+            RelatedProduct.objects
+            .filter(product_id=product_id, related__is_active=True)
+            .select_related('related__category', 'related__brand', 'related__main_image')
+            .order_by('rank')[:self.related_limit]
+        )
+        products = [row.related for row in rows]
+        serializer = ProductListSerializer(products, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    # Сколько товаров можно спросить за раз в availability
+    availability_max_ids = 100
+
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """
+        Свободные остатки (stock минус брони корзин):
+        GET /api/store/products/availability/?ids=1,2,3 -> {"1": 5, "2": 0}.
+        Брони меняются каждую минуту, поэтому ответ не кэшируется и без ETag,
+        а в карточке и списках available нет.
+        """
+        try:
+            ids = {int(pk) for pk in request.query_params.get('ids', '').split(',') if pk.strip()}
+        except ValueError:
+            raise ValidationError({'ids': "Список id через запятую."})
+        if len(ids) > self.availability_max_ids:
+            raise ValidationError({'ids': f"Не больше {self.availability_max_ids} товаров."})
+        products = Product.objects.filter(pk__in=ids, is_active=True).only('pk', 'stock')
+        available = get_available_stock(list(products))
+        response = Response({str(pk): value for pk, value in sorted(available.items())})
+        patch_cache_control(response, no_store=True)
+        return response
+
+    def get_user_etag_parts(self, product_id=None):
+        """Ответ зависит от пользователя: staff видит неактивные, у всех свои флаги"""
+        user = self.request.user
+        if not user.is_authenticated:
+            return ['anon']
+        cart_ids, wishlist_ids = get_user_product_flags(user)
+        if product_id is not None:
+            return [user.pk, user.is_staff, product_id in cart_ids, product_id in wishlist_ids]
+        flags = hashlib.md5(f"{sorted(cart_ids)}|{sorted(wishlist_ids)}".encode()).hexdigest()
+        return [user.pk, user.is_staff, flags]
+
+    def get_list_response(self):
+        request = self.request
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            response = self.get_paginated_response(serializer.data)
+        else:
+            serializer = self.get_serializer(queryset, many=True)
+            response = Response(serializer.data)
+
+        # ?facets=1 - счетчики значений характеристик для текущего набора фильтров
+        if request.query_params.get('facets', '').strip().lower() in self.facets_true_values:
+            response.data = {**response.data, 'facets': self.get_facets(queryset)}
+        return response
+
+    def get_facets(self, queryset):
+        """Фасеты одним GROUP BY запросом по индексу характеристик"""
+        rows = (
+            ProductAttribute.objects
+            .filter(product__in=queryset.values('pk'))
+            .values('key', 'value')
+            .annotate(count=Count('product_id', distinct=True))
+            .order_by('key', '-count', 'value')
+        )
+        facets = {}
+        for row in rows:
+            values = facets.setdefault(row['key'], [])
+            if len(values) < self.facet_values_limit:
+                values.append({'value': row['value'], 'count': row['count']})
+        return facets
+
     def get_serializer_class(self):
         if self.action == 'list':
             return ProductListSerializer
@@ -42,33 +273,67 @@ class ProductViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         qs = super().get_queryset()
 
+        # Галерея нужна только в детальном сериализаторе, списку хватает main_image
+        if self.action != 'list':
+            qs = qs.prefetch_related('images')
+
         if not self.request.user.is_staff:
             qs = qs.filter(is_active=True)
 
-        user = self.request.user
+        # Флаги is_in_cart / is_in_wishlist не аннотируются в запросе:
+        # сериализатор берет их из множеств id пользователя (cart.utils),
+        # поэтому сам запрос каталога одинаков для всех пользователей.
+        return qs
 
-        if user.is_authenticated:
-            cart = Cart.objects.filter(user=user).first()
-
-            qs = qs.annotate(
-                is_in_cart=Exists(
-                    CartItem.objects.filter(
-                        cart=cart,
-                        product=OuterRef('pk')
-                    )
-                ),
-                is_in_wishlist=Exists(
-                    Wishlist.objects.filter(
-                        user=user,
-                        product=OuterRef('pk')
-                    )
-                )
-            )
-        else:
-            qs = qs.annotate(
-                is_in_cart=Value(False, output_field=BooleanField()),
-                is_in_wishlist=Value(False, output_field=BooleanField()),
-            )
 
-        return qs
 
+class SuggestView(APIView):
+    """
+    Подсказки для строки поиска: GET /api/store/suggest/?q=смарт
+    Ищет по началу слов в названиях активных товаров, брендов и категорий.
+    Отвечает из индекса в памяти, без запросов к БД.
+    """
+    permission_classes = [AllowAny]
+    # Аутентификация не нужна, а JWT полез бы в БД за пользователем
+    authentication_classes = []
+    max_limit = 20
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), self.max_limit)
+        except ValueError:
+            limit = 10
+        return Response({'results': suggest(query, limit)})
+
+
+class ProductExportView(APIView):
+    """
+    Выгрузка каталога для партнеров потоком (store/export.py):
+    GET /api/store/export/products.jsonl
+    GET /api/store/export/products.csv?since=2026-10-01T00:00:00Z
+    Без since - все активные товары, с since - измененные после него;
+    снятые с продажи - только {id, is_active: false, updated_at}.
+    gzip, если клиент его принимает. Доступ - staff (JWT) или партнер
+    с заголовком X-Export-Token (settings.STORE_EXPORT_TOKENS).
+    """
+    permission_classes = [HasExportToken | IsAdminUser]
+    content_types = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv'}
+
+    def get(self, request, feed_format):
+        since = request.query_params.get('since')
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                raise ValidationError({'since': "Ожидается дата и время в ISO 8601."})
+
+        use_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        response = StreamingHttpResponse(
+            export_stream(feed_format, since=since, gzip=use_gzip, build_url=request.build_absolute_uri),
+            content_type=f"{self.content_types[feed_format]}; charset=utf-8",
+        )
+        if use_gzip:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        response['Content-Disposition'] = f'attachment; filename="products.{feed_format}"'
+        return response
@@ -1,6 +1,16 @@
 from django.contrib import admin
-from .models import CustomUser, UserAddress
+from .models import CustomUser, UserAddress, OutgoingEmail
 
 admin.site.register(CustomUser)
 
 admin.site.register(UserAddress)
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    # Тела писем (в них коды подтверждения) в админке не показываем
+    exclude = ('text_body', 'html_body')
+    list_display = ('to', 'subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to',)
+    readonly_fields = ('to', 'subject', 'status', 'attempts', 'next_attempt_at', 'claim',
+                       'last_error', 'created_at', 'sent_at', 'expires_at')
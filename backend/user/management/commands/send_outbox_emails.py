@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.outbox import deliver_pending, MAX_ATTEMPTS
+
+
+class Command(BaseCommand):
+    help = "Отправляет письма из очереди OutgoingEmail (по крону или постоянно с --loop)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Писем на одно SMTP-соединение")
+        parser.add_argument('--workers', type=int, default=4, help="Сколько потоков (соединений) одновременно")
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS, help="После стольких неудач письмо - failed")
+        parser.add_argument('--loop', action='store_true', help="Не выходить, ждать новые письма")
+        parser.add_argument('--interval', type=float, default=2, help="Пауза между проверками очереди в режиме --loop, сек")
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = deliver_pending(
+                batch_size=options['batch_size'],
+                workers=options['workers'],
+                max_attempts=options['max_attempts'],
+            )
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f"Отправлено: {sent}, ошибок: {failed}")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"Готово. Отправлено: {total_sent}, ошибок: {total_failed}"))
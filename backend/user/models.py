@@ -33,4 +33,41 @@ class UserAddress(models.Model):
     is_default = models.BooleanField(default=False, verbose_name="Основной адрес")
 
     def __str__(self):
-        return f"{self.city}, {self.street}, {self.house}"
\ No newline at end of file
+        return f"{self.city}, {self.street}, {self.house}"
+
+
+class OutgoingEmail(models.Model):
+    """
+    Очередь исходящих писем (outbox, см. user/outbox.py).
+    Строка пишется в транзакции вместе с данными, письмо отправляет
+    воркер send_outbox_emails - запрос не ждет SMTP.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает отправки'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Не отправлено'),
+        ('expired', 'Просрочено'),
+    ]
+
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    text_body = models.TextField()
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Когда можно пробовать снова: и пауза между попытками, и аренда строки воркером
+    next_attempt_at = models.DateTimeField(auto_now_add=True)
+    claim = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # После этого момента письмо бессмысленно (код подтверждения истек) - не отправляется
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Исходящее письмо"
+        verbose_name_plural = "Исходящие письма"
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to}"
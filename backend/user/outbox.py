@@ -0,0 +1,158 @@
+"""
+Outbox исходящих писем.
+
+enqueue_email() только пишет строку OutgoingEmail - в той же транзакции,
+что и остальные данные запроса, поэтому письмо уходит, только если
+транзакция закоммичена, а запрос не ждет SMTP.
+
+Отправляет deliver_pending() (команда send_outbox_emails): забирает пачку
+готовых писем, раздает их потокам, каждый поток шлет свою часть через одно
+SMTP-соединение. В БД пишет только основной поток. Неудачные попытки
+повторяются с экспоненциальной паузой, после max_attempts письмо - failed.
+Письмо с expires_at (код подтверждения) после этого момента не отправляется,
+а помечается expired. Тело письма стирается, как только оно больше не нужно
+(sent/failed/expired): коды не лежат в БД и в админке.
+"""
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.conf import settings
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 30  # секунд, дальше 60, 120, ...
+BACKOFF_MAX = 60 * 60
+# На сколько воркер "арендует" взятые письма; упал - их заберет следующий
+CLAIM_LEASE = 60 * 5
+
+
+# Чем заменяется тело письма после отправки
+PURGED_BODY = {'text_body': '', 'html_body': ''}
+
+
+def enqueue_email(to, subject, text_body, html_body='', expires_in=None):
+    """expires_in - через сколько секунд письмо теряет смысл (срок жизни кода)"""
+    expires_at = timezone.now() + timedelta(seconds=expires_in) if expires_in else None
+    return OutgoingEmail.objects.create(
+        to=to, subject=subject, text_body=text_body, html_body=html_body, expires_at=expires_at
+    )
+
+
+def get_backoff(attempts):
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def expire_pending(now=None):
+    """Просроченные неотправленные письма -> expired, без тела. Возвращает количество"""
+    now = now or timezone.now()
+    return OutgoingEmail.objects.filter(status='pending', expires_at__lte=now).update(
+        status='expired', claim='', **PURGED_BODY
+    )
+
+
+def claim_batch(limit):
+    """
+    Забирает до limit готовых к отправке писем. Условный UPDATE с меткой
+    claim: параллельный воркер не возьмет те же строки.
+    """
+    now = timezone.now()
+    expire_pending(now)
+    ids = list(
+        OutgoingEmail.objects.filter(status='pending', next_attempt_at__lte=now)
+        .order_by('next_attempt_at').values_list('pk', flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    claim = uuid.uuid4().hex
+    OutgoingEmail.objects.filter(pk__in=ids, status='pending', next_attempt_at__lte=now).update(
+        claim=claim, next_attempt_at=now + timedelta(seconds=CLAIM_LEASE)
+    )
+    return list(OutgoingEmail.objects.filter(claim=claim, status='pending'))
+
+
+def build_message(email, connection):
+    message = EmailMultiAlternatives(
+        email.subject, email.text_body, settings.DEFAULT_FROM_EMAIL, [email.to], connection=connection
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, "text/html")
+    return message
+
+
+def send_chunk(emails):
+    """
+    Шлет письма через одно соединение (выполняется в потоке, без БД).
+    Возвращает (id отправленных, {id: ошибка}).
+    """
+    sent, errors = [], {}
+    try:
+        connection = get_connection(fail_silently=False)
+        connection.open()
+    except Exception as e:
+        return sent, {email.pk: repr(e) for email in emails}
+    try:
+        for email in emails:
+            try:
+                connection.send_messages([build_message(email, connection)])
+                sent.append(email.pk)
+            except Exception as e:
+                errors[email.pk] = repr(e)
+    finally:
+        try:
+            connection.close()
+        except Exception:
+            logger.warning("Не удалось закрыть SMTP-соединение", exc_info=True)
+    return sent, errors
+
+
+def record_results(emails, sent, errors, max_attempts):
+    now = timezone.now()
+    if sent:
+        OutgoingEmail.objects.filter(pk__in=sent).update(
+            status='sent', sent_at=now, claim='', last_error='', **PURGED_BODY
+        )
+
+    failed = []
+    for email in emails:
+        if email.pk not in errors:
+            continue
+        email.attempts += 1
+        email.last_error = errors[email.pk]
+        email.claim = ''
+        if email.attempts >= max_attempts:
+            email.status = 'failed'
+            email.text_body = email.html_body = ''
+            logger.error("Письмо %s для %s не отправлено: %s", email.pk, email.to, email.last_error)
+        else:
+            email.next_attempt_at = now + timedelta(seconds=get_backoff(email.attempts))
+        failed.append(email)
+    OutgoingEmail.objects.bulk_update(
+        failed, ['attempts', 'last_error', 'claim', 'status', 'next_attempt_at', 'text_body', 'html_body']
+    )
+    return len(sent), len(failed)
+
+
+def deliver_pending(batch_size=50, workers=4, max_attempts=MAX_ATTEMPTS):
+    """
+    Одна пачка: до batch_size писем на поток, workers потоков.
+    Возвращает (отправлено, неудачно); (0, 0) - очередь пуста.
+    """
+    emails = claim_batch(batch_size * workers)
+    if not emails:
+        return 0, 0
+    chunks = [emails[i::workers] for i in range(workers)]
+    chunks = [chunk for chunk in chunks if chunk]
+
+    sent, errors = [], {}
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        for chunk_sent, chunk_errors in executor.map(send_chunk, chunks):
+            sent += chunk_sent
+            errors.update(chunk_errors)
+    return record_results(emails, sent, errors, max_attempts)
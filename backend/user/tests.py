@@ -1,3 +1,64 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import OutgoingEmail
+from .outbox import deliver_pending
+
+
+class FailingEmailBackend(EmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionError("SMTP недоступен")
+
+
+# Тестовый раннер и так подменяет почту на locmem, указываем явно
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class VerificationOutboxTest(TestCase):
+    """Регистрация не ждет SMTP: письмо уходит из очереди воркером"""
+
+    def register(self):
+        return APIClient().post('/api/auth/register/', {
+            'email': 'new@example.com', 'username': 'new', 'password': 'Sup3r-secret!',
+        })
+
+    def test_register_enqueues_and_worker_sends(self):
+        response = self.register()
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.to, email.status), ('new@example.com', 'pending'))
+
+        self.assertEqual(deliver_pending(workers=2), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['new@example.com'])
+        email = OutgoingEmail.objects.get()
+        # Код подтверждения после отправки в БД не хранится
+        self.assertEqual((email.status, email.text_body, email.html_body), ('sent', '', ''))
+        self.assertEqual(deliver_pending(), (0, 0))
+
+    def test_expired_code_is_not_sent(self):
+        self.register()
+        # Код живет 5 минут, письмо после этого никому не нужно
+        OutgoingEmail.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(deliver_pending(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.status, email.text_body), ('expired', ''))
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        self.register()
+        with override_settings(EMAIL_BACKEND='user.tests.FailingEmailBackend'):
+            self.assertEqual(deliver_pending(), (0, 1))
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+
+        # Пауза еще не прошла - письмо не берется
+        self.assertEqual(deliver_pending(), (0, 0))
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(deliver_pending(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
@@ -1,7 +1,5 @@
 
-from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.mail import EmailMultiAlternatives
 from django.utils.html import strip_tags
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import status, generics
@@ -11,19 +9,23 @@ from .serializers import RegisterSerializer, MyTokenObtainPairSerializer, UserPr
 from rest_framework_simplejwt.views import TokenObtainPairView
 import random
 from django.core.cache import cache
-from django.conf import settings
 from rest_framework import status, generics, views
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
-from django.core.mail import EmailMultiAlternatives
 from django.utils.html import strip_tags
 from django.db import transaction
 import random
 from rest_framework.generics import RetrieveUpdateAPIView
 from rest_framework.permissions import IsAuthenticated
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from cart.storage import merge_anonymous_cart
+from .outbox import enqueue_email
 
 User = get_user_model()
 
+# Сколько живет код подтверждения; письмо с ним позже не отправляется
+VERIFICATION_CODE_TTL = 60 * 5
+
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = RegisterSerializer
@@ -54,8 +56,10 @@ class RegisterView(generics.CreateAPIView):
                     verification_code = str(random.randint(100000, 999999))
                     
                     cache_key = f"verify_email_{user.email}"
-                    cache.set(cache_key, verification_code, timeout=300)
+                    cache.set(cache_key, verification_code, timeout=VERIFICATION_CODE_TTL)
                     
+                    # Письмо только ставится в очередь (коммитится вместе с юзером),
+                    # отправляет воркер send_outbox_emails
                     self.send_verification_email(user, verification_code)
                     
                 return Response({
@@ -83,11 +87,7 @@ class RegisterView(generics.CreateAPIView):
             </div>
         """
         text_content = strip_tags(html_content)
-        msg = EmailMultiAlternatives(
-            subject, text_content, settings.DEFAULT_FROM_EMAIL, [user.email]
-        )
-        msg.attach_alternative(html_content, "text/html")
-        msg.send(fail_silently=False)
+        enqueue_email(user.email, subject, text_content, html_content, expires_in=VERIFICATION_CODE_TTL)
 
 
 class VerifyEmailView(views.APIView):
@@ -137,6 +137,18 @@ class VerifyEmailView(views.APIView):
 class LoginView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+
+        # Корзина, собранная до входа (X-Cart-Token), переезжает в БД
+        merge_anonymous_cart(request, serializer.user)
+
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
 
 class UserProfileView(RetrieveUpdateAPIView): 
     serializer_class = UserProfileSerializer
@@ -1,6 +1,6 @@
 import AnimatedButton from '@/components/Basic/Button/AnimatedButton';
 import { formatPrice } from '@/tools';
-import { addToCart, getProductBySlug, toggleWishlist } from '@/tools/store';
+import { addToCart, getAvailability, getProductBySlug, toggleWishlist } from '@/tools/store';
 import { IProduct, IProductImage } from '@/types/store';
 import { Ionicons } from '@expo/vector-icons';
 import { Stack, useLocalSearchParams, useRouter } from 'expo-router';
@@ -29,6 +29,8 @@ const ProductDetailScreen = () => {
   const [product, setProduct] = useState<IProduct | null>(null);
   const [loading, setLoading] = useState<boolean>(true);
   const [activeImgIndex, setActiveImgIndex] = useState<number>(0);
+  // Свободный остаток (без броней в чужих корзинах), в самой карточке его нет
+  const [available, setAvailable] = useState<number | null>(null);
 
 
   useEffect(() => {
@@ -42,6 +44,13 @@ const ProductDetailScreen = () => {
     }
   }, [slug]);
 
+  useEffect(() => {
+    if (!product) return;
+    getAvailability([product.id])
+      .then(data => setAvailable(data[String(product.id)] ?? 0))
+      .catch(() => setAvailable(null));
+  }, [product?.id]);
+
   const handleAddToCart = async () => {
     if (product) {
       await addToCart(
@@ -87,6 +96,9 @@ const ProductDetailScreen = () => {
 
   if (!product) return null;
 
+  // Пока остатки не пришли (или запрос упал) - stock из карточки
+  const inStock = available ?? product.stock;
+
   const images: IProductImage[] = 
     product.images && product.images.length > 0 
       ? product.images 
@@ -163,13 +175,13 @@ const ProductDetailScreen = () => {
           <View style={styles.stockContainer}>
             <View style={[
               styles.stockBadge, 
-              product.stock > 0 ? styles.bgGreen : styles.bgRed
+              inStock > 0 ? styles.bgGreen : styles.bgRed
             ]}>
               <Text style={[
                 styles.stockBadgeText, 
-                product.stock > 0 ? styles.textGreen : styles.textRed
+                inStock > 0 ? styles.textGreen : styles.textRed
               ]}>
-                {product.stock > 0 ? `В наличии: ${product.stock} шт.` : 'Нет в наличии'}
+                {inStock > 0 ? `В наличии: ${inStock} шт.` : 'Нет в наличии'}
               </Text>
             </View>
           </View>
@@ -199,9 +211,9 @@ const ProductDetailScreen = () => {
             pressableStyle={{flex: 4}}
             style={[
               styles.buyButton,
-              (product.stock === 0 || product.is_in_cart) && styles.disabledButton,
+              (inStock === 0 || product.is_in_cart) && styles.disabledButton,
             ]}
-            disabled={product.stock === 0 || product.is_in_cart}
+            disabled={inStock === 0 || product.is_in_cart}
             onPress={async () => {
               if (!product.is_in_cart) {
                 await handleAddToCart()
@@ -216,7 +228,7 @@ const ProductDetailScreen = () => {
             />
 
             <Text style={styles.buyButtonText}>
-              {product.stock === 0
+              {inStock === 0
                 ? 'Раскуплено'
                 : product.is_in_cart
                   ? 'В корзине'
@@ -1,5 +1,5 @@
 import { API_URL } from '@/CONSTANTS';
-import { CartResponse, IProduct, ProductResponse } from '@/types/store';
+import { CartResponse, IProduct, ProductAvailability, ProductResponse } from '@/types/store';
 import * as SecureStore from 'expo-secure-store';
 import { Alert } from 'react-native';
 import {
@@ -7,6 +7,7 @@ import {
   Category,
   CreateOrderPayload,
   Order,
+  OrderSummary,
   ProductParams,
   WishlistItem, WishlistToggleResponse
 } from '../types/store';
@@ -66,6 +67,21 @@ export const getCategories = async () => {
 };
 
 
+// Бестселлеры категории (вместе с подкатегориями), без пагинации
+export const getBestsellers = async (categorySlug: string, limit?: number) => {
+  const response = await api.get<IProduct[]>(
+    `api/store/categories/${categorySlug}/bestsellers/`,
+    { params: limit ? { limit } : {} }
+  );
+  return response.data;
+};
+
+// "Часто покупают вместе" для карточки товара
+export const getRelatedProducts = async (productSlug: string) => {
+  const response = await api.get<IProduct[]>(`api/store/products/${productSlug}/related/`);
+  return response.data;
+};
+
 export const getProducts = async (
   params: ProductParams = {},
   url?: string | null
@@ -77,6 +93,16 @@ export const getProducts = async (
   return response.data;
 };
 
+// Свободные остатки (stock минус брони корзин), в карточке и списках их нет.
+// Не кэшируется на сервере - спрашивать при показе и перед добавлением в корзину
+export const getAvailability = async (productIds: number[]) => {
+  const response = await api.get<ProductAvailability>(
+    'api/store/products/availability/',
+    { params: { ids: productIds.join(',') } }
+  );
+  return response.data;
+};
+
 // ================= CART (Корзина) =================
 
 // Получить всю корзину (GET /api/cart/cart/)
@@ -131,6 +157,14 @@ export const removeFromCart = async (itemId: number) => {
   return true;
 };
 
+// Много изменений одним запросом (POST /api/cart/cart-items/bulk/), в ответе вся корзина
+export type CartOperation = { product_id: number; quantity?: number; action?: 'add' | 'set' | 'remove' };
+export const bulkUpdateCart = async (operations: CartOperation[]) => {
+  const headers = await getAuthHeaders();
+  const response = await api.post<Cart>('api/cart/cart-items/bulk/', { operations }, { headers });
+  return response.data;
+};
+
 // ================= WISHLIST (Избранное) =================
 
 export const getWishlist = async () => {
@@ -151,19 +185,42 @@ export const toggleWishlist = async (productId: number) => {
   return response.data; // Вернет { is_in_wishlist: true/false }
 };
 
+// Перенести избранное в корзину (все или только productIds), в ответе вся корзина
+export const moveWishlistToCart = async (productIds?: number[]) => {
+  const headers = await getAuthHeaders();
+  const response = await api.post<Cart>(
+    'api/cart/wishlist/move-to-cart/',
+    productIds ? { product_ids: productIds } : {},
+    { headers }
+  );
+  return response.data;
+};
+
 
-export const getOrders = async () => {
+// История заказов лентой: next - полный URL следующей страницы или null
+export const getOrders = async (next?: string | null) => {
   const headers = await getAuthHeaders();
-  const response = await api.get<{ results: Order[] }>('api/orders/orders/', { headers });
-  return response.data.results;
+  const response = await api.get<{ next: string | null; results: OrderSummary[] }>(
+    next || 'api/orders/orders/',
+    { headers }
+  );
+  return response.data;
 };
 
-export const createOrder = async (orderData: CreateOrderPayload) => {
+export const getOrder = async (id: number) => {
+  const headers = await getAuthHeaders();
+  const response = await api.get<Order>(`api/orders/orders/${id}/`, { headers });
+  return response.data;
+};
+
+// idempotencyKey - один на попытку оформления: при повторе запроса после
+// обрыва сети сервер вернет уже созданный заказ, а не создаст второй
+export const createOrder = async (orderData: CreateOrderPayload, idempotencyKey?: string) => {
   const headers = await getAuthHeaders();
   const response = await api.post<Order>(
     'api/orders/orders/',
     orderData,
-    { headers }
+    { headers: idempotencyKey ? { ...headers, 'Idempotency-Key': idempotencyKey } : headers }
   );
   return response.data;
 };
\ No newline at end of file
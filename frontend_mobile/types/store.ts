@@ -8,6 +8,10 @@ export interface IProductImage {
   id: number | string;
   image: string;
   is_main?: boolean;
+  // WebP-копии 200/600/1200px, null пока сервер их не посчитал
+  thumbnail?: string | null;
+  medium?: string | null;
+  large?: string | null;
 }
 
 export type SpecificationsType = Record<string, string | number>;
@@ -33,6 +37,15 @@ export interface IProduct {
 
 
 
+// Товар в корзине: свободный остаток есть только здесь, каталог (карточка и списки)
+// его не отдает - для них getAvailability (GET /api/store/products/availability/)
+export interface ICartProduct extends IProduct {
+  available: number; // stock минус брони в чужих корзинах
+}
+
+// {id товара: свободный остаток}
+export type ProductAvailability = Record<string, number>;
+
 export interface ProductResponse {
   count: number;
   next: string | null;
@@ -41,7 +54,7 @@ export interface ProductResponse {
 }
 export interface CartItem {
   id: number; 
-  product: IProduct;
+  product: ICartProduct;
   quantity: number;
   subtotal: string;
 }
@@ -105,7 +118,7 @@ export interface ProductDetail extends ProductList {
 
 export interface CartItem {
   id: number;
-  product: IProduct;
+  product: ICartProduct;
   quantity: number;
   subtotal: string;
 }
@@ -149,6 +162,18 @@ export interface Order {
   delivery_address: string;
 }
 
+// Строка истории заказов (список), позиции - только в детальном Order
+export interface OrderSummary {
+  id: number;
+  status: string;
+  is_paid: boolean;
+  total_price: number;
+  created_at: string;
+  delivery_address: string;
+  items_count: number;
+  total_quantity: number;
+}
+
 export interface CreateOrderPayload {
   first_name: string;
   last_name: string;
@@ -163,7 +188,7 @@ export interface ProductParams {
   search?: string;
   category?: string; // slug
   brand?: string; // slug
-  ordering?: string; // 'price' or '-price'
+  ordering?: string; // 'price', '-price', '-created_at' или '-popularity' (сначала популярные)
   min_price?: number;
   max_price?: number;
 }
\ No newline at end of file